@@ -19,8 +19,54 @@ class Config:
         DEBUG (bool): The debug mode of the application. Default is True.
         API_KEY (str): The API key for the Google Maps API.
             Retrieved from the environment variable "MAPS_API_KEY".
+        GOOGLE_MAPS_API_BASE_URL (str): The base URL of the Google Maps web services.
+            Retrieved from the environment variable "MAPS_API_BASE_URL", so a local
+            server can stand in for the Google APIs in tests and benchmarks.
         GEOCODE_API_URL (str): The URL for the geocode API of Google Maps.
         DISTANCE_MATRIX_API_URL (str): The URL for the distance matrix API of Google Maps.
+        HTTP_TIMEOUT (float): Timeout in seconds of each request to the Google APIs.
+        HTTP_MAX_RETRIES (int): Retries of a failed request to the Google APIs.
+        DISTANCE_MATRIX_CACHE_FILE (str): The SQLite file where the distance matrices
+            requested to the Distance Matrix API are cached.
+        DISTANCE_MATRIX_CACHE_MAX_BYTES (int): Maximum size of the distance matrix cache.
+            The least recently used matrices are evicted when it is exceeded.
+        DISTANCE_MATRIX_CONCURRENCY (int): Maximum number of tiles of a distance matrix
+            requested to the Distance Matrix API at once.
+        DISTANCE_MATRIX_REQUESTS_PER_SECOND (float): Maximum requests per second sent
+            to the Distance Matrix API. None to disable the limit.
+        DISTANCE_MATRIX_ELEMENTS_PER_SECOND (float): Maximum elements (origins x destinations)
+            per second sent to the Distance Matrix API. None to disable the limit.
+        SYMMETRIC_TRAVEL_MODES (list): Travel modes whose distances are considered symmetric.
+            Only the upper triangle of their matrices is requested to the Distance Matrix API.
+        MATRIX_STORAGE_FOLDER (str): Folder where the memory-mapped distance matrices are stored.
+        MATRIX_STORAGE_MAX_BYTES (int): Maximum size of the matrix storage folder.
+            The least recently used matrices are deleted when it is exceeded.
+        MEMMAP_MATRIX_MIN_NODES (int): Minimum number of nodes for a distance matrix
+            to be stored in a memory-mapped file instead of in memory.
+        GEOCODE_CACHE_FILE (str): The SQLite file where the geocoded addresses are cached.
+        GEOCODE_CACHE_MAX_BYTES (int): Maximum size of the geocode cache file.
+        GEOCODE_CACHE_MAX_ENTRIES (int): Maximum number of geocoded addresses kept in memory.
+        GEOCODE_CONCURRENCY (int): Maximum number of addresses of a loaded problem
+            geocoded at once.
+        ADDRESS_DEDUP_TOLERANCE (float): Distance in meters below which a registered address
+            is considered a duplicate of an existing one.
+        ADDRESS_INDEX_CELL_SIZE (float): Size in meters of the cells of the spatial index
+            of the registered addresses.
+        SOLUTION_CACHE_FILE (str): The SQLite file where the solutions are cached.
+        SOLUTION_CACHE_MAX_BYTES (int): Maximum size of the solution cache file.
+        SOLUTION_CACHE_ROAD_TTL (float): Seconds the cached solutions of the problems with
+            road travel times (any travel mode but flight) are reused. None to never expire.
+        SOLVE_JOB_WORKERS (int): Number of worker processes solving the background jobs.
+        SOLVE_JOB_HISTORY (int): Number of ended background jobs kept in memory.
+        RESPONSE_GZIP_MIN_BYTES (int): Minimum size of a lean response to be compressed.
+        MATRIX_PAGE_ROWS (int): Maximum number of rows of a page of the distance matrix.
+        MISSION_NPZ_COMPRESSED (bool): Whether the problems and routes saved in the
+            .npz format are compressed (smaller, but slower to save and load).
+        PROFILE_HEADER (str): Header that enables the profiling of a request.
+        PROFILE_QUERY_FLAG (str): Query parameter that enables the profiling of a request.
+        PROFILE_FOLDER (str): Folder where the profiles of the requests are saved.
+        PROFILE_TOP_ALLOCATIONS (int): Number of lines in the allocation summary
+            of a profiled request.
         BABEL_DEFAULT_TIMEZONE (str): The default timezone for babel translations. Default is "en".
         BABEL_TRANSLATION_DIRECTORIES (str):
             The translation directories for babel translations. Default is "app/translations".
@@ -31,10 +77,42 @@ class Config:
     APP_PORT = 5000
     DEBUG = True
     API_KEY = os.getenv("MAPS_API_KEY")
-    GEOCODE_API_URL = "https://maps.googleapis.com/maps/api/geocode/json?"
+    GOOGLE_MAPS_API_BASE_URL = os.getenv(
+        "MAPS_API_BASE_URL", "https://maps.googleapis.com"
+    )
+    GEOCODE_API_URL = GOOGLE_MAPS_API_BASE_URL + "/maps/api/geocode/json?"
     DISTANCE_MATRIX_API_URL = (
-        "https://maps.googleapis.com/maps/api/distancematrix/json?units=imperial"
+        GOOGLE_MAPS_API_BASE_URL + "/maps/api/distancematrix/json?units=imperial"
     )
+    HTTP_TIMEOUT = 10
+    HTTP_MAX_RETRIES = 3
+    DISTANCE_MATRIX_CACHE_FILE = "output/cache/distance_matrices.sqlite"
+    DISTANCE_MATRIX_CACHE_MAX_BYTES = 512 * 1024 * 1024
+    DISTANCE_MATRIX_CONCURRENCY = 8
+    DISTANCE_MATRIX_REQUESTS_PER_SECOND = 50
+    DISTANCE_MATRIX_ELEMENTS_PER_SECOND = 1000
+    SYMMETRIC_TRAVEL_MODES = []
+    MATRIX_STORAGE_FOLDER = "output/matrices"
+    MATRIX_STORAGE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+    MEMMAP_MATRIX_MIN_NODES = 2000
+    GEOCODE_CACHE_FILE = "output/cache/geocode.sqlite"
+    GEOCODE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    GEOCODE_CACHE_MAX_ENTRIES = 4096
+    GEOCODE_CONCURRENCY = 8
+    ADDRESS_DEDUP_TOLERANCE = 1.0
+    ADDRESS_INDEX_CELL_SIZE = 100
+    SOLUTION_CACHE_FILE = "output/cache/solutions.sqlite"
+    SOLUTION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    SOLUTION_CACHE_ROAD_TTL = 3600
+    SOLVE_JOB_WORKERS = 2
+    SOLVE_JOB_HISTORY = 50
+    RESPONSE_GZIP_MIN_BYTES = 1024
+    MATRIX_PAGE_ROWS = 200
+    MISSION_NPZ_COMPRESSED = False
+    PROFILE_HEADER = "X-Profile"
+    PROFILE_QUERY_FLAG = "profile"
+    PROFILE_FOLDER = "output/profiles"
+    PROFILE_TOP_ALLOCATIONS = 25
     BABEL_DEFAULT_TIMEZONE = "en"
     BABEL_TRANSLATION_DIRECTORIES = "app/translations"
     LANGUAGES = {
@@ -18,12 +18,17 @@ Routes:
     - '/change-altitude' (PATCH): Changes the altitude of a specified address.
 
 Functions:
+    - 'update_matrix': Applies an incremental update to the distance matrix.
     - 'update_problem_when_deleted': Updates problem data when a node is deleted.
 """
 
+import logging
 from flask import Blueprint, current_app, request, jsonify
 from flask_babel import gettext
 from utils.problem_definiton import detect_address_format
+from app.routes.routes import get_distance_matrix
+
+logger = logging.getLogger(__name__)
 
 
 # Define a Flask blueprint for handling address-related routes
@@ -64,17 +69,22 @@ def register_address():
         coordinates = [float(i) for i in coordinates]
         if depot != "false":
             current_app.problem_data["addresses"][0] = coordinates
+            current_app.address_index.update(0, coordinates)
+            update_matrix(lambda matrix: matrix.update_node(0, coordinates))
             return jsonify(
                 success=True,
                 message=gettext("Depot registered successfully"),
                 coordinates=coordinates,
                 index=0,
             )
-        if coordinates not in current_app.problem_data["addresses"]:
+        index = current_app.address_index.find(
+            coordinates, current_app.config["ADDRESS_DEDUP_TOLERANCE"]
+        )
+        if index is None:
             current_app.problem_data["addresses"].append(coordinates)
             index = len(current_app.problem_data["addresses"]) - 1
-        else:
-            index = current_app.problem_data["addresses"].index(coordinates)
+            current_app.address_index.insert(index, coordinates)
+            update_matrix(lambda matrix: matrix.add_node(coordinates))
         return jsonify(
             success=True,
             message=gettext("Address registered successfully"),
@@ -83,24 +93,66 @@ def register_address():
         )
 
 
+def update_matrix(operation):
+    """
+    Applies an incremental operation to the distance matrix of the application context.
+
+    If the operation fails (e.g., the Distance Matrix API can not be reached or rejects
+    the request), the full matrix of the current addresses is rebuilt. If that fails too,
+    the incremental matrix is discarded and it is rebuilt on the next route generation.
+
+    Args:
+        operation (callable): Function that receives the IncrementalDistanceMatrix to update.
+
+    Returns:
+        None"""
+    matrix = current_app.incremental_matrix
+    if matrix is None:
+        return
+    try:
+        operation(matrix)
+        return
+    except (OSError, RuntimeError, ValueError) as error:
+        logger.warning("Distance matrix could not be updated, rebuilding it: %s", error)
+    current_app.incremental_matrix = None
+    try:
+        get_distance_matrix(current_app.problem_data["addresses"], matrix.travel_mode)
+    except (OSError, RuntimeError, ValueError) as error:
+        logger.error("Distance matrix could not be rebuilt: %s", error)
+        current_app.incremental_matrix = None
+
+
 def update_problem_when_deleted(index):
     """
     Updates the problem data when a node is deleted.
 
     This function removes the given index from the 'start_nodes' and 'end_nodes' lists,
-    and removes the corresponding address from the 'addresses' dictionary in the \
-    current_app.problem_data.
+    shifts the indexes of the nodes after it, removes the corresponding address from \
+    the 'addresses' dictionary in the current_app.problem_data and from the spatial index, \
+    and drops its row and column from the distance matrix.
 
     Args:
         index (int): The index of the node to be deleted.
 
     Returns:
         None"""
-    if index in current_app.problem_data["start_nodes"]:
-        current_app.problem_data["start_nodes"].remove(index)
-    if index in current_app.problem_data["end_nodes"]:
-        current_app.problem_data["end_nodes"].remove(index)
+    for name in ["start_nodes", "end_nodes"]:
+        if index in current_app.problem_data[name]:
+            current_app.problem_data[name].remove(index)
+        current_app.problem_data[name] = [
+            node - 1 if node > index else node
+            for node in current_app.problem_data[name]
+        ]
     current_app.problem_data["addresses"].pop(index)
+    current_app.address_index.remove(index)
+    update_matrix(lambda matrix: matrix.remove_node(index))
+    if "distance_matrix" in current_app.problem_data:
+        if current_app.incremental_matrix is not None:
+            current_app.problem_data[
+                "distance_matrix"
+            ] = current_app.incremental_matrix.matrix
+        else:
+            current_app.problem_data.pop("distance_matrix")
 
 
 @addresses_blueprint.route("/delete-address", methods=["DELETE"])
@@ -155,6 +207,11 @@ def change_altitude():
             current_app.problem_data["addresses"][index].append(altitude)
         else:
             current_app.problem_data["addresses"][index][2] = altitude
+        update_matrix(
+            lambda matrix: matrix.update_node(
+                index, current_app.problem_data["addresses"][index]
+            )
+        )
         return jsonify(
             success=True,
             message=gettext("Altitude changed successfully"),
@@ -0,0 +1,169 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+This module defines routes for solving the routing problem in background jobs.
+
+It includes the following functionality:
+
+1. Flask Blueprint for managing solve job routes.
+2. Functions for starting a solve job, checking its status, streaming its progress,
+    cancelling it, and applying its routes.
+
+The problems are solved as in '/create-routes' (see solve_problem), and the routes of
+the finished jobs are stored in the solution cache. The routes of a job are kept in the
+job until they are applied to the application with '/solve-jobs/<job_id>/apply'.
+
+Routes:
+    - '/solve-jobs' (POST): Starts a job solving the problem defined by the form data
+        (the same as '/create-routes') and returns its id. If the routes of the problem
+        are in the solution cache, the job is already finished.
+    - '/solve-jobs/<job_id>' (GET): Returns the status and the best routes of a job.
+    - '/solve-jobs/<job_id>/stream' (GET): Streams the improving solutions of a job.
+    - '/solve-jobs/<job_id>' (DELETE): Cancels a job, keeping the best routes found so far.
+    - '/solve-jobs/<job_id>/apply' (POST): Makes the best routes of a job the routes
+        of the application.
+"""
+
+import json
+from flask import Blueprint, current_app, request, jsonify, Response
+from flask_babel import gettext
+from utils.auxiliary import NumpyJSONEncoder
+from app.routes.routes import prepare_problem_data
+
+# Define a Flask blueprint for handling solve job routes
+jobs_blueprint = Blueprint("jobs_blueprint", __name__)
+
+
+@jobs_blueprint.route("/solve-jobs", methods=["POST"])
+def start_job():
+    """
+    Start a job solving the problem defined by the form data.
+    If the routes of the problem are in the solution cache, the job is already finished,
+    and the routes of a job that finishes are stored in the solution cache.
+
+    Returns:
+        dict: A dictionary containing the success status, a message, and the job id."""
+    if request.method == "POST":
+        if not prepare_problem_data(request.form):
+            return jsonify(
+                success=False,
+                message=gettext("Error parsing the values of the problem data"),
+            )
+        # The job is followed by another thread: it keeps its own references
+        problem_data = current_app.problem_data
+        solver_data = current_app.solver_data
+        matrix_provided = current_app.matrix_provided
+        solution_cache = current_app.solution_cache
+        routes = solution_cache.get_routes(problem_data, solver_data, matrix_provided)
+        if routes is not None:
+            job = current_app.solve_jobs.complete(problem_data, routes)
+        else:
+            job = current_app.solve_jobs.submit(
+                problem_data,
+                solver_data,
+                current_app.routes.get("routes"),  # Warm start from the previous routes
+                on_finished=lambda job: solution_cache.put_routes(
+                    problem_data, solver_data, job.routes, matrix_provided
+                ),
+            )
+        return jsonify(
+            success=True, message=gettext("Solve job started"), job_id=job.id
+        )
+
+
+@jobs_blueprint.route("/solve-jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """
+    Return the status of a job.
+
+    Args:
+        job_id (str): Identifier of the job.
+
+    Returns:
+        dict: A dictionary containing the success status, and the status, objective,
+            solutions and best routes of the job."""
+    job = current_app.solve_jobs.get(job_id)
+    if job is None:
+        return jsonify(success=False, message=gettext("Job not found")), 404
+    return jsonify(success=True, **job.snapshot())
+
+
+@jobs_blueprint.route("/solve-jobs/<job_id>/stream")
+def stream_job(job_id):
+    """
+    Stream the progress of a job as server-sent events.
+    An event with the state of the job is sent each time it changes, until it ends.
+
+    Args:
+        job_id (str): Identifier of the job.
+
+    Returns:
+        Response: A response object streaming the state of the job."""
+    job = current_app.solve_jobs.get(job_id)
+    if job is None:
+        return jsonify(success=False, message=gettext("Job not found")), 404
+
+    def stream(job):
+        version = -1
+        while True:
+            new_version = job.wait(version, timeout=15)
+            if new_version == version and not job.done:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            yield f"data: {json.dumps(job.snapshot(), cls=NumpyJSONEncoder)}\n\n"
+            if job.done:
+                break
+
+    return Response(stream(job), mimetype="text/event-stream")
+
+
+@jobs_blueprint.route("/solve-jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    """
+    Cancel a job. The search stops and the best routes found so far are kept.
+
+    Args:
+        job_id (str): Identifier of the job.
+
+    Returns:
+        dict: A dictionary containing the success status, a message, and the status of the job."""
+    if request.method == "DELETE":
+        job = current_app.solve_jobs.cancel(job_id)
+        if job is None:
+            return jsonify(success=False, message=gettext("Job not found")), 404
+        return jsonify(
+            success=True,
+            message=gettext("Cancelling the job..."),
+            status=job.status,
+        )
+
+
+@jobs_blueprint.route("/solve-jobs/<job_id>/apply", methods=["POST"])
+def apply_job(job_id):
+    """
+    Make the best routes of a job the routes of the application, as if they had been
+    created with '/create-routes'. The problem of the application must be the problem
+    of the job.
+
+    Args:
+        job_id (str): Identifier of the job.
+
+    Returns:
+        dict: A dictionary containing the success status and a message."""
+    if request.method == "POST":
+        job = current_app.solve_jobs.get(job_id)
+        if job is None:
+            return jsonify(success=False, message=gettext("Job not found")), 404
+        routes = job.snapshot()["routes"]
+        if routes is None:
+            return jsonify(success=False, message=gettext("The job has no routes yet"))
+        if job.problem_data is not current_app.problem_data:
+            return jsonify(
+                success=False,
+                message=gettext("The problem has changed since the job started"),
+            )
+        current_app.routes = routes
+        return jsonify(success=True, message=gettext("Routes applied"))
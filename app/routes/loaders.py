@@ -9,22 +9,79 @@ It includes the following functionality:
 
 1. Flask Blueprint for managing loading-related routes.
 2. Function for loading problem definition data from a YAML file,
-    converting addresses to coordinates, and storing them in the application context.
+    converting addresses to coordinates in batch, and storing them in the application context.
 
 Routes:
     - '/load-problem' (GET): Loads problem definition data from a YAML file,
         converts addresses to coordinates, and stores them in the application context.
+    - '/load-routes' (GET): Loads a problem and its routes from a .npz file
+        saved by '/save-routes' with format=npz.
 """
 
 from flask import Blueprint, current_app, request, jsonify
 from flask_babel import gettext
-from utils.problem_definiton import detect_address_format
+from utils.problem_definiton import normalize_address
+from utils.spatial_index import GridSpatialIndex
 from utils.load_parameters import load_problem_definiton
+from utils.mission_file import load_mission_npz
 
 # Define a Flask blueprint for handling loading-related routes
 loaders_blueprint = Blueprint("loaders_blueprint", __name__)
 
 
+def convert_addresses(addresses):
+    """
+    Converts the addresses of a problem definition to coordinates in batch.
+
+    The addresses are normalized first, and each distinct name (ignoring case and
+    whitespace) is geocoded only once, with GEOCODE_CONCURRENCY names in parallel.
+    Then, in a single pass, the address at the same location (within
+    ADDRESS_DEDUP_TOLERANCE) of each address is found with a hash map of the exact
+    coordinates and a spatial index of the distinct locations.
+
+    Args:
+        addresses (list): The addresses of the problem, as coordinates or names.
+
+    Returns:
+        tuple: The coordinates of each address (in the same order, so the depots keep
+            their indexes), and the (coordinates, index of the first address at the
+            same location) of each address. (None, None) if an address can not be
+            converted."""
+    normalized = [normalize_address(address) for address in addresses]
+    names = {}
+    for kind, value in normalized:
+        if kind == "name":
+            names.setdefault(value.casefold(), value)
+    locations = dict(
+        zip(
+            names,
+            current_app.converter.addresses2coords(
+                list(names.values()), current_app.config["GEOCODE_CONCURRENCY"]
+            ),
+        )
+    )
+    tolerance = current_app.config["ADDRESS_DEDUP_TOLERANCE"]
+    locations_index = GridSpatialIndex(current_app.config["ADDRESS_INDEX_CELL_SIZE"])
+    exact_locations = {}
+    coordinates_list = []
+    coord_inds = []
+    for i, (kind, value) in enumerate(normalized):
+        coordinates = value if kind == "coordinates" else locations[value.casefold()]
+        if coordinates is None:
+            return None, None
+        key = (coordinates[0], coordinates[1])
+        idx = exact_locations.get(key)
+        if idx is None:
+            idx = locations_index.find(coordinates, tolerance)
+            if idx is None:
+                idx = i
+                locations_index.insert(idx, coordinates)
+            exact_locations[key] = idx
+        coordinates_list.append(coordinates)
+        coord_inds.append((coordinates, idx))
+    return coordinates_list, coord_inds
+
+
 @loaders_blueprint.route("/load-problem", methods=["GET"])
 def load_yaml_problem():
     """
@@ -36,34 +93,56 @@ def load_yaml_problem():
 
     Returns:
         None"""
-    coord_inds = []
     if request.method == "GET":
         current_app.problem_data = load_problem_definiton()
         # Addresses to the proper format
-        for i, address in enumerate(current_app.problem_data["addresses"]):
-            c_format = detect_address_format(address)
-            if c_format == "str-coordinates":
-                coordinates = address.replace(" ", "").split(",")
-            elif c_format == "name":
-                coordinates = current_app.converter.address2coords(address)
-            else:
-                coordinates = address
-            if coordinates is None:
-                return jsonify(
-                    success=False,
-                    message=gettext("Failed to convert address"),
-                    coordinates=None,
-                )
-            coordinates = [float(i) for i in coordinates]
-            if coordinates not in current_app.problem_data["addresses"]:
-                current_app.problem_data["addresses"].append(coordinates)
-                idx = len(current_app.problem_data["addresses"]) - 1
-            else:
-                idx = current_app.problem_data["addresses"].index(coordinates)
-            coord_inds.append((coordinates, idx))
-            current_app.problem_data["coord_inds"] = coord_inds
+        addresses, coord_inds = convert_addresses(
+            current_app.problem_data["addresses"]
+        )
+        if addresses is None:
+            return jsonify(
+                success=False,
+                message=gettext("Failed to convert address"),
+                coordinates=None,
+            )
+        current_app.problem_data["addresses"] = addresses
+        current_app.problem_data["coord_inds"] = coord_inds
+        current_app.address_index.rebuild(addresses)
         return jsonify(
             success=True,
             message=gettext("Data loaded properly"),
             problem_data=current_app.problem_data,
         )
+
+
+@loaders_blueprint.route("/load-routes", methods=["GET"])
+def load_npz_routes(file="output/routes.npz"):
+    """
+    Load a problem, its distance matrix and its routes from a .npz file
+    and store them in the application context.
+
+    Parameters:
+        file (str, optional): The path of the file to load. Default is "output/routes.npz".
+
+    Returns:
+        dict: A dictionary containing the success status, a message, the problem data
+            (without its distance matrix) and the routes."""
+    if request.method == "GET":
+        try:
+            problem_data, routes = load_mission_npz(file)
+        except (OSError, ValueError):
+            return jsonify(success=False, message=gettext("Failed to load the routes"))
+        current_app.problem_data = problem_data
+        current_app.routes = routes or {}
+        current_app.incremental_matrix = None
+        current_app.address_index.rebuild(problem_data["addresses"])
+        return jsonify(
+            success=True,
+            message=gettext("Data loaded properly"),
+            problem_data={
+                key: value
+                for key, value in problem_data.items()
+                if key != "distance_matrix"
+            },
+            routes=current_app.routes,
+        )
@@ -11,21 +11,53 @@ It includes the following functionality:
 2. Function for generating a route based on provided form data 
     and the problem and solver data stored in the application context.
 
+Functions:
+    - 'get_distance_matrix': Gets the distance matrix of the addresses.
+    - 'prepare_problem_data': Prepares the problem to be solved from the form data.
+    - 'lean_routes': Encodes the coordinates of the routes as polylines.
+    - 'compressed_response': Builds a response compressed with gzip.
+
 Routes:
     - '/create-routes' (POST): Generates a route based on the provided form data
         and the problem and solver data stored in the application context.
-        This includes generating a distance matrix if it doesn't exist,
-        finding routes using OR-Tools, and generating a solution.
+        This includes generating a distance matrix if it doesn't exist
+        (or reusing a cached one), finding routes using OR-Tools (optionally with a
+        portfolio of solver configurations in parallel, or by decomposition into
+        clusters for large problems), and generating a solution. The solutions are
+        cached, so identical problems are not solved twice.
+        With response_mode=lean, only the routes (their coordinates encoded as
+        polylines) and the problem without its distance matrix are returned,
+        gzip-compressed if the client accepts it.
+    - '/distance-matrix' (GET): Returns the distance matrix of the current problem,
+        in pages of rows or as a binary NumPy file.
 """
 
-from flask import Blueprint, current_app, request, jsonify
+import io
+import json
+import gzip
+import numpy as np
+from flask import Blueprint, current_app, request, jsonify, Response
 from flask_babel import gettext
 from utils.load_parameters import load_solver_configuration, load_problem_definiton
-from utils.auxiliary import adapt_solution, string2list
-from utils.or_tools_method import find_routes
+from utils.auxiliary import (
+    encode_polyline,
+    measure_execution_time,
+    string2list,
+    NumpyJSONEncoder,
+)
+from utils.solver import solve_problem
 from utils.problem_definiton import (
     generate_distance_matrix,
-    generate_flight_distance_matrix,
+    haversine_distance_matrix,
+    IncrementalDistanceMatrix,
+)
+from utils.sparse_distances import SparseDistanceModel
+from utils.matrix_storage import (
+    memmap_matrix_file,
+    open_memmap_matrix,
+    create_memmap_matrix,
+    store_memmap_matrix,
+    evict_memmap_matrices,
 )
 
 
@@ -33,6 +65,191 @@ from utils.problem_definiton import (
 routes_blueprint = Blueprint("routes_blueprint", __name__)
 
 
+@measure_execution_time
+def get_distance_matrix(addresses, travel_mode):
+    """
+    Get the distance matrix of the addresses for the travel mode.
+
+    The incremental matrix kept in the application context is reused if it
+    is still valid for the addresses. Otherwise, the matrix is computed
+    (or loaded from the distance matrix cache) and the incremental matrix is rebuilt.
+    Matrices of at least MEMMAP_MATRIX_MIN_NODES nodes are stored in memory-mapped
+    files, which are reused by any process solving the same addresses. The least recently
+    used files are deleted when the folder exceeds MATRIX_STORAGE_MAX_BYTES.
+
+    Args:
+        addresses (list): List of addresses of the problem.
+        travel_mode (str): The travel mode of the problem.
+
+    Returns:
+        np.ndarray: The distance matrix in meters."""
+    matrix = current_app.incremental_matrix
+    if matrix is not None and matrix.matches(addresses, travel_mode):
+        return matrix.matrix
+    matrix = IncrementalDistanceMatrix(
+        travel_mode,
+        current_app.config["API_KEY"],
+        current_app.config["GEOCODE_API_URL"],
+        current_app.config["DISTANCE_MATRIX_API_URL"],
+        geocode_cache=current_app.geocode_cache,
+        concurrency=current_app.config["DISTANCE_MATRIX_CONCURRENCY"],
+        rate_limiter=current_app.distance_matrix_rate_limiter,
+        symmetric=travel_mode in current_app.config["SYMMETRIC_TRAVEL_MODES"],
+        http_client=current_app.http_client,
+        storage_folder=current_app.config["MATRIX_STORAGE_FOLDER"],
+        memmap_min_nodes=current_app.config["MEMMAP_MATRIX_MIN_NODES"],
+    )
+    # Big matrices are kept in memory-mapped files shared between processes
+    memmap_file = None
+    distance_matrix = None
+    if len(addresses) >= current_app.config["MEMMAP_MATRIX_MIN_NODES"]:
+        memmap_file = memmap_matrix_file(
+            current_app.config["MATRIX_STORAGE_FOLDER"], addresses, travel_mode
+        )
+        distance_matrix = open_memmap_matrix(memmap_file)
+    if distance_matrix is not None:
+        pass  # Already computed by another request or process
+    elif travel_mode == "flight":
+        if memmap_file is not None:
+            distance_matrix = create_memmap_matrix(
+                memmap_file,
+                len(addresses),
+                lambda out: haversine_distance_matrix(addresses, out=out),
+            )
+        else:
+            distance_matrix = haversine_distance_matrix(addresses)
+    else:
+        # Reuse the matrix if these addresses were already requested
+        distance_matrix = current_app.distance_matrix_cache.get_matrix(
+            addresses, travel_mode
+        )
+        if distance_matrix is None:
+            distance_matrix = generate_distance_matrix(
+                addresses,
+                current_app.config["API_KEY"],
+                current_app.config["GEOCODE_API_URL"],
+                current_app.config["DISTANCE_MATRIX_API_URL"],
+                mode=travel_mode,
+                symmetric=matrix.symmetric,
+                geocode_cache=current_app.geocode_cache,
+                concurrency=current_app.config["DISTANCE_MATRIX_CONCURRENCY"],
+                rate_limiter=current_app.distance_matrix_rate_limiter,
+                http_client=current_app.http_client,
+            )
+            current_app.distance_matrix_cache.put_matrix(
+                addresses, travel_mode, distance_matrix
+            )
+        if memmap_file is not None:
+            distance_matrix = store_memmap_matrix(memmap_file, distance_matrix)
+    if memmap_file is not None:
+        evict_memmap_matrices(
+            current_app.config["MATRIX_STORAGE_FOLDER"],
+            current_app.config["MATRIX_STORAGE_MAX_BYTES"],
+            keep=memmap_file,
+        )
+    matrix.build(addresses, distance_matrix)
+    current_app.incremental_matrix = matrix
+    return matrix.matrix
+
+
+def prepare_problem_data(form):
+    """
+    Prepares the problem to be solved from the form data of a request.
+
+    The problem data stored in the application context is overwritten with the default
+    problem definition and the values of the form, and the distance matrix is created
+    if it doesn't exist. The solver configuration is loaded if it is not loaded yet.
+
+    Args:
+        form (dict): The form data with the number of vehicles, max flight times,
+            velocities, start nodes, end nodes and travel mode.
+
+    Returns:
+        bool: False if the values of the form could not be parsed, True otherwise."""
+    if not current_app.solver_data:
+        current_app.solver_data = load_solver_configuration()
+    default_problem_data = load_problem_definiton()
+    check_list = [
+        "n_vehicles",
+        "max_flight_time",
+        "velocity",
+        "start_nodes",
+        "end_nodes",
+    ]
+    new_problem_data = {}
+    for name in check_list:
+        value = string2list(form[name])
+        if not value:
+            return False
+        new_problem_data[name] = value if name != "n_vehicles" else value[0]
+    new_problem_data["addresses"] = current_app.problem_data["addresses"]
+    new_problem_data["travel_mode"] = form["travel_mode"]
+    # Overwrite default problem data
+    current_app.problem_data = {**default_problem_data, **new_problem_data}
+    # A matrix of the problem definition is not derived from the addresses
+    current_app.matrix_provided = "distance_matrix" in current_app.problem_data
+    # Distance matrix creation
+    if not current_app.matrix_provided:
+        if (
+            current_app.problem_data["travel_mode"] == "flight"
+            and current_app.solver_data.get("sparse_neighbours")
+        ):
+            current_app.problem_data["distance_matrix"] = SparseDistanceModel(
+                current_app.problem_data["addresses"],
+                current_app.solver_data["sparse_neighbours"],
+            )
+        else:
+            current_app.problem_data["distance_matrix"] = get_distance_matrix(
+                current_app.problem_data["addresses"],
+                current_app.problem_data["travel_mode"],
+            )
+    return True
+
+
+def lean_routes(routes):
+    """
+    Returns the routes with the coordinates of each route encoded as a polyline.
+
+    Args:
+        routes (dict): The routes, as returned by adapt_solution.
+
+    Returns:
+        dict: The routes, with a "polyline" instead of the "coordinates" of each route."""
+    lean = {key: value for key, value in routes.items() if key != "routes"}
+    lean["routes"] = {
+        vehicle_id: {
+            **{key: value for key, value in route.items() if key != "coordinates"},
+            "polyline": encode_polyline(route["coordinates"]),
+        }
+        for vehicle_id, route in routes["routes"].items()
+    }
+    return lean
+
+
+def compressed_response(body, mimetype="application/json"):
+    """
+    Returns a response, compressed with gzip if the client accepts it
+    and the body is at least RESPONSE_GZIP_MIN_BYTES long.
+
+    Args:
+        body (str or bytes): The body of the response.
+        mimetype (str, optional): The mimetype of the body (default is "application/json").
+
+    Returns:
+        Response: The response."""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    response = Response(body, mimetype=mimetype)
+    response.vary.add("Accept-Encoding")
+    if (
+        "gzip" in request.accept_encodings
+        and len(body) >= current_app.config["RESPONSE_GZIP_MIN_BYTES"]
+    ):
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
 @routes_blueprint.route("/create-routes", methods=["POST"])
 def generate_route():
     """
@@ -42,59 +259,121 @@ def generate_route():
     finding routes using OR-Tools, and generating a solution.
 
     Returns:
-        JSON object: A JSON object containing the success status,
-            a message, the generated routes, and the problem data.
+        JSON object: A JSON object containing the success status, a message,
+            the generated routes, the problem data, and whether the routes
+            were returned from the solution cache.
     """
     if request.method == "POST":
-        if not current_app.solver_data:
-            current_app.solver_data = load_solver_configuration()
-        default_problem_data = load_problem_definiton()
-        check_list = [
-            "n_vehicles",
-            "max_flight_time",
-            "velocity",
-            "start_nodes",
-            "end_nodes",
-        ]
-        new_problem_data = {}
-        for name in check_list:
-            value = string2list(request.form[name])
-            if not value:
+        if not prepare_problem_data(request.form):
+            return jsonify(
+                success=False,
+                message=gettext("Error parsing the values of the problem data"),
+            )
+        # Solutions of identical problems are returned from the cache
+        routes = current_app.solution_cache.get_routes(
+            current_app.problem_data,
+            current_app.solver_data,
+            current_app.matrix_provided,
+        )
+        from_cache = routes is not None
+        if not from_cache:
+            try:
+                routes = solve_problem(
+                    current_app.problem_data,
+                    current_app.solver_data,
+                    current_app.routes.get("routes"),  # Warm start from the previous routes
+                )
+            except ValueError:
                 return jsonify(
                     success=False,
-                    message=gettext("Error parsing the values of the problem data"),
+                    message=gettext("A time limit is required to solve a portfolio"),
                 )
-            new_problem_data[name] = value if name != "n_vehicles" else value[0]
-        new_problem_data["addresses"] = current_app.problem_data["addresses"]
-        new_problem_data["travel_mode"] = request.form["travel_mode"]
-        # Overwrite default problem data
-        current_app.problem_data = {**default_problem_data, **new_problem_data}
-        # Distance matrix creation
-        if "distance_matrix" not in current_app.problem_data.keys():
-            if current_app.problem_data["travel_mode"] == "flight":
-                current_app.problem_data[
-                    "distance_matrix"
-                ] = generate_flight_distance_matrix(
-                    current_app.problem_data["addresses"]
+            if routes is None:
+                return jsonify(success=False, message=gettext("No solution found"))
+            current_app.solution_cache.put_routes(
+                current_app.problem_data,
+                current_app.solver_data,
+                routes,
+                current_app.matrix_provided,
+            )
+        current_app.routes = routes
+        if request.values.get("response_mode") == "lean":
+            # Only the routes and the problem without the distance matrix
+            return compressed_response(
+                json.dumps(
+                    {
+                        "success": True,
+                        "message": gettext("Routes created successfully"),
+                        "routes": lean_routes(routes),
+                        "problem_data": {
+                            key: value
+                            for key, value in current_app.problem_data.items()
+                            if key != "distance_matrix"
+                        },
+                        "from_cache": from_cache,
+                    },
+                    cls=NumpyJSONEncoder,
+                    separators=(",", ":"),
                 )
-            else:
-                current_app.problem_data["distance_matrix"] = generate_distance_matrix(
-                    current_app.problem_data["addresses"],
-                    current_app.config["API_KEY"],
-                    current_app.config["GEOCODE_API_URL"],
-                    current_app.config["DISTANCE_MATRIX_API_URL"],
-                    mode=current_app.problem_data["travel_mode"],
-                )
-        # Route generation
-        data, manager, routing, solution = find_routes(
-            current_app.problem_data, current_app.solver_data
-        )
-        current_app.routes = adapt_solution(
-            data, manager, routing, solution, current_app.problem_data["addresses"]
-        )
+            )
         return jsonify(
             success=True,
             message=gettext("Routes created successfully"),
             routes=current_app.routes,
             problem_data=current_app.problem_data,
+            from_cache=from_cache,
+        )
+
+
+@routes_blueprint.route("/distance-matrix", methods=["GET"])
+def distance_matrix():
+    """
+    Return the distance matrix of the current problem, which is not sent
+    by '/create-routes' in the lean response mode.
+
+    Query parameters:
+        format (str): "json" (default) for a page of rows, or "npy" for the whole
+            matrix as a binary NumPy file (not available for sparse distance models).
+        offset (int): First row of the page (default is 0).
+        limit (int): Number of rows of the page (default and maximum is MATRIX_PAGE_ROWS).
+
+    Returns:
+        Response: The page of rows (with the number of nodes and the offset of the
+            next page, None in the last one) or the NumPy file."""
+    matrix = current_app.problem_data.get("distance_matrix")
+    if matrix is None:
+        return jsonify(success=False, message=gettext("No distance matrix")), 404
+    if request.args.get("format") == "npy":
+        if isinstance(matrix, SparseDistanceModel):
+            return (
+                jsonify(
+                    success=False,
+                    message=gettext("The sparse distance model has no dense matrix"),
+                ),
+                400,
+            )
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(matrix))
+        return compressed_response(buffer.getvalue(), "application/octet-stream")
+    max_rows = current_app.config["MATRIX_PAGE_ROWS"]
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", max_rows, type=int), 1), max_rows)
+    n_nodes = len(matrix)
+    rows = range(offset, min(offset + limit, n_nodes))
+    if isinstance(matrix, np.ndarray):
+        page = matrix[rows.start : rows.stop].tolist()
+    else:
+        page = [[int(matrix[i][j]) for j in range(n_nodes)] for i in rows]
+    return compressed_response(
+        json.dumps(
+            {
+                "success": True,
+                "n_nodes": n_nodes,
+                "offset": offset,
+                "rows": page,
+                "next_offset": rows.stop if rows.stop < n_nodes else None,
+            },
+            cls=NumpyJSONEncoder,
+            separators=(",", ":"),
         )
+    )
@@ -8,16 +8,19 @@ This module defines routes and functions for handling saving-related operations.
 It includes the following functionality:
 
 1. Flask Blueprint for managing saving-related routes.
-2. Functions for saving nodes and generated routes to YAML files.
+2. Functions for saving nodes and generated routes to YAML files, or to the
+    binary columnar format of utils.mission_file (with format=npz).
 
 Routes:
     - '/save-nodes' (POST): Saves the list of addresses (nodes) to visit to a YAML file.
     - '/save-routes' (POST): Saves the generated routes to a YAML file.
 """
 
+import os
 from flask import Blueprint, current_app, request, jsonify
 from flask_babel import gettext
 from utils.auxiliary import save_yaml, ensure_folder_exist
+from utils.mission_file import save_mission_npz
 
 # Define a Flask blueprint for handling saving-related routes
 save_blueprint = Blueprint("save_blueprint", __name__)
@@ -26,7 +29,8 @@ save_blueprint = Blueprint("save_blueprint", __name__)
 @save_blueprint.route("/save-nodes", methods=["POST"])
 def save_nodes(file="output/nodes2visit.yaml"):
     """
-    Save the list of addresses (nodes) to visit to a YAML file.
+    Save the list of addresses (nodes) to visit to a YAML file,
+    or to a .npz file if the request has format=npz.
 
     Parameters:
         file (str, optional): The path of the file to save to.
@@ -36,6 +40,14 @@ def save_nodes(file="output/nodes2visit.yaml"):
         type: Description of the return param."""
     if request.method == "POST":
         ensure_folder_exist("/".join(file.split("/")[:-1]))
+        if request.values.get("format") == "npz":
+            file = os.path.splitext(file)[0] + ".npz"
+            save_mission_npz(
+                file,
+                {"addresses": current_app.problem_data["addresses"]},
+                compress=current_app.config["MISSION_NPZ_COMPRESSED"],
+            )
+            return jsonify(success=True, message=gettext("Nodes saved"), file=file)
         data = {"addresses": current_app.problem_data["addresses"]}
         save_yaml(file, data)
         return jsonify(success=True, message=gettext("Nodes saved"))
@@ -44,7 +56,9 @@ def save_nodes(file="output/nodes2visit.yaml"):
 @save_blueprint.route("/save-routes", methods=["POST"])
 def save_routes(file="output/routes.yaml"):
     """
-    Save the generated routes to a YAML file.
+    Save the generated routes to a YAML file. If the request has format=npz, the
+    routes are saved with the problem and its distance matrix to a .npz file,
+    which can be loaded with '/load-routes'.
 
     Parameters:
         file (str, optional): The path of the file to save to. Default is "output/routes.yaml".
@@ -53,6 +67,15 @@ def save_routes(file="output/routes.yaml"):
         None"""
     if request.method == "POST":
         ensure_folder_exist("/".join(file.split("/")[:-1]))
+        if request.values.get("format") == "npz":
+            file = os.path.splitext(file)[0] + ".npz"
+            save_mission_npz(
+                file,
+                current_app.problem_data,
+                current_app.routes or None,
+                compress=current_app.config["MISSION_NPZ_COMPRESSED"],
+            )
+            return jsonify(success=True, message=gettext("Routes saved"), file=file)
         data = {"routes": current_app.routes}
         save_yaml(file, data)
         return jsonify(success=True, message=gettext("Routes saved"))
@@ -114,11 +114,38 @@ function deleteAllMarkers () {
   globalElements.markers = []
 }
 
+// Decodes a polyline of the Encoded Polyline Algorithm Format into [lat, lng] pairs
+function decodePolyline (polyline, precision = 5) {
+  const coordinates = []
+  const factor = Math.pow(10, precision)
+  let index = 0
+  let lat = 0
+  let lng = 0
+  const nextValue = () => {
+    let result = 0
+    let shift = 0
+    let byte
+    do {
+      byte = polyline.charCodeAt(index++) - 63
+      result |= (byte & 0x1f) << shift
+      shift += 5
+    } while (byte >= 0x20)
+    return result & 1 ? ~(result >> 1) : result >> 1
+  }
+  while (index < polyline.length) {
+    lat += nextValue()
+    lng += nextValue()
+    coordinates.push([lat / factor, lng / factor])
+  }
+  return coordinates
+}
+
 // Function to draw the routes
 function drawRoutes (routesInfo) {
   const routes = routesInfo.routes
   Object.entries(routes).forEach(([vNumber, vRoute]) => {
-    const coordinates = vRoute.coordinates
+    // Lean responses encode the coordinates as a polyline
+    const coordinates = vRoute.coordinates || decodePolyline(vRoute.polyline)
     const flightPlanCoordinates = []
     for (const coordinate of coordinates) {
       flightPlanCoordinates.push({ lat: coordinate[0], lng: coordinate[1] })
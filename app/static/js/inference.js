@@ -89,6 +89,8 @@ function generateRoutes (event) {
     '=' +
     encodeURIComponent(document.getElementById('travel_mode').value) +
     '&'
+  // Only the routes, without the distance matrix
+  url += 'response_mode=lean&'
   url +=
     globalElements.checkList[globalElements.checkList.length - 1] +
     '=' +
@@ -0,0 +1,301 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+Benchmark suite of the distance matrix and the solver.
+
+Each instance (the default Seville problem and generated flight problems of 250, 1000
+and 5000 nodes) is solved with each solver configuration under a fixed time limit.
+Every case runs in a new process, so its peak memory is measured on its own. The suite
+records the matrix build time, the model build time, the solve time, the objective, the
+time of the longest route and the peak RSS of each case, and writes them to CSV and JSON.
+
+The results can be compared with a baseline (the JSON of a previous run): a case whose
+metric exceeds the baseline times the ratio in benchmarks/thresholds.yaml (by more than
+its minimum difference, if any) is reported as a regression, and the suite exits with
+an error. Everything runs offline.
+
+Usage:
+    python -m benchmarks.suite [--instances seville,250,1k,5k] [--time-limit 10]
+        [--output output/benchmarks] [--baseline baseline.json]
+"""
+
+import os
+import io
+import csv
+import sys
+import json
+import time
+import argparse
+import resource
+import contextlib
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils.auxiliary import adapt_solution, ensure_folder_exist, load_yaml
+from utils.load_parameters import load_problem_definiton
+from utils.or_tools_method import find_routes
+from utils.problem_definiton import haversine_distance_matrix
+from utils.sparse_distances import SparseDistanceModel
+
+# Generated instances: number of nodes, number of vehicles and solver options
+GENERATED_INSTANCES = {
+    "250": {"nodes": 250, "vehicles": 4, "solver": {}},
+    "1k": {"nodes": 1000, "vehicles": 10, "solver": {}},
+    "5k": {"nodes": 5000, "vehicles": 25, "solver": {"sparse_neighbours": 20}},
+}
+
+# Solver configurations: first solution strategy and local search strategy
+CONFIGURATIONS = [
+    ("PATH_CHEAPEST_ARC", "GUIDED_LOCAL_SEARCH"),
+    ("SAVINGS", "TABU_SEARCH"),
+    ("PARALLEL_CHEAPEST_INSERTION", "SIMULATED_ANNEALING"),
+]
+
+METRICS = [
+    "matrix_time",
+    "model_time",
+    "solve_time",
+    "objective",
+    "total_time",
+    "peak_rss_mb",
+]
+
+THRESHOLDS_FILE = str(Path(__file__).parent.resolve() / "thresholds.yaml")
+
+
+def generate_instance(name, nodes, vehicles, seed=0):
+    """
+    Generates a reproducible flight problem with random addresses around Seville.
+    The first addresses are the depots: each vehicle starts and ends at its own depot.
+
+    Args:
+        name (str): Name of the instance.
+        nodes (int): Number of addresses.
+        vehicles (int): Number of vehicles.
+        seed (int, optional): Seed of the random generator (default is 0).
+
+    Returns:
+        dict: The problem data of the instance."""
+    rng = np.random.default_rng(seed)
+    center = np.array([37.38602323347123, -5.99311606343879])
+    coordinates = center + rng.uniform(-0.05, 0.05, size=(nodes, 2))
+    return {
+        "name": name,
+        "travel_mode": "flight",
+        "n_vehicles": vehicles,
+        "start_nodes": list(range(vehicles)),
+        "end_nodes": list(range(vehicles)),
+        "max_flight_time": [600] * vehicles,
+        "velocity": [36] * vehicles,
+        "addresses": coordinates.round(7).tolist(),
+    }
+
+
+def load_instance(name):
+    """
+    Loads a benchmark instance by name.
+
+    Args:
+        name (str): "seville" for the default problem definition, or the name of
+            a generated instance.
+
+    Returns:
+        tuple: The problem data and the solver options of the instance."""
+    if name == "seville":
+        problem_data = load_problem_definiton()
+        problem_data["name"] = name
+        return problem_data, {}
+    instance = GENERATED_INSTANCES[name]
+    return (
+        generate_instance(name, instance["nodes"], instance["vehicles"]),
+        instance["solver"],
+    )
+
+
+def run_case(instance, configuration, time_limit):
+    """
+    Runs a benchmark case: builds the distance matrix and solves the instance with
+    a solver configuration. It is run in a new process to measure its peak memory.
+
+    Args:
+        instance (str): Name of the instance.
+        configuration (tuple): The first solution strategy and local search strategy.
+        time_limit (float): Time limit of the search in seconds.
+
+    Returns:
+        dict: The metrics of the case."""
+    problem_data, solver_options = load_instance(instance)
+    routing_data = {
+        "first_solution_strategy": configuration[0],
+        "local_search_strategy": configuration[1],
+        "solution_limit": None,
+        "time_limit": time_limit,
+        "log_search": None,
+        "lns_time_limit": None,
+        **solver_options,
+    }
+    start_time = time.perf_counter()
+    if routing_data.get("sparse_neighbours"):
+        problem_data["distance_matrix"] = SparseDistanceModel(
+            problem_data["addresses"], routing_data["sparse_neighbours"]
+        )
+    else:
+        problem_data["distance_matrix"] = haversine_distance_matrix(
+            problem_data["addresses"]
+        )
+    matrix_time = time.perf_counter() - start_time
+    timings = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        data, manager, routing, solution = find_routes(
+            problem_data, routing_data, timings=timings
+        )
+        routes = (
+            adapt_solution(data, manager, routing, solution, problem_data["addresses"])
+            if solution is not None
+            else None
+        )
+    return {
+        "instance": instance,
+        "nodes": len(problem_data["addresses"]),
+        "vehicles": problem_data["n_vehicles"],
+        "first_solution_strategy": configuration[0],
+        "local_search_strategy": configuration[1],
+        "matrix_time": round(matrix_time, 4),
+        "model_time": round(timings["model"], 4),
+        "solve_time": round(timings["solve"], 4),
+        "objective": solution.ObjectiveValue() if solution is not None else None,
+        "total_time": routes["total_time"] if routes is not None else None,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def run_suite(instances, configurations, time_limit):
+    """
+    Runs every configuration on every instance, each case in a new process.
+
+    Args:
+        instances (list): Names of the instances.
+        configurations (list): The solver configurations.
+        time_limit (float): Time limit of the search in seconds.
+
+    Returns:
+        list: The metrics of each case."""
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for instance in instances:
+        for configuration in configurations:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(
+                    run_case, instance, configuration, time_limit
+                ).result()
+            print(
+                f"{instance} {configuration[0]} + {configuration[1]}: "
+                + ", ".join(f"{metric} {result[metric]}" for metric in METRICS)
+            )
+            results.append(result)
+    return results
+
+
+def save_results(results, folder):
+    """
+    Writes the results to a CSV and a JSON file named after the current time.
+
+    Args:
+        results (list): The metrics of each case.
+        folder (str): Folder where the files are written.
+
+    Returns:
+        str: The path of the JSON file."""
+    ensure_folder_exist(folder)
+    name = os.path.join(folder, time.strftime("benchmark-%Y%m%d-%H%M%S"))
+    with open(name + ".json", "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    with open(name + ".csv", "w", encoding="utf-8", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    return name + ".json"
+
+
+def find_regressions(results, baseline, thresholds):
+    """
+    Compares the results with a baseline.
+
+    Args:
+        results (list): The metrics of each case.
+        baseline (list): The metrics of each case of a previous run.
+        thresholds (dict): Maximum ratio between the result and the baseline of each
+            metric, or a dictionary with the "ratio" and the "min_delta", the difference
+            with the baseline below which a result is never a regression (e.g., the noise
+            of the timing of a few milliseconds).
+
+    Returns:
+        list: A description of each regression."""
+
+    def case(result):
+        return (
+            result["instance"],
+            result["first_solution_strategy"],
+            result["local_search_strategy"],
+        )
+
+    previous = {case(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        reference = previous.get(case(result))
+        if reference is None:
+            continue
+        for metric, threshold in thresholds.items():
+            if reference.get(metric) is None:
+                continue
+            if isinstance(threshold, dict):
+                ratio, min_delta = threshold["ratio"], threshold.get("min_delta", 0)
+            else:
+                ratio, min_delta = threshold, 0
+            if result[metric] is None:
+                regressions.append(f"{' '.join(case(result))}: no {metric}")
+            elif (
+                result[metric] > reference[metric] * ratio
+                and result[metric] - reference[metric] > min_delta
+            ):
+                regressions.append(
+                    f"{' '.join(case(result))}: {metric} {result[metric]} "
+                    f"> {reference[metric]} x {ratio}"
+                )
+    return regressions
+
+
+def main():
+    """
+    Runs the benchmark suite, saves the results and checks them against a baseline.
+
+    Returns:
+        None"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--instances", default="seville,250,1k,5k")
+    parser.add_argument("--time-limit", type=float, default=10)
+    parser.add_argument("--output", default="output/benchmarks")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE)
+    args = parser.parse_args()
+
+    results = run_suite(args.instances.split(","), CONFIGURATIONS, args.time_limit)
+    print(f"Results saved to {save_results(results, args.output)}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = find_regressions(results, baseline, load_yaml(args.thresholds))
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+Benchmark of the registration of the distance matrix in find_routes.
+
+The default problem definition (the Seville instance) is solved with the distance matrix
+registered in the solver (native_transit_matrix: true) and with a Python transit callback
+(native_transit_matrix: false). The search is limited by a number of solutions, so both
+runs explore the same solutions and must reach the same objective.
+
+Usage:
+    python -m benchmarks.transit_matrix [--solutions 100] [--repeats 3]
+"""
+
+import time
+import argparse
+import statistics
+from utils.load_parameters import load_problem_definiton
+from utils.problem_definiton import haversine_distance_matrix
+from utils.or_tools_method import find_routes
+
+
+def solve(problem_data, native, solutions):
+    """
+    Solves the problem and measures the time spent.
+
+    Args:
+        problem_data (dict): The problem definition, without distance matrix.
+        native (bool): Whether to register the matrix in the solver.
+        solutions (int): Number of solutions explored by the search.
+
+    Returns:
+        tuple: The execution time in seconds and the objective of the solution."""
+    data = dict(problem_data)
+    data["distance_matrix"] = haversine_distance_matrix(data["addresses"]).tolist()
+    routing_data = {
+        "first_solution_strategy": "PATH_CHEAPEST_ARC",
+        "local_search_strategy": "GUIDED_LOCAL_SEARCH",
+        "solution_limit": solutions,
+        "time_limit": None,
+        "log_search": None,
+        "lns_time_limit": None,
+        "native_transit_matrix": native,
+    }
+    start_time = time.perf_counter()
+    _, _, _, solution = find_routes(data, routing_data)
+    execution_time = time.perf_counter() - start_time
+    return execution_time, solution.ObjectiveValue() if solution else None
+
+
+def main():
+    """
+    Runs the benchmark and prints the median times and the speedup.
+
+    Returns:
+        None"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--solutions", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    problem_data = load_problem_definiton()
+    results = {}
+    for name, native in [("callback", False), ("native", True)]:
+        runs = [
+            solve(problem_data, native, args.solutions) for _ in range(args.repeats)
+        ]
+        results[name] = (
+            statistics.median(run[0] for run in runs),
+            {run[1] for run in runs},
+        )
+    print(f"Nodes: {len(problem_data['addresses'])}, solutions: {args.solutions}")
+    for name, (execution_time, objectives) in results.items():
+        print(f"{name:>8}: {execution_time:.3f}s (objective {sorted(objectives)})")
+    if results["callback"][1] != results["native"][1]:
+        print("Warning: the objectives differ")
+    print(f" speedup: {results['callback'][0] / results['native'][0]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
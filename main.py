@@ -7,6 +7,7 @@ This is the entry point of the web app.
 All the modules are imported to and accessed from this file.
 """
 
+import json
 from flask import (
     current_app,
     render_template,
@@ -15,17 +16,56 @@ from flask import (
     jsonify,
     send_from_directory,
     Flask,
+    Response,
+    g,
 )
 from flask_babel import Babel, gettext
-from utils.problem_definiton import AddressFormatConversion
+from utils.auxiliary import NumpyJSONEncoder
+from utils.cache import DistanceMatrixCache, GeocodeCache, SolutionCache
+from utils.problem_definiton import AddressFormatConversion, RateLimiter, HTTPClient
+from utils.spatial_index import GridSpatialIndex
+from utils.jobs import SolveJobManager
+from utils.metrics import default_registry
+from utils.profiling import RequestProfiler, profiling_lock
 from app.routes.addresses import addresses_blueprint
 from app.routes.loaders import loaders_blueprint
 from app.routes.save import save_blueprint
 from app.routes.routes import routes_blueprint
 from app.routes.simulation import simulation_blueprint
+from app.routes.jobs import jobs_blueprint
 
 app = Flask(__name__, template_folder="app/templates", static_folder="app/static")
 app.config.from_object("app.config.Config")
+app.json_encoder = NumpyJSONEncoder  # Distance matrices are NumPy arrays
+# Keep-alive connections shared by all the requests to the Google APIs
+app.http_client = HTTPClient(app.config["HTTP_TIMEOUT"], app.config["HTTP_MAX_RETRIES"])
+# Persistent cache of the matrices requested to the Distance Matrix API
+app.distance_matrix_cache = DistanceMatrixCache(
+    app.config["DISTANCE_MATRIX_CACHE_FILE"],
+    app.config["DISTANCE_MATRIX_CACHE_MAX_BYTES"],
+)
+# Geocoded addresses shared by the address conversion and the distance matrix requests
+app.geocode_cache = GeocodeCache(
+    app.config["GEOCODE_CACHE_FILE"],
+    app.config["GEOCODE_CACHE_MAX_BYTES"],
+    app.config["GEOCODE_CACHE_MAX_ENTRIES"],
+)
+# Routes of the problems already solved
+app.solution_cache = SolutionCache(
+    app.config["SOLUTION_CACHE_FILE"],
+    app.config["SOLUTION_CACHE_MAX_BYTES"],
+    app.config["SOLUTION_CACHE_ROAD_TTL"],
+)
+# Quota of the Distance Matrix API, shared by all the matrix requests
+app.distance_matrix_rate_limiter = RateLimiter(
+    app.config["DISTANCE_MATRIX_REQUESTS_PER_SECOND"],
+    app.config["DISTANCE_MATRIX_ELEMENTS_PER_SECOND"],
+)
+# Worker processes solving the problems in background jobs
+app.solve_jobs = SolveJobManager(
+    app.config["SOLVE_JOB_WORKERS"],
+    app.config["SOLVE_JOB_HISTORY"],
+)
 
 
 # To get the best matching language
@@ -60,6 +100,77 @@ app.register_blueprint(routes_blueprint, url_prefix="")
 # Blueprint for routes to manage simulation
 app.register_blueprint(simulation_blueprint, url_prefix="")
 
+# Blueprint for routes to solve in background jobs
+app.register_blueprint(jobs_blueprint, url_prefix="")
+
+
+@app.before_request
+def start_profiling():
+    """
+    Starts profiling the request with cProfile and tracemalloc if it is requested
+    with the PROFILE_HEADER header or the PROFILE_QUERY_FLAG query parameter.
+    Requests without the flag are not profiled. Only one request is profiled at a time:
+    a flagged request that arrives while another one is profiled runs without profiling.
+
+    Returns:
+        None"""
+    if not (
+        request.headers.get(app.config["PROFILE_HEADER"])
+        or request.args.get(app.config["PROFILE_QUERY_FLAG"])
+    ):
+        return
+    if not profiling_lock.acquire(blocking=False):
+        g.profiler = None  # Flagged, but another request is being profiled
+        return
+    g.profiler = RequestProfiler(
+        app.config["PROFILE_FOLDER"],
+        request.endpoint,
+        app.config["PROFILE_TOP_ALLOCATIONS"],
+    )
+    g.profiler.start()
+
+
+@app.after_request
+def stop_profiling(response):
+    """
+    Saves the profile of a profiled request and returns the paths of its files in the
+    X-Profile-Stats and X-Profile-Allocations headers (and in the "profile" field of a
+    JSON response). A streamed response (e.g., the simulation) is profiled until its
+    stream is closed.
+
+    Args:
+        response (Response): The response of the request.
+
+    Returns:
+        Response: The response with the locations of the profile."""
+    if "profiler" not in g:
+        return response
+    profiler = g.pop("profiler")
+    if profiler is None:
+        response.headers["X-Profile"] = "busy"
+        return response
+
+    def finish():
+        try:
+            profiler.stop()
+        finally:
+            profiling_lock.release()
+
+    locations = profiler.locations()
+    response.headers["X-Profile-Stats"] = locations["stats"]
+    response.headers["X-Profile-Allocations"] = locations["allocations"]
+    if response.is_streamed:
+        response.call_on_close(finish)
+        return response
+    finish()
+    if response.is_json and isinstance(response.get_json(silent=True), dict):
+        response.set_data(
+            json.dumps(
+                {**response.get_json(), "profile": locations}, cls=NumpyJSONEncoder
+            )
+        )
+    return response
+
 
 @app.route("/images/<filename>")
 def custom_image(filename):
@@ -85,13 +196,18 @@ def reset():
     This function resets the problem definition, solver definition,
     and routes by clearing the respective data structures.
     It sets the 'addresses', 'start_nodes', 'end_nodes' to empty lists, and 'n_vehicles' to 1.
-    It also sets the 'simulation' flag to False.
+    It also sets the 'simulation' flag to False, discards the incremental distance matrix
+    and empties the spatial index of the addresses.
 
     Returns:
         jsonify: A JSON response indicating the success of the reset operation."""
     current_app.problem_data = {}  # Reset problem definition
     current_app.solver_data = {}  # Reset solver definiton
     current_app.routes = {}  # Reset the routes
+    current_app.incremental_matrix = None  # Reset the distance matrix
+    current_app.address_index = GridSpatialIndex(
+        app.config["ADDRESS_INDEX_CELL_SIZE"]
+    )  # Reset the spatial index of the addresses
     current_app.problem_data["addresses"] = []
     current_app.problem_data["start_nodes"] = []
     current_app.problem_data["end_nodes"] = []
@@ -108,6 +224,20 @@ def get_maps_api_key():
     return jsonify({"apiKey": app.config["API_KEY"]})
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Exposes the counters and latencies of the stages of the pipeline
+    (geocoding, distance matrix, model build, search, simulation...)
+    in the Prometheus text format.
+
+    Returns:
+        Response: The metrics of the web server process."""
+    return Response(
+        default_registry.render(), mimetype="text/plain; version=0.0.4"
+    )
+
+
 @app.route("/", methods=["POST", "GET"])
 def main():
     """
@@ -131,6 +261,8 @@ def main():
         app.config["API_KEY"],
         app.config["GEOCODE_API_URL"],
         app.config["DISTANCE_MATRIX_API_URL"],
+        geocode_cache=app.geocode_cache,
+        http_client=app.http_client,
     )
     reset()  # Initialize variables
 
@@ -0,0 +1,59 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+Tests of the extraction of the routes of a solution.
+"""
+
+import numpy as np
+from ortools.constraint_solver import pywrapcp
+from utils.auxiliary import adapt_solution
+
+
+def solve(distance_matrix, starts, ends):
+    """
+    Solves a routing problem whose cost is the distance of the arcs.
+
+    Args:
+        distance_matrix (np.ndarray): The distance matrix.
+        starts (list): The start node of each vehicle.
+        ends (list): The end node of each vehicle.
+
+    Returns:
+        tuple: The manager, the routing model and the solution."""
+    manager = pywrapcp.RoutingIndexManager(len(distance_matrix), len(starts), starts, ends)
+    routing = pywrapcp.RoutingModel(manager)
+    transit = routing.RegisterTransitMatrix(distance_matrix.tolist())
+    routing.SetArcCostEvaluatorOfAllVehicles(transit)
+    solution = routing.SolveWithParameters(pywrapcp.DefaultRoutingSearchParameters())
+    return manager, routing, solution
+
+
+def test_idle_vehicle_with_different_depots_takes_no_time():
+    # Vehicle 0 (depots 0 and 1) is next to the customers 6 and 7, and the depots
+    # of vehicles 1 (2 and 3) and 2 (4 and 5) are far from them and from each other
+    coordinates = np.array([0, 10, 1000, 1400, 3000, 3700, 4, 6])
+    distance_matrix = np.abs(coordinates[:, None] - coordinates[None, :])
+    starts, ends = [0, 2, 4], [1, 3, 5]
+    manager, routing, solution = solve(distance_matrix, starts, ends)
+    data = {
+        "n_vehicles": 3,
+        "velocity": [36, 36, 36],  # 10 m/s
+        "distance_matrix": distance_matrix,
+    }
+    routes = adapt_solution(data, manager, routing, solution, coordinates.tolist())
+
+    assert routes["routes"][1]["nodes"] == [2, 3]
+    assert routes["routes"][2]["nodes"] == [4, 5]
+    for vehicle_id in range(3):
+        index, cost = routing.Start(vehicle_id), 0
+        while not routing.IsEnd(index):
+            next_index = solution.Value(routing.NextVar(index))
+            cost += routing.GetArcCostForVehicle(index, next_index, vehicle_id)
+            index = next_index
+        velocity = routes["routes"][vehicle_id]["velocity"]
+        assert routes["routes"][vehicle_id]["time"] == int(cost / velocity)
+    assert routes["routes"][1]["time"] == 0
+    assert routes["routes"][2]["time"] == 0
+    assert routes["total_time"] == routes["routes"][0]["time"]
@@ -0,0 +1,126 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+Tests of the persistent caches.
+"""
+
+import time
+import numpy as np
+from utils.cache import (
+    DistanceMatrixCache,
+    GeocodeCache,
+    SQLiteLRUCache,
+    SolutionCache,
+    hash_array,
+    hash_content,
+)
+
+
+def test_hashes_are_canonical():
+    assert hash_content({"a": 1, "b": [1, 2]}) == hash_content({"b": [1, 2], "a": 1})
+    assert hash_content({"a": 1}) != hash_content({"a": 2})
+    matrix = np.arange(6).reshape(2, 3)
+    assert hash_array(matrix) == hash_array(matrix.tolist())
+    assert hash_array(matrix) != hash_array(matrix.reshape(3, 2))
+    assert hash_array(matrix) != hash_array(matrix.astype(np.int32))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = SQLiteLRUCache(str(tmp_path / "cache" / "lru.sqlite"), max_bytes=30)
+    cache.put("a", b"a" * 10)
+    time.sleep(0.01)
+    cache.put("b", b"b" * 10)
+    time.sleep(0.01)
+    assert cache.get("a") == b"a" * 10  # "b" is now the least recently used
+    time.sleep(0.01)
+    cache.put("c", b"c" * 15)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a" * 10
+    assert cache.get("c") == b"c" * 15
+    assert cache.stats() == {"hits": 3, "misses": 1, "entries": 2, "bytes": 25}
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+
+
+def test_distance_matrices_persist_between_instances(tmp_path):
+    file = str(tmp_path / "matrices.sqlite")
+    addresses = [[37.39, -5.99], [37.40, -5.98], "Plaza Nueva Sevilla"]
+    matrix = np.array([[0, 5, 7], [6, 0, 3], [8, 2, 0]], dtype=np.int32)
+    DistanceMatrixCache(file, 1 << 20).put_matrix(addresses, "driving", matrix)
+
+    cache = DistanceMatrixCache(file, 1 << 20)
+    cached = cache.get_matrix(addresses, "driving")
+    assert cached.dtype == matrix.dtype
+    assert np.array_equal(cached, matrix)
+    assert cache.get_matrix(addresses, "walking") is None
+    assert cache.get_matrix(addresses[::-1], "driving") is None
+
+
+def test_geocoded_addresses_are_normalized_and_persisted(tmp_path):
+    file = str(tmp_path / "geocode.sqlite")
+    location = {"place_id": "plaza-nueva", "lat": 37.3886, "lng": -5.9953}
+    cache = GeocodeCache(file, 1 << 20, max_entries=1)
+    cache.put_location("Plaza  Nueva, Sevilla", location)
+    cache.put_location("Calle Sierpes, Sevilla", {"place_id": "sierpes"})
+
+    assert GeocodeCache.normalize(" PLAZA nueva,\tSévilla ") == "plaza nueva, sevilla"
+    # Evicted from memory, but read back from the persistent store
+    assert cache.get_location("plaza nueva, SÉVILLA") == location
+    assert GeocodeCache(file, 1 << 20).get_location("Plaza Nueva, Sevilla") == location
+    assert cache.get_location("Plaza de España, Sevilla") is None
+
+
+def example_problem(travel_mode="flight"):
+    """
+    Builds a small problem and the routes of its solution.
+
+    Args:
+        travel_mode (str, optional): Travel mode of the problem (default is "flight").
+
+    Returns:
+        tuple: The problem data and the routes."""
+    problem_data = {
+        "addresses": [[37.39, -5.99], [37.40, -5.98], [37.38, -5.97]],
+        "n_vehicles": 1,
+        "start_nodes": [0],
+        "end_nodes": [0],
+        "velocity": [10],
+        "max_flight_time": [3600],
+        "travel_mode": travel_mode,
+        "distance_matrix": np.array([[0, 5, 7], [6, 0, 3], [8, 2, 0]]),
+    }
+    routes = {"routes": {0: [[37.39, -5.99], [37.40, -5.98], [37.39, -5.99]]}}
+    return problem_data, routes
+
+
+def test_solutions_are_keyed_by_the_problem_and_the_solver(tmp_path):
+    cache = SolutionCache(str(tmp_path / "solutions.sqlite"), 1 << 20)
+    problem_data, routes = example_problem()
+    solver_data = {"time_limit": 10}
+    cache.put_routes(problem_data, solver_data, routes)
+
+    # The vehicle ids are integers again after the JSON round trip
+    assert cache.get_routes(problem_data, solver_data) == routes
+    assert cache.get_routes({**problem_data, "n_vehicles": 2}, solver_data) is None
+    assert cache.get_routes(problem_data, {"time_limit": 20}) is None
+    # A matrix computed from the addresses is not part of the key, a provided one is
+    computed = {**problem_data, "distance_matrix": problem_data["distance_matrix"] * 2}
+    assert cache.get_routes(computed, solver_data) == routes
+    cache.put_routes(problem_data, solver_data, routes, matrix_provided=True)
+    assert cache.get_routes(problem_data, solver_data, matrix_provided=True) == routes
+    assert cache.get_routes(computed, solver_data, matrix_provided=True) is None
+
+
+def test_road_solutions_expire(tmp_path):
+    cache = SolutionCache(str(tmp_path / "solutions.sqlite"), 1 << 20, road_ttl=0)
+    flight_problem, routes = example_problem("flight")
+    road_problem, _ = example_problem("driving")
+    cache.put_routes(flight_problem, {}, routes)
+    cache.put_routes(road_problem, {}, routes)
+    time.sleep(0.01)
+
+    assert cache.get_routes(flight_problem, {}) == routes
+    assert cache.get_routes(road_problem, {}) is None
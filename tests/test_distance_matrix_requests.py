@@ -0,0 +1,196 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+Tests of the Distance Matrix API requests against a local stub of the API.
+"""
+
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+from utils.problem_definiton import (
+    HTTPClient,
+    generate_distance_matrix,
+    generate_distance_submatrix,
+)
+
+# Locations of the addresses that are geocoded by the stub
+PLACES = {"Plaza Nueva Sevilla": ("plaza-nueva", 37.3886, -5.9953)}
+
+
+def stub_distance(origin, destination):
+    """
+    Distance returned by the stub, different in each direction.
+
+    Args:
+        origin (tuple): The (latitude, longitude) of the origin.
+        destination (tuple): The (latitude, longitude) of the destination.
+
+    Returns:
+        int: The distance in meters."""
+    return int(
+        abs(origin[0] - destination[0]) * 100000
+        + abs(origin[1] - destination[1]) * 70000
+        + (origin[0] > destination[0]) * 10
+    )
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Handler of the stub of the Geocode and Distance Matrix APIs. It keeps the
+    connections alive, answers with gzip encoded bodies, and rejects the first
+    distance matrix request with OVER_QUERY_LIMIT.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        """
+        Counts the connections opened to the stub.
+
+        Returns:
+            None"""
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """
+        Silences the log of the requests.
+
+        Returns:
+            None"""
+
+    def location(self, address):
+        """
+        Returns the location of an address of a request.
+
+        Args:
+            address (str): The coordinates of the address, or its place_id.
+
+        Returns:
+            tuple: The (latitude, longitude) of the address."""
+        for place_id, lat, lng in PLACES.values():
+            if address == "place_id:" + place_id:
+                return lat, lng
+        lat, lng = address.split(",")
+        return float(lat), float(lng)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Answers a Geocode or Distance Matrix API request.
+
+        Returns:
+            None"""
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if parts.path.startswith("/geocode"):
+            place_id, lat, lng = PLACES[query["address"][0]]
+            body = {
+                "status": "OK",
+                "results": [
+                    {
+                        "place_id": place_id,
+                        "geometry": {"location": {"lat": lat, "lng": lng}},
+                    }
+                ],
+            }
+        else:
+            with self.server.lock:
+                self.server.distance_requests += 1
+                over_query_limit = self.server.distance_requests == 1
+            if over_query_limit:
+                body = {"status": "OVER_QUERY_LIMIT", "rows": []}
+            else:
+                origins = [self.location(a) for a in query["origins"][0].split("|")]
+                destinations = [
+                    self.location(a) for a in query["destinations"][0].split("|")
+                ]
+                body = {
+                    "status": "OK",
+                    "rows": [
+                        {
+                            "elements": [
+                                {
+                                    "status": "OK",
+                                    "distance": {"value": stub_distance(o, d)},
+                                }
+                                for d in destinations
+                            ]
+                        }
+                        for o in origins
+                    ],
+                }
+        data = gzip.compress(json.dumps(body).encode("utf-8"))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_stub():
+    """
+    Starts the stub of the APIs in a thread.
+
+    Returns:
+        tuple: The server, the geocode API URL and the distance matrix API URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.distance_requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    return server, url + "/geocode/json?", url + "/distancematrix/json?units=metric"
+
+
+def test_tiled_matrix_matches_a_single_request():
+    rng = np.random.default_rng(0)
+    addresses = (np.array([37.39, -5.99]) + rng.uniform(-0.02, 0.02, (29, 2))).tolist()
+    addresses.append("Plaza Nueva Sevilla")
+    server, geocode_api_url, distance_matrix_api_url = start_stub()
+    http_client = HTTPClient(timeout=5, max_retries=2)
+    try:
+        # Tiles of at most 100 elements, requested by 4 threads
+        matrix = generate_distance_matrix(
+            list(addresses),
+            "key",
+            geocode_api_url,
+            distance_matrix_api_url,
+            mode="driving",
+            concurrency=4,
+            http_client=http_client,
+        )
+        tiled_requests = server.distance_requests
+        single = generate_distance_submatrix(
+            list(addresses),
+            list(addresses),
+            "key",
+            geocode_api_url,
+            distance_matrix_api_url,
+            mode="driving",
+            max_origins=len(addresses),
+            max_destinations=len(addresses),
+            max_elements=len(addresses) ** 2,
+            square=True,
+            http_client=http_client,
+        )
+    finally:
+        http_client.close()
+        server.shutdown()
+        server.server_close()
+
+    # The rejected request is retried, and the tiles fill the whole matrix
+    assert tiled_requests > 2
+    assert server.distance_requests == tiled_requests + 1
+    assert np.array_equal(np.array(matrix), single)
+    assert not np.array_equal(single, single.T)
+    assert np.all(np.diag(single) == 0)
+    # The connections are kept alive and reused between requests
+    assert server.connections <= 4
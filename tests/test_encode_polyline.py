@@ -0,0 +1,52 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+Tests of the encoding of the routes as polylines.
+"""
+
+import numpy as np
+from utils.auxiliary import encode_polyline
+
+
+def decode_polyline(polyline, precision=5):
+    """
+    Decodes a polyline, as google.maps.geometry.encoding.decodePath does.
+
+    Args:
+        polyline (str): The encoded polyline.
+        precision (int, optional): Number of decimals kept (default is 5).
+
+    Returns:
+        list: The [latitude, longitude] of each point."""
+    values, value, shift = [], 0, 0
+    for char in polyline:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1F) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    points = np.cumsum(np.array(values).reshape(-1, 2), axis=0) / 10**precision
+    return points.tolist()
+
+
+def test_reference_example_is_encoded():
+    # Example of the documentation of the Encoded Polyline Algorithm Format
+    coordinates = [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+    assert encode_polyline(coordinates) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert encode_polyline([]) == ""
+
+
+def test_random_route_round_trip():
+    rng = np.random.default_rng(0)
+    coordinates = np.round(
+        np.array([37.39, -5.99]) + rng.uniform(-0.5, 0.5, (200, 2)), 6
+    ).tolist()
+    with_altitude = [point + [120.0] for point in coordinates]
+
+    decoded = decode_polyline(encode_polyline(with_altitude))
+    assert np.allclose(decoded, coordinates, atol=0.5e-5)
+    decoded = decode_polyline(encode_polyline(coordinates, precision=6), precision=6)
+    assert np.allclose(decoded, coordinates, atol=0.5e-6)
@@ -0,0 +1,89 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+Tests of the memory-mapped distance matrices.
+"""
+
+import tracemalloc
+import numpy as np
+from utils.matrix_storage import store_memmap_matrix
+from utils.or_tools_method import find_routes
+from utils.problem_definiton import IncrementalDistanceMatrix, haversine_distance_matrix
+
+ROUTING_DATA = {
+    "first_solution_strategy": "PATH_CHEAPEST_ARC",
+    "local_search_strategy": "GREEDY_DESCENT",
+    "solution_limit": 1,
+    "time_limit": 60,
+    "log_search": False,
+    "lns_time_limit": None,
+}
+
+
+def random_addresses(n_addresses, seed=0):
+    """
+    Generates random addresses around Seville.
+
+    Args:
+        n_addresses (int): Number of addresses.
+        seed (int, optional): Seed of the generator (default is 0).
+
+    Returns:
+        list: The (latitude, longitude) of each address."""
+    rng = np.random.default_rng(seed)
+    offsets = rng.uniform(-0.02, 0.02, (n_addresses, 2))
+    return (np.array([37.39, -5.99]) + offsets).tolist()
+
+
+def test_memmapped_problem_is_solved_without_copying_the_matrix(tmp_path):
+    addresses = random_addresses(400)
+    matrix = store_memmap_matrix(
+        str(tmp_path / "matrix.npy"), haversine_distance_matrix(addresses)
+    )
+    problem_data = {
+        "distance_matrix": matrix,
+        "n_vehicles": 2,
+        "start_nodes": [0, 0],
+        "end_nodes": [0, 0],
+        "max_flight_time": [1000, 1000],
+        "velocity": [36, 36],
+    }
+    tracemalloc.start()
+    try:
+        _, _, _, solution = find_routes(problem_data, ROUTING_DATA)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert solution is not None
+    assert isinstance(problem_data["distance_matrix"], np.memmap)
+    assert peak < matrix.nbytes
+
+
+def test_incremental_matrix_stays_memmapped(tmp_path):
+    addresses = random_addresses(6)
+    matrix = IncrementalDistanceMatrix(
+        "flight", storage_folder=str(tmp_path), memmap_min_nodes=6
+    )
+    matrix.build(
+        addresses,
+        store_memmap_matrix(
+            str(tmp_path / "matrix.npy"), haversine_distance_matrix(addresses)
+        ),
+    )
+    new_address = [37.4, -6.0]
+    matrix.add_node(new_address)
+    assert isinstance(matrix.matrix, np.memmap)
+    matrix.update_node(2, [37.38, -5.98])
+    matrix.remove_node(0)
+    assert isinstance(matrix.matrix, np.memmap)
+
+    expected = haversine_distance_matrix(
+        addresses[1:2] + [[37.38, -5.98]] + addresses[3:] + [new_address]
+    )
+    assert np.array_equal(matrix.matrix, expected)
+    # Below memmap_min_nodes, the matrix is kept in memory
+    matrix.remove_node(0)
+    assert not isinstance(matrix.matrix, np.memmap)
@@ -0,0 +1,61 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+Tests of the registry of metrics and its Prometheus text format.
+"""
+
+import pytest
+from utils.metrics import MetricsRegistry, observe_stage, stage_timer
+
+
+def test_registry_renders_the_prometheus_text_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests.", ("path",))
+    requests.inc(path="/a")
+    requests.inc(2, path='/b"\n')
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(1.0, 0.1))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+
+    assert registry.render() == "\n".join(
+        [
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{le="0.1"} 2',
+            'latency_seconds_bucket{le="1.0"} 3',
+            'latency_seconds_bucket{le="+Inf"} 4',
+            "latency_seconds_sum 3.65",
+            "latency_seconds_count 4",
+            "# HELP requests_total Requests.",
+            "# TYPE requests_total counter",
+            'requests_total{path="/a"} 1.0',
+            'requests_total{path="/b\\"\\n"} 2.0',
+            "",
+        ]
+    )
+    assert latency.count() == 4
+    assert requests.value(path="/c") == 0
+    with pytest.raises(ValueError):
+        registry.histogram("requests_total", "Requests.")
+
+
+def test_stages_are_recorded_by_outcome():
+    registry = MetricsRegistry()
+    observe_stage("geocode", 0.002, "cache_hit", registry=registry)
+    with stage_timer("search", registry=registry):
+        pass
+    with pytest.raises(RuntimeError):
+        with stage_timer("search", registry=registry):
+            raise RuntimeError("No solution")
+
+    calls = registry.counter("vrp_stage_calls_total", "", ("stage", "outcome"))
+    durations = registry.histogram("vrp_stage_duration_seconds", "", ("stage",))
+    assert calls.value(stage="geocode", outcome="cache_hit") == 1
+    assert calls.value(stage="search", outcome="ok") == 1
+    assert calls.value(stage="search", outcome="error") == 1
+    assert durations.count(stage="search") == 2
+    assert 'vrp_stage_calls_total{stage="search",outcome="error"} 1.0' in (
+        registry.render().splitlines()
+    )
@@ -0,0 +1,92 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+Tests of the binary .npz format of the missions.
+"""
+
+import numpy as np
+import pytest
+from utils.mission_file import load_mission_npz, save_mission_npz
+from utils.sparse_distances import SparseDistanceModel
+
+
+def example_mission():
+    """
+    Builds a problem with coordinates (with and without altitude) and names,
+    and the routes of its two vehicles.
+
+    Returns:
+        tuple: The problem data and the routes."""
+    addresses = [
+        [37.39, -5.99, 20.0],
+        [37.40, -5.98],
+        "Plaza Nueva Sevilla",
+        [37.38, -5.97, 35.5],
+    ]
+    problem_data = {
+        "addresses": addresses,
+        "n_vehicles": 2,
+        "start_nodes": [0, 0],
+        "end_nodes": [0, 1],
+        "max_flight_time": [3600, 1800],
+        "velocity": [10.0, 12.5],
+        "travel_mode": "flight",
+        "distance_matrix": np.arange(16, dtype=np.int32).reshape(4, 4),
+    }
+    routes = {
+        "routes": {
+            vehicle: {
+                "coordinates": [addresses[node] for node in nodes],
+                "nodes": nodes,
+                "time": time,
+                "color": color,
+                "velocity": velocity,
+            }
+            for vehicle, nodes, time, color, velocity in [
+                (0, [0, 3, 2, 0], 1200, "#ff0000", 10.0),
+                (1, [0, 1], 300, "#00ff00", 12.5),
+            ]
+        },
+        "objective_trace": [[0.1, 1500]],
+    }
+    return problem_data, routes
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_mission_round_trip(tmp_path, compress):
+    problem_data, routes = example_mission()
+    file = str(tmp_path / "mission.npz")
+    save_mission_npz(file, problem_data, routes, compress=compress)
+    loaded_problem, loaded_routes = load_mission_npz(file)
+
+    matrix = loaded_problem.pop("distance_matrix")
+    assert np.array_equal(matrix, problem_data.pop("distance_matrix"))
+    assert matrix.dtype == np.int32
+    assert loaded_problem == problem_data
+    assert loaded_routes == routes
+
+
+def test_sparse_model_is_rebuilt_without_routes(tmp_path):
+    coordinates = [[37.39 + i * 0.001, -5.99 - i * 0.002] for i in range(6)]
+    problem_data = {
+        "addresses": coordinates,
+        "distance_matrix": SparseDistanceModel(coordinates, k=3),
+    }
+    file = str(tmp_path / "mission.npz")
+    save_mission_npz(file, problem_data)
+    loaded_problem, loaded_routes = load_mission_npz(file)
+
+    assert loaded_routes is None
+    assert loaded_problem["addresses"] == coordinates
+    model = loaded_problem["distance_matrix"]
+    assert model.k == 3
+    assert np.array_equal(model.neighbours, problem_data["distance_matrix"].neighbours)
+
+
+def test_unknown_format_version_is_rejected(tmp_path):
+    file = str(tmp_path / "mission.npz")
+    np.savez(file, format_version=np.array(99))
+    with pytest.raises(ValueError):
+        load_mission_npz(file)
@@ -0,0 +1,63 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+Tests of the sparse k-nearest-neighbour distance model.
+"""
+
+import numpy as np
+from utils import sparse_distances
+from utils.problem_definiton import coordinates_to_array, haversine_distances
+from utils.sparse_distances import SparseDistanceModel, k_nearest_neighbours
+
+
+def clustered_coordinates(n_coordinates, seed=0):
+    """
+    Generates coordinates around Seville, half of them in a small dense cluster,
+    so the cells of the grid hold very different numbers of coordinates.
+
+    Args:
+        n_coordinates (int): Number of coordinates.
+        seed (int, optional): Seed of the generator (default is 0).
+
+    Returns:
+        np.ndarray: The (N, 3) array of latitude, longitude and altitude."""
+    rng = np.random.default_rng(seed)
+    spread = rng.uniform(-0.05, 0.05, (n_coordinates - n_coordinates // 2, 2))
+    cluster = rng.normal(0, 0.0005, (n_coordinates // 2, 2))
+    offsets = np.concatenate([spread, cluster])
+    return coordinates_to_array((np.array([37.39, -5.99]) + offsets).tolist())
+
+
+def test_grid_fallback_matches_brute_force(monkeypatch):
+    monkeypatch.setattr(sparse_distances, "cKDTree", None)
+    coordinates = clustered_coordinates(600)
+    k = 8
+    neighbours = k_nearest_neighbours(coordinates, k)
+
+    distances = haversine_distances(coordinates, coordinates, dtype=np.float64)
+    np.fill_diagonal(distances, np.inf)
+    expected = np.sort(distances, axis=1)[:, :k]
+    found = np.take_along_axis(distances, neighbours, axis=1)
+    assert neighbours.shape == (600, k)
+    assert np.all(neighbours != np.arange(600)[:, None])
+    # Ties may be broken differently, so the distances are compared
+    assert np.allclose(found, expected)
+
+
+def test_sparse_model_computes_the_other_arcs(monkeypatch):
+    monkeypatch.setattr(sparse_distances, "cKDTree", None)
+    coordinates = clustered_coordinates(50).tolist()
+    model = SparseDistanceModel(coordinates, k=5)
+    full = haversine_distances(
+        coordinates_to_array(coordinates), coordinates_to_array(coordinates)
+    )
+
+    assert len(model) == 50
+    for i in range(50):
+        assert model[i][i] == 0
+        for j in range(50):
+            if i != j:
+                assert abs(model[i][j] - full[i, j]) <= 1
+    assert SparseDistanceModel(coordinates[:1], k=5).neighbours.shape == (1, 0)
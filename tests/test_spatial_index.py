@@ -0,0 +1,60 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+Tests of the grid spatial index over the addresses.
+"""
+
+import numpy as np
+from utils.problem_definiton import calculate_haversine_distance
+from utils.spatial_index import GridSpatialIndex
+
+
+def random_coordinates(n_coordinates, seed=0):
+    """
+    Generates random coordinates around Seville.
+
+    Args:
+        n_coordinates (int): Number of coordinates.
+        seed (int, optional): Seed of the generator (default is 0).
+
+    Returns:
+        list: The [latitude, longitude] of each coordinate."""
+    rng = np.random.default_rng(seed)
+    offsets = rng.uniform(-0.02, 0.02, (n_coordinates, 2))
+    return (np.array([37.39, -5.99]) + offsets).tolist()
+
+
+def test_nearest_and_radius_queries_match_brute_force():
+    coordinates = random_coordinates(300)
+    index = GridSpatialIndex(cell_size=200)
+    index.rebuild(coordinates)
+    for query in random_coordinates(20, seed=1) + [[37.6, -5.7]]:
+        distances = [calculate_haversine_distance(query, c) for c in coordinates]
+        nearest, distance = index.nearest(query)
+        assert distance == min(distances)
+        assert distances[nearest] == distance
+        expected = sorted((d, i) for i, d in enumerate(distances) if d <= 500)
+        assert index.within_radius(query, 500) == [i for _, i in expected]
+
+
+def test_index_follows_the_list_of_addresses():
+    addresses = random_coordinates(5) + ["Plaza Nueva Sevilla"]
+    index = GridSpatialIndex()
+    index.rebuild(addresses)
+    assert len(index) == 5  # Names are not indexed
+    assert index.find(addresses[2]) == 2
+    assert index.find([addresses[2][0] + 0.00001, addresses[2][1]]) is None
+    assert index.find([addresses[2][0] + 0.00001, addresses[2][1]], tolerance=5) == 2
+
+    index.update(1, [37.5, -6.0])
+    assert index.find([37.5, -6.0]) == 1
+    assert index.find(addresses[1]) is None
+    # As list.pop, the indexes after the removed one are shifted
+    addresses.pop(0)
+    index.remove(0)
+    assert index.find(addresses[1]) == 1
+    assert index.find(addresses[3]) == 3
+    assert sorted(index.points) == [0, 1, 2, 3]
+    assert GridSpatialIndex().nearest([37.39, -5.99]) == (None, None)
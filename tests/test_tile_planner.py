@@ -0,0 +1,89 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+Tests of the planner of the Distance Matrix API requests.
+"""
+
+import numpy as np
+from utils.problem_definiton import plan_distance_matrix_tiles
+
+
+def requested_cells(plan, num_origins, num_destinations):
+    """
+    Counts how many times each element of a matrix is requested by a plan.
+
+    Args:
+        plan (TilePlan): The plan of the requests.
+        num_origins (int): Number of origins of the matrix.
+        num_destinations (int): Number of destinations of the matrix.
+
+    Returns:
+        np.ndarray: The number of requests of each element."""
+    counts = np.zeros((num_origins, num_destinations), dtype=int)
+    for rows, cols in plan.tiles:
+        counts[np.ix_(rows, cols)] += 1
+    return counts
+
+
+def assert_within_limits(plan, max_origins=25, max_destinations=25, max_elements=100):
+    """
+    Checks that every tile of a plan fits in the limits of the provider.
+
+    Args:
+        plan (TilePlan): The plan of the requests.
+        max_origins (int, optional): Maximum origins per request.
+        max_destinations (int, optional): Maximum destinations per request.
+        max_elements (int, optional): Maximum origins x destinations per request.
+
+    Returns:
+        None"""
+    for rows, cols in plan.tiles:
+        assert 0 < len(rows) <= max_origins
+        assert 0 < len(cols) <= max_destinations
+        assert len(rows) * len(cols) <= max_elements
+
+
+def test_rectangular_matrix_is_requested_once():
+    plan = plan_distance_matrix_tiles(7, 43)
+
+    assert_within_limits(plan)
+    assert np.all(requested_cells(plan, 7, 43) == 1)
+    assert plan.n_requests == 4  # 301 elements in requests of 100
+    assert plan.n_elements == 7 * 43
+    assert plan.n_diagonal == 0
+
+
+def test_symmetric_matrix_requests_the_upper_triangle():
+    plan = plan_distance_matrix_tiles(30, 30, square=True, symmetric=True)
+    counts = requested_cells(plan, 30, 30)
+
+    assert_within_limits(plan)
+    assert np.all(counts[np.triu_indices(30, k=1)] == 1)
+    # The tiles of several rows reach the diagonal, but skip most of the lower triangle
+    assert plan.n_elements < 30 * 30 * 2 / 3
+    assert plan.n_diagonal == np.trace(counts)
+
+
+def test_square_matrix_reports_the_requested_diagonal():
+    plan = plan_distance_matrix_tiles(30, 30, square=True)
+    counts = requested_cells(plan, 30, 30)
+    off_diagonal = ~np.eye(30, dtype=bool)
+
+    assert_within_limits(plan)
+    assert np.all(counts[off_diagonal] == 1)
+    assert plan.n_requests == 9
+    assert plan.n_diagonal == np.trace(counts)
+    assert plan.n_elements == 30 * 29 + plan.n_diagonal
+
+
+def test_single_row_tiles_skip_the_diagonal():
+    plan = plan_distance_matrix_tiles(
+        12, 12, max_origins=1, max_destinations=25, square=True
+    )
+    counts = requested_cells(plan, 12, 12)
+
+    assert plan.n_requests == 12
+    assert plan.n_diagonal == 0
+    assert np.all(counts == 1 - np.eye(12, dtype=int))
@@ -7,19 +7,59 @@ This module contains some auxiliary functions.
 """
 
 import os
-import time
+import copy
 import base64
+import logging
+import functools
+import threading
+import json
 import re
 from typing import Dict
 import yaml
 import cv2
 import numpy as np
+from utils.metrics import default_registry, stage_timer
+
+# Reports of the solutions, silent unless the application enables the INFO level
+logger = logging.getLogger(__name__)
+
+# Characters removed from the YAML files before parsing them
+SPECIAL_CHARACTERS = re.compile(
+    r"[^\x09\x0A\x0D\x20-\x7E\x85\xA0-\uD7FF\uE000-\uFFFD\U00010000-\U0010ffff]+"
+)
+
+# The libyaml (C) parser is used when PyYAML is built with it
+YAMLLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class YAMLDumper(getattr(yaml, "CSafeDumper", yaml.SafeDumper)):
+    """
+    Safe YAML dumper (the libyaml emitter when PyYAML is built with it) that also
+    writes tuples and NumPy values, as lists and numbers that can be safely loaded.
+    """
+
+
+YAMLDumper.add_representer(tuple, YAMLDumper.represent_list)
+YAMLDumper.add_multi_representer(
+    np.integer, lambda dumper, value: dumper.represent_int(int(value))
+)
+YAMLDumper.add_multi_representer(
+    np.floating, lambda dumper, value: dumper.represent_float(float(value))
+)
+YAMLDumper.add_multi_representer(
+    np.ndarray, lambda dumper, value: dumper.represent_list(value.tolist())
+)
+
+# Parsed YAML files: path -> ((modification time, size), data)
+yaml_cache = {}
+yaml_cache_lock = threading.Lock()
 
 
 # Decorators
 def measure_execution_time(func):
     """
     Decorator function that measures the execution time of a given function.
+    Each call is recorded in the metrics registry as a stage named after the function.
 
     Args:
         func (callable): The function to be wrapped and measured.
@@ -27,17 +67,40 @@ def measure_execution_time(func):
     Returns:
         callable: The wrapper function that measures the execution time."""
 
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        execution_time = end_time - start_time
-        print(f"Execution time of {func.__name__}: {execution_time:.2f}s.")
-        return result
+        with stage_timer(func.__name__):
+            return func(*args, **kwargs)
 
     return wrapper
 
 
+class NumpyJSONEncoder(json.JSONEncoder):
+    """
+    JSON encoder that also serializes NumPy arrays and scalars, and objects
+    with a to_dict method, so distance matrices can be returned by the web app.
+    """
+
+    def default(self, o):
+        """
+        Converts NumPy objects to their native Python equivalent.
+
+        Args:
+            o (object): The object to be serialized.
+
+        Returns:
+            object: A JSON serializable object."""
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, np.integer):
+            return int(o)
+        if isinstance(o, np.floating):
+            return float(o)
+        if hasattr(o, "to_dict"):  # E.g., SparseDistanceModel
+            return o.to_dict()
+        return super().default(o)
+
+
 def string2list(input_str):
     """
     Converts a string to a list. If the string contains only one value,
@@ -115,6 +178,7 @@ def base642image(base64_string):
     return image
 
 
+@measure_execution_time
 def load_yaml(file: str = "data.yaml") -> Dict:
     """
     Load a YAML file into a dictionary.
@@ -131,16 +195,45 @@ def load_yaml(file: str = "data.yaml") -> Dict:
     with open(file, errors="ignore", encoding="utf-8") as f:
         s = f.read()  # string
         # Remove special characters
-        if not s.isprintable():
-            s = re.sub(
-                r"[^\x09\x0A\x0D\x20-\x7E\x85\xA0-\uD7FF\uE000-\uFFFD\U00010000-\U0010ffff]+",
-                "",
-                s,
-            )
-        params = yaml.safe_load(s)
+        if SPECIAL_CHARACTERS.search(s):
+            s = SPECIAL_CHARACTERS.sub("", s)
+        params = yaml.load(s, Loader=YAMLLoader)
     return params
 
 
+def load_yaml_cached(file: str) -> Dict:
+    """
+    Load a YAML file into a dictionary, parsing it only if it changed since it
+    was last loaded (its modification time or size is different).
+
+    Args:
+        file (str): Path to the YAML file.
+
+    Returns:
+        Dict: A copy of the contents of the YAML file, which the caller can modify."""
+    assert os.path.exists(file), f"File not found in path {file}"
+    # Stat before reading, so a change during the read is detected in the next load
+    stat = os.stat(file)
+    version = (stat.st_mtime_ns, stat.st_size)
+    key = os.path.abspath(file)
+    with yaml_cache_lock:
+        entry = yaml_cache.get(key)
+    hit = entry is not None and entry[0] == version
+    default_registry.counter(
+        "vrp_yaml_cache_total",
+        "Loads of YAML files from the cache of parsed files.",
+        ("result",),
+    ).inc(result="hit" if hit else "miss")
+    if hit:
+        data = entry[1]
+    else:
+        data = load_yaml(file)
+        with yaml_cache_lock:
+            yaml_cache[key] = (version, data)
+    return copy.deepcopy(data)
+
+
+@measure_execution_time
 def save_yaml(file, data):
     """
     This function save data in a yaml file.
@@ -151,8 +244,8 @@ def save_yaml(file, data):
 
     Returns:
         None"""
-    with open(file, "w") as file:
-        yaml.dump(data, file)
+    with open(file, "w", encoding="utf-8") as file:
+        yaml.dump(data, file, Dumper=YAMLDumper)
 
 
 def ensure_folder_exist(path):
@@ -213,9 +306,85 @@ def generate_n_colors(n):
     return colors
 
 
+def encode_polyline(coordinates, precision=5):
+    """
+    Encodes coordinates with the Encoded Polyline Algorithm Format of Google Maps,
+    which can be decoded by google.maps.geometry.encoding.decodePath.
+    Only the latitude and longitude of each coordinate are encoded.
+
+    Args:
+        coordinates (list): List of [latitude, longitude, ...] coordinates.
+        precision (int, optional): Number of decimals kept (default is 5).
+
+    Returns:
+        str: The encoded polyline."""
+    if len(coordinates) == 0:
+        return ""
+    points = np.round(
+        np.array([coordinate[:2] for coordinate in coordinates], dtype=float)
+        * 10**precision
+    ).astype(np.int64)
+    # Each value is the difference with the previous point, zigzag encoded
+    deltas = np.diff(points, axis=0, prepend=0).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    chunks = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def route_nodes(manager, routing, solution, vehicle_id):
+    """
+    Collects the nodes of the route of a vehicle, from its start to its end node.
+
+    Args:
+        manager (ortools.routing.RoutingIndexManager): A manager object to retrieve nodes.
+        routing (ortools.routing.RoutingModel): A routing model.
+        solution (ortools.routing.RoutingSolution): A solution object.
+        vehicle_id (int): The vehicle of the route.
+
+    Returns:
+        list: The nodes of the route."""
+    index = routing.Start(vehicle_id)
+    nodes = [manager.IndexToNode(index)]
+    while not routing.IsEnd(index):
+        index = solution.Value(routing.NextVar(index))
+        nodes.append(manager.IndexToNode(index))
+    return nodes
+
+
+def leg_distances(distance_matrix, nodes):
+    """
+    Computes the distance of each leg of a route from the distance matrix.
+    The distances are the integer costs of the arcs used by the solver.
+
+    Args:
+        distance_matrix (np.ndarray or SparseDistanceModel): The distance matrix of
+            the problem, or any matrix indexable as distance_matrix[i][j].
+        nodes (list): The nodes of the route.
+
+    Returns:
+        np.ndarray: The distance of each leg (one less than the number of nodes)."""
+    if isinstance(distance_matrix, np.ndarray):
+        return distance_matrix[nodes[:-1], nodes[1:]].astype(np.int64)
+    return np.fromiter(
+        (int(distance_matrix[i][j]) for i, j in zip(nodes[:-1], nodes[1:])),
+        dtype=np.int64,
+        count=len(nodes) - 1,
+    )
+
+
+@measure_execution_time
 def adapt_solution(data, manager, routing, solution, coordinates_list):
     """
-    Generates a dictionary with the routing data
+    Generates a dictionary with the routing data.
+
+    The nodes of each route are collected once, and the distances of their legs are
+    taken from the distance matrix. The routes are reported to the logger of this
+    module at the INFO level, so they are only formatted when it is enabled.
 
     Args:
         data (dict): A dictionary with data related to the problem.
@@ -226,52 +395,46 @@ def adapt_solution(data, manager, routing, solution, coordinates_list):
 
     Returns:
         dict: A dictionary containing the routing data."""
-    print(f"Objective: {solution.ObjectiveValue()}")
+    report = logger.isEnabledFor(logging.INFO)
+    if report:
+        logger.info("Objective: %s", solution.ObjectiveValue())
     max_route_time = 0
     routes_dict = {}
     routes_dict["routes"] = {}
-    routes = []
     # Generate a color for each vehicle route
     colors = generate_n_colors(data["n_vehicles"])
     for vehicle_id in range(data["n_vehicles"]):
-        routes_dict["routes"][vehicle_id] = {}
-        index = routing.Start(vehicle_id)
-        plan_output = f"Route for vehicle {vehicle_id}:\n"
-        route_dist = 0
-        nodes = []
-        coordinates = []
-        while not routing.IsEnd(index):
-            node = manager.IndexToNode(index)
-            nodes.append(node)
-            coordinates.append(coordinates_list[node])
-            plan_output += f" {node} -> "
-            previous_index = index
-            index = solution.Value(routing.NextVar(index))
-            route_dist += routing.GetArcCostForVehicle(
-                previous_index, index, vehicle_id
-            )
-        node = manager.IndexToNode(index)
-        nodes.append(node)
-        coordinates.append(coordinates_list[node])
+        nodes = route_nodes(manager, routing, solution, vehicle_id)
+        if len(nodes) == 2:
+            # Unused vehicle (its start goes straight to its end): the solver
+            # does not count the start-end arc, even between different depots
+            route_dist = 0
+        else:
+            route_dist = int(leg_distances(data["distance_matrix"], nodes).sum())
         velocity = data["velocity"][vehicle_id] * 0.2777777778
         route_time = int(route_dist / velocity)
-        route_mins = route_time // 60
-        route_secs = route_time % 60
-        plan_output += f"{manager.IndexToNode(index)}\n"
-        plan_output += f"Time to complete the route: {route_mins}min {route_secs}secs\n"
-        print(plan_output)
+        if report:
+            logger.info(
+                "Route for vehicle %s:\n %s\nTime to complete the route: %smin %ssecs",
+                vehicle_id,
+                " -> ".join(map(str, nodes)),
+                route_time // 60,
+                route_time % 60,
+            )
         max_route_time = max(route_time, max_route_time)
-        routes.append(nodes)
         # Save route information
-        routes_dict["routes"][vehicle_id]["coordinates"] = coordinates
-        routes_dict["routes"][vehicle_id]["nodes"] = nodes
-        routes_dict["routes"][vehicle_id]["time"] = route_time
-        routes_dict["routes"][vehicle_id]["color"] = colors[vehicle_id]
-        routes_dict["routes"][vehicle_id]["velocity"] = velocity
-    max_route_mins = max_route_time // 60
-    max_route_secs = max_route_time % 60
+        routes_dict["routes"][vehicle_id] = {
+            "coordinates": [coordinates_list[node] for node in nodes],
+            "nodes": nodes,
+            "time": route_time,
+            "color": colors[vehicle_id],
+            "velocity": velocity,
+        }
     routes_dict["total_time"] = max_route_time
-    print(
-        f"Time to complete the longest route: {max_route_mins}min {max_route_secs}secs\n"
-    )
+    if report:
+        logger.info(
+            "Time to complete the longest route: %smin %ssecs",
+            max_route_time // 60,
+            max_route_time % 60,
+        )
     return routes_dict
@@ -0,0 +1,497 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+This module contains persistent caches used to avoid repeating expensive computations,
+such as requesting the same distance matrix to the Google Distance Matrix API twice.
+
+Classes:
+- SQLiteLRUCache: Key/value store in a SQLite file with size-based LRU eviction.
+- DistanceMatrixCache: Content-addressed cache of distance matrices.
+- GeocodeCache: In-process LRU of geocoded addresses backed by a persistent store.
+- SolutionCache: Cache of solutions, keyed by a fingerprint of the problem and the solver.
+"""
+
+import os
+import io
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from unidecode import unidecode
+import numpy as np
+from utils.auxiliary import ensure_folder_exist, NumpyJSONEncoder
+
+
+def hash_content(content):
+    """
+    Computes a stable hash of a JSON serializable object.
+
+    Args:
+        content (object): JSON serializable object to be hashed.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest of the canonical JSON representation."""
+    serialized = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def hash_array(array):
+    """
+    Computes a hash of the shape, type and content of an array.
+
+    Args:
+        array (np.ndarray or list): The array to be hashed.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest of the array."""
+    array = np.ascontiguousarray(array)
+    digest = hashlib.sha256(f"{array.shape}{array.dtype.str}".encode("utf-8"))
+    digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+class SQLiteLRUCache:
+    """
+    Persistent key/value cache stored in a SQLite file. When the total size of the
+    stored values exceeds max_bytes, the least recently used entries are evicted.
+
+    Args:
+        file (str): Path of the SQLite file.
+        max_bytes (int): Maximum total size of the stored values in bytes.
+
+    Attributes:
+        file (str): Path of the SQLite file.
+        max_bytes (int): Maximum total size of the stored values in bytes.
+        hits (int): Number of successful lookups since the cache was created.
+        misses (int): Number of failed lookups since the cache was created.
+
+    Methods:
+        get(key): Returns the stored value for key, or None.
+        put(key, value): Stores a value and evicts old entries if needed.
+        stats(): Returns the hit/miss counters and the size of the cache.
+        clear(): Removes all the entries of the cache.
+    """
+
+    def __init__(self, file, max_bytes):
+        """
+        Initializes the cache. The SQLite file is created on first use.
+
+        Args:
+            file (str): Path of the SQLite file.
+            max_bytes (int): Maximum total size of the stored values in bytes.
+
+        Returns:
+            None"""
+        self.file = file
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        """
+        Opens a connection to the SQLite file, creating the table if needed.
+
+        Returns:
+            sqlite3.Connection: The connection to the cache file."""
+        if not self._initialized:
+            folder = os.path.dirname(self.file)
+            if folder:
+                ensure_folder_exist(folder)
+        connection = sqlite3.connect(self.file, timeout=30)
+        if not self._initialized:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, "
+                "value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            connection.commit()
+            self._initialized = True
+        return connection
+
+    def get(self, key):
+        """
+        Returns the value stored for a key and marks it as recently used.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            bytes or None: The stored value, or None if the key is not cached."""
+        with self._lock:
+            connection = self._connect()
+            try:
+                row = connection.execute(
+                    "SELECT value FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                connection.execute(
+                    "UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key)
+                )
+                connection.commit()
+                self.hits += 1
+                return row[0]
+            finally:
+                connection.close()
+
+    def put(self, key, value):
+        """
+        Stores a value and evicts the least recently used entries
+        until the cache fits in max_bytes.
+
+        Args:
+            key (str): The key of the value.
+            value (bytes): The value to be stored.
+
+        Returns:
+            None"""
+        with self._lock:
+            connection = self._connect()
+            try:
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, size, last_access) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, sqlite3.Binary(value), len(value), time.time()),
+                )
+                self._evict(connection)
+                connection.commit()
+            finally:
+                connection.close()
+
+    def _evict(self, connection):
+        """
+        Removes the least recently used entries while the cache exceeds max_bytes.
+
+        Args:
+            connection (sqlite3.Connection): An open connection to the cache file.
+
+        Returns:
+            None"""
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = connection.execute(
+            "SELECT key, size FROM cache ORDER BY last_access ASC"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the size of the cache.
+
+        Returns:
+            dict: A dictionary with the hits, misses, entries and bytes of the cache."""
+        with self._lock:
+            connection = self._connect()
+            try:
+                entries, size = connection.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+                ).fetchone()
+            finally:
+                connection.close()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def clear(self):
+        """
+        Removes all the entries of the cache.
+
+        Returns:
+            None"""
+        with self._lock:
+            connection = self._connect()
+            try:
+                connection.execute("DELETE FROM cache")
+                connection.commit()
+            finally:
+                connection.close()
+
+
+class DistanceMatrixCache(SQLiteLRUCache):
+    """
+    Cache of distance matrices, keyed by a hash of the ordered addresses and the travel mode.
+    Matrices are stored in the NumPy .npy format.
+
+    Methods:
+        make_key(addresses, travel_mode): Computes the key of a distance matrix.
+        get_matrix(addresses, travel_mode): Returns the cached matrix, or None.
+        put_matrix(addresses, travel_mode, distance_matrix): Stores a matrix.
+    """
+
+    @staticmethod
+    def make_key(addresses, travel_mode):
+        """
+        Computes the key of a distance matrix.
+
+        Args:
+            addresses (list): Ordered list of addresses of the matrix.
+            travel_mode (str): Travel mode used to compute the matrix.
+
+        Returns:
+            str: The key of the distance matrix."""
+        return hash_content({"addresses": addresses, "travel_mode": travel_mode})
+
+    def get_matrix(self, addresses, travel_mode):
+        """
+        Returns the cached distance matrix for the addresses and travel mode.
+
+        Args:
+            addresses (list): Ordered list of addresses of the matrix.
+            travel_mode (str): Travel mode used to compute the matrix.
+
+        Returns:
+            np.ndarray or None: The distance matrix, or None if it is not cached."""
+        value = self.get(self.make_key(addresses, travel_mode))
+        if value is None:
+            return None
+        return np.load(io.BytesIO(value), allow_pickle=False)
+
+    def put_matrix(self, addresses, travel_mode, distance_matrix):
+        """
+        Stores the distance matrix of the addresses and travel mode.
+
+        Args:
+            addresses (list): Ordered list of addresses of the matrix.
+            travel_mode (str): Travel mode used to compute the matrix.
+            distance_matrix (list or np.ndarray): The distance matrix.
+
+        Returns:
+            None"""
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(distance_matrix), allow_pickle=False)
+        self.put(self.make_key(addresses, travel_mode), buffer.getvalue())
+
+
+class GeocodeCache(SQLiteLRUCache):
+    """
+    Cache of geocoded addresses, keyed by the normalized address text.
+    The most recently used locations are kept in an in-process LRU in front of
+    the persistent store, so each unique address is geocoded only once.
+
+    Args:
+        file (str): Path of the SQLite file.
+        max_bytes (int): Maximum total size of the persistent store in bytes.
+        max_entries (int, optional): Maximum number of locations kept in memory (default is 4096).
+
+    Methods:
+        normalize(address): Normalizes the text of an address.
+        get_location(address): Returns the cached location of an address, or None.
+        put_location(address, location): Stores the location of an address.
+    """
+
+    def __init__(self, file, max_bytes, max_entries=4096):
+        """
+        Initializes the persistent store and the in-process LRU.
+
+        Args:
+            file (str): Path of the SQLite file.
+            max_bytes (int): Maximum total size of the persistent store in bytes.
+            max_entries (int, optional): Maximum number of locations kept in memory.
+
+        Returns:
+            None"""
+        super().__init__(file, max_bytes)
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+
+    @staticmethod
+    def normalize(address):
+        """
+        Normalizes the text of an address: accents are removed with unidecode,
+        the text is lowercased, and the whitespace is collapsed.
+
+        Args:
+            address (str): The address to normalize.
+
+        Returns:
+            str: The normalized address."""
+        return " ".join(unidecode(address).lower().split())
+
+    def get_location(self, address):
+        """
+        Returns the cached location of an address.
+
+        Args:
+            address (str): The address to look up.
+
+        Returns:
+            dict or None: A dictionary with the "place_id", "lat" and "lng"
+                of the address, or None if it is not cached."""
+        key = self.normalize(address)
+        with self._memory_lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return dict(self._memory[key])
+        value = self.get(key)
+        if value is None:
+            return None
+        location = json.loads(value)
+        self.__remember(key, location)
+        return dict(location)
+
+    def put_location(self, address, location):
+        """
+        Stores the location of an address.
+
+        Args:
+            address (str): The geocoded address.
+            location (dict): A dictionary with the "place_id", "lat" and "lng" of the address.
+
+        Returns:
+            None"""
+        key = self.normalize(address)
+        self.__remember(key, location)
+        self.put(key, json.dumps(location).encode("utf-8"))
+
+    def __remember(self, key, location):
+        """
+        Adds a location to the in-process LRU, evicting the least recently used one if full.
+
+        Args:
+            key (str): The normalized address.
+            location (dict): The location of the address.
+
+        Returns:
+            None"""
+        with self._memory_lock:
+            self._memory[key] = dict(location)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+class SolutionCache(SQLiteLRUCache):
+    """
+    Cache of solutions (the routes returned by adapt_solution), keyed by a fingerprint of
+    the problem definition and the solver configuration, so solving the same problem
+    twice returns the stored routes without running the solver again.
+
+    The travel times by road change over time, so the solutions of the problems with any
+    travel mode but flight expire after road_ttl seconds.
+
+    Args:
+        file (str): Path of the SQLite file.
+        max_bytes (int): Maximum total size of the stored values in bytes.
+        road_ttl (float, optional): Seconds the solutions of the problems with road travel
+            times are reused (default is None, never expire).
+
+    Methods:
+        make_key(problem_data, solver_data, matrix_provided=False):
+            Computes the fingerprint of a problem.
+        get_routes(problem_data, solver_data, matrix_provided=False):
+            Returns the cached routes, or None.
+        put_routes(problem_data, solver_data, routes, matrix_provided=False):
+            Stores the routes of a problem.
+    """
+
+    PROBLEM_KEYS = (
+        "addresses",
+        "n_vehicles",
+        "start_nodes",
+        "end_nodes",
+        "velocity",
+        "max_flight_time",
+        "travel_mode",
+    )
+
+    def __init__(self, file, max_bytes, road_ttl=None):
+        """
+        Initializes the cache. The SQLite file is created on first use.
+
+        Args:
+            file (str): Path of the SQLite file.
+            max_bytes (int): Maximum total size of the stored values in bytes.
+            road_ttl (float, optional): Seconds the solutions of the problems with road
+                travel times are reused (default is None, never expire).
+
+        Returns:
+            None"""
+        super().__init__(file, max_bytes)
+        self.road_ttl = road_ttl
+
+    @classmethod
+    def make_key(cls, problem_data, solver_data, matrix_provided=False):
+        """
+        Computes the fingerprint of a problem: a hash of the canonical JSON of the fields
+        of the problem definition that change its solution, and of the solver configuration.
+        A distance matrix computed from the addresses and the travel mode is not hashed,
+        but a matrix provided with the problem (e.g., by its definition file) is.
+
+        Args:
+            problem_data (dict): A dictionary containing the problem data.
+            solver_data (dict): A dictionary containing the solver configuration.
+            matrix_provided (bool, optional): Whether the distance matrix was provided
+                with the problem instead of computed from its addresses (default is False).
+
+        Returns:
+            str: The key of the solution."""
+        content = {
+            "problem": {key: problem_data.get(key) for key in cls.PROBLEM_KEYS},
+            "solver": solver_data,
+        }
+        if matrix_provided:
+            content["distance_matrix"] = hash_array(problem_data["distance_matrix"])
+        return hash_content(content)
+
+    def get_routes(self, problem_data, solver_data, matrix_provided=False):
+        """
+        Returns the cached routes of a problem, unless they expired.
+
+        Args:
+            problem_data (dict): A dictionary containing the problem data.
+            solver_data (dict): A dictionary containing the solver configuration.
+            matrix_provided (bool, optional): Whether the distance matrix was provided
+                with the problem (default is False).
+
+        Returns:
+            dict or None: The routes, or None if the problem is not cached."""
+        value = self.get(self.make_key(problem_data, solver_data, matrix_provided))
+        if value is None:
+            return None
+        entry = json.loads(value)
+        if "cached_at" not in entry or (
+            self.road_ttl is not None
+            and problem_data.get("travel_mode") != "flight"
+            and time.time() - entry["cached_at"] > self.road_ttl
+        ):
+            return None
+        routes = entry["routes"]
+        # JSON keys are strings, but the vehicle ids of the routes are integers
+        routes["routes"] = {int(k): v for k, v in routes["routes"].items()}
+        return routes
+
+    def put_routes(self, problem_data, solver_data, routes, matrix_provided=False):
+        """
+        Stores the routes of a problem.
+
+        Args:
+            problem_data (dict): A dictionary containing the problem data.
+            solver_data (dict): A dictionary containing the solver configuration.
+            routes (dict): The routes, as returned by adapt_solution.
+            matrix_provided (bool, optional): Whether the distance matrix was provided
+                with the problem (default is False).
+
+        Returns:
+            None"""
+        self.put(
+            self.make_key(problem_data, solver_data, matrix_provided),
+            json.dumps(
+                {"cached_at": time.time(), "routes": routes}, cls=NumpyJSONEncoder
+            ).encode("utf-8"),
+        )
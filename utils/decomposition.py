@@ -0,0 +1,364 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+This module contains a cluster-first, route-second decomposition solver for large problems.
+
+The vehicles are grouped by the position of their depots, and the addresses to visit are
+partitioned into one geographical cluster per group of vehicles, with cluster_size addresses
+on average (each group gets a share proportional to its number of vehicles). Each cluster
+is solved as an independent (and much smaller) routing problem with find_routes in a
+process pool. The routes of the clusters are stitched into a single solution with the
+format returned by adapt_solution. Clusters without solution
+(e.g., too many addresses for the flight time of their vehicles) are repaired by merging
+them with the nearest cluster and solving them again.
+
+Functions:
+- project_coordinates(coordinates): Project coordinates on a plane.
+- group_vehicles(seeds, n_groups, iterations=20): Group points (depots or addresses).
+- partition_problem(problem_data, cluster_size): Partition the vehicles and addresses.
+- cluster_problem(problem_data, cluster): Build the routing problem of one cluster.
+- solve_cluster(sub_problem, routing_data): Solve the routing problem of one cluster.
+- merge_clusters(clusters, index, points): Merge a cluster with the nearest one.
+- find_routes_decomposed(problem_data, routing_data): Solve a problem by decomposition.
+"""
+
+import os
+import math
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils.auxiliary import adapt_solution, generate_n_colors
+from utils.or_tools_method import find_routes
+from utils.problem_definiton import coordinates_to_array, haversine_distance_matrix
+
+logger = logging.getLogger(__name__)
+
+
+def project_coordinates(coordinates):
+    """
+    Projects coordinates on a plane (equirectangular projection), which is accurate enough
+    to group nearby coordinates.
+
+    Args:
+        coordinates (list): List of coordinates (latitude, longitude[, altitude]).
+
+    Returns:
+        np.ndarray: Array of shape (N, 2) with the projected coordinates in degrees of latitude."""
+    array = coordinates_to_array(coordinates)
+    scale = math.cos(math.radians(float(np.mean(array[:, 0]))))
+    return np.stack([array[:, 0], array[:, 1] * scale], axis=1)
+
+
+def group_vehicles(seeds, n_groups, iterations=20):
+    """
+    Groups points (e.g., the depots of the vehicles) with k-means. The number of groups
+    is capped to the number of distinct points, so no group is empty.
+
+    Args:
+        seeds (np.ndarray): Array of shape (V, 2) with the projected points.
+        n_groups (int): Number of groups.
+        iterations (int, optional): Maximum iterations of the k-means (default is 20).
+
+    Returns:
+        list: The list of points of each group (none of them empty)."""
+    n_groups = max(1, min(n_groups, len(np.unique(seeds, axis=0))))
+    # Farthest point initialization (distinct points, as there are enough of them)
+    centers = [seeds[0]]
+    for _ in range(1, n_groups):
+        distances = np.min(
+            np.linalg.norm(seeds[:, None, :] - np.array(centers)[None], axis=2), axis=1
+        )
+        centers.append(seeds[int(np.argmax(distances))])
+    centers = np.array(centers)
+    labels = None
+    for _ in range(iterations):
+        distances = np.linalg.norm(seeds[:, None, :] - centers[None], axis=2)
+        new_labels = np.argmin(distances, axis=1)
+        # An empty group takes the point farthest from its center
+        # among the groups with more than one point
+        for group in range(n_groups):
+            if not np.any(new_labels == group):
+                sizes = np.bincount(new_labels, minlength=n_groups)
+                candidates = np.flatnonzero(sizes[new_labels] > 1)
+                farthest = candidates[
+                    int(np.argmax(distances[candidates, new_labels[candidates]]))
+                ]
+                new_labels[farthest] = group
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        centers = np.array(
+            [seeds[labels == group].mean(axis=0) for group in range(n_groups)]
+        )
+    return [np.flatnonzero(labels == group).tolist() for group in range(n_groups)]
+
+
+def partition_problem(problem_data, cluster_size):
+    """
+    Partitions the vehicles and the addresses to visit into geographical clusters.
+
+    The number of clusters is the number of addresses to visit divided by cluster_size
+    (at most one cluster per vehicle). The vehicles are grouped by the midpoint of their
+    start and end depots, and each address is assigned to the nearest group with capacity
+    left, the capacity of each group being proportional to its number of vehicles. The
+    addresses with the biggest difference between their nearest and second nearest groups
+    are assigned first. When there are fewer distinct depots than clusters (e.g., all
+    the vehicles share one depot), the addresses are grouped instead, and the vehicles
+    are assigned to the groups in turns.
+
+    Args:
+        problem_data (dict): A dictionary containing the problem data.
+        cluster_size (int): Target number of addresses to visit of each cluster.
+
+    Returns:
+        list: The clusters, as dictionaries with the "vehicles" of the group and the
+            "nodes" (addresses to visit) of the cluster."""
+    n_vehicles = problem_data["n_vehicles"]
+    depots = set(problem_data["start_nodes"]) | set(problem_data["end_nodes"])
+    customers = [
+        node for node in range(len(problem_data["addresses"])) if node not in depots
+    ]
+    n_groups = min(n_vehicles, max(1, math.ceil(len(customers) / cluster_size)))
+    points = project_coordinates(problem_data["addresses"])
+    seeds = (
+        points[problem_data["start_nodes"]] + points[problem_data["end_nodes"]]
+    ) / 2
+    if not customers:
+        return [
+            {"vehicles": vehicles, "nodes": []}
+            for vehicles in group_vehicles(seeds, n_groups)
+        ]
+
+    customer_points = points[customers]
+    separate_depots = len(np.unique(seeds, axis=0)) >= n_groups
+    if separate_depots:
+        groups = group_vehicles(seeds, n_groups)
+        centers = np.array([seeds[vehicles].mean(axis=0) for vehicles in groups])
+    else:
+        customer_groups = group_vehicles(customer_points, n_groups)
+        n_groups = len(customer_groups)
+        groups = [list(range(group, n_vehicles, n_groups)) for group in range(n_groups)]
+        centers = np.array(
+            [customer_points[members].mean(axis=0) for members in customer_groups]
+        )
+    capacities = [
+        math.ceil(len(customers) * len(vehicles) / n_vehicles * 1.1)
+        for vehicles in groups
+    ]
+    labels = np.zeros(len(customers), dtype=np.int64)
+    for _ in range(3):
+        distances = np.linalg.norm(customer_points[:, None, :] - centers[None], axis=2)
+        if n_groups > 1:
+            nearest = np.partition(distances, 1, axis=1)
+            regret = nearest[:, 1] - nearest[:, 0]
+        else:
+            regret = np.zeros(len(customers))
+        load = [0] * n_groups
+        for customer in np.argsort(-regret):
+            for group in np.argsort(distances[customer]):
+                if load[group] < capacities[group]:
+                    labels[customer] = group
+                    load[group] += 1
+                    break
+        # Move the centers to the assigned addresses (and the depots of the group,
+        # unless they are shared by all the groups)
+        centers = np.array(
+            [
+                np.vstack(
+                    [customer_points[labels == group]]
+                    + ([seeds[groups[group]]] if separate_depots else [])
+                ).mean(axis=0)
+                if separate_depots or np.any(labels == group)
+                else centers[group]
+                for group in range(n_groups)
+            ]
+        )
+    return [
+        {
+            "vehicles": vehicles,
+            "nodes": [customers[i] for i in np.flatnonzero(labels == group)],
+        }
+        for group, vehicles in enumerate(groups)
+    ]
+
+
+def cluster_problem(problem_data, cluster):
+    """
+    Builds the routing problem of a cluster, with its own node numbering.
+
+    Args:
+        problem_data (dict): A dictionary containing the problem data.
+        cluster (dict): The "vehicles" and "nodes" of the cluster.
+
+    Returns:
+        dict: The problem data of the cluster, with a "nodes" list mapping
+            the nodes of the cluster to the nodes of the whole problem."""
+    vehicles = cluster["vehicles"]
+    nodes = []
+    for vehicle_id in vehicles:
+        for node in (
+            problem_data["start_nodes"][vehicle_id],
+            problem_data["end_nodes"][vehicle_id],
+        ):
+            if node not in nodes:
+                nodes.append(node)
+    nodes += cluster["nodes"]
+    local = {node: i for i, node in enumerate(nodes)}
+    distance_matrix = problem_data.get("distance_matrix")
+    if distance_matrix is None or hasattr(distance_matrix, "neighbours"):
+        # Sparse models (flight mode) are evaluated directly on the coordinates
+        sub_matrix = haversine_distance_matrix(
+            [problem_data["addresses"][node] for node in nodes]
+        )
+    else:
+        sub_matrix = np.asarray(distance_matrix)[np.ix_(nodes, nodes)]
+    return {
+        "nodes": nodes,
+        "addresses": [problem_data["addresses"][node] for node in nodes],
+        "distance_matrix": sub_matrix,
+        "n_vehicles": len(vehicles),
+        "start_nodes": [local[problem_data["start_nodes"][v]] for v in vehicles],
+        "end_nodes": [local[problem_data["end_nodes"][v]] for v in vehicles],
+        "max_flight_time": [problem_data["max_flight_time"][v] for v in vehicles],
+        "velocity": [problem_data["velocity"][v] for v in vehicles],
+    }
+
+
+def solve_cluster(sub_problem, routing_data):
+    """
+    Solves the routing problem of a cluster.
+
+    Args:
+        sub_problem (dict): The problem data of the cluster, as built by cluster_problem.
+        routing_data (dict): A dictionary containing the solver configuration.
+
+    Returns:
+        list: The route of each vehicle of the cluster, as a tuple with the nodes
+            (of the whole problem) and the time in seconds, or None if there is no
+            solution."""
+    if len(sub_problem["nodes"]) == len(
+        set(sub_problem["start_nodes"]) | set(sub_problem["end_nodes"])
+    ):
+        # Nothing to visit: the vehicles are not used
+        return [
+            ([sub_problem["nodes"][start], sub_problem["nodes"][end]], 0)
+            for start, end in zip(sub_problem["start_nodes"], sub_problem["end_nodes"])
+        ]
+    data, manager, routing, solution = find_routes(sub_problem, routing_data)
+    if solution is None:
+        return None
+    routes = adapt_solution(data, manager, routing, solution, sub_problem["addresses"])
+    return [
+        (
+            [sub_problem["nodes"][node] for node in route["nodes"]],
+            route["time"],
+        )
+        for _, route in sorted(routes["routes"].items())
+    ]
+
+
+def merge_clusters(clusters, index, points):
+    """
+    Merges a cluster with the nearest one.
+
+    Args:
+        clusters (list): The clusters, as returned by partition_problem.
+        index (int): Index of the cluster to merge.
+        points (np.ndarray): The projected coordinates of the addresses.
+
+    Returns:
+        int: The index of the merged cluster in the updated list of clusters."""
+
+    def center(cluster):
+        return points[cluster["nodes"]].mean(axis=0) if cluster["nodes"] else None
+
+    cluster = clusters.pop(index)
+    origin = center(cluster)
+    distances = [
+        np.linalg.norm(center(other) - origin)
+        if origin is not None and other["nodes"]
+        else math.inf
+        for other in clusters
+    ]
+    nearest = int(np.argmin(distances))
+    clusters[nearest] = {
+        "vehicles": clusters[nearest]["vehicles"] + cluster["vehicles"],
+        "nodes": clusters[nearest]["nodes"] + cluster["nodes"],
+    }
+    return nearest
+
+
+def find_routes_decomposed(problem_data, routing_data):
+    """
+    Solves a problem by decomposition: the addresses are partitioned into clusters assigned
+    to groups of vehicles, the clusters are solved in parallel processes, and their routes are
+    stitched into one solution. Clusters without solution are merged with the nearest
+    cluster and solved again.
+
+    Args:
+        problem_data (dict): A dictionary containing the problem data.
+        routing_data (dict): The solver configuration, with the "decomposition_cluster_size"
+            and the number of "decomposition_workers" (None for the number of CPUs).
+
+    Returns:
+        dict: The solution with the format returned by adapt_solution, or None if a
+            cluster has no solution even after merging all of them."""
+    cluster_routing_data = {**routing_data, "warm_start": False, "portfolio": None}
+    clusters = partition_problem(problem_data, routing_data["decomposition_cluster_size"])
+    points = project_coordinates(problem_data["addresses"])
+    workers = min(
+        len(clusters), routing_data.get("decomposition_workers") or os.cpu_count()
+    )
+    logger.info(
+        "Decomposition into %s clusters of %s addresses.",
+        len(clusters),
+        [len(cluster["nodes"]) for cluster in clusters],
+    )
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(
+            executor.map(
+                solve_cluster,
+                [cluster_problem(problem_data, cluster) for cluster in clusters],
+                [cluster_routing_data] * len(clusters),
+            )
+        )
+        # Repair the clusters without solution
+        while None in results:
+            if len(clusters) == 1:
+                return None
+            index = results.index(None)
+            results.pop(index)
+            merged = merge_clusters(clusters, index, points)
+            logger.info(
+                "Cluster without solution, merged into a cluster of %s addresses.",
+                len(clusters[merged]["nodes"]),
+            )
+            results[merged] = executor.submit(
+                solve_cluster,
+                cluster_problem(problem_data, clusters[merged]),
+                cluster_routing_data,
+            ).result()
+
+    # Stitch the routes of the clusters
+    vehicle_routes = {}
+    for cluster, routes in zip(clusters, results):
+        for vehicle_id, route in zip(cluster["vehicles"], routes):
+            vehicle_routes[vehicle_id] = route
+    colors = generate_n_colors(problem_data["n_vehicles"])
+    routes_dict = {"routes": {}}
+    max_route_time = 0
+    for vehicle_id in range(problem_data["n_vehicles"]):
+        nodes, route_time = vehicle_routes[vehicle_id]
+        velocity = problem_data["velocity"][vehicle_id] * 0.2777777778
+        max_route_time = max(route_time, max_route_time)
+        routes_dict["routes"][vehicle_id] = {
+            "coordinates": [problem_data["addresses"][node] for node in nodes],
+            "nodes": nodes,
+            "time": route_time,
+            "color": colors[vehicle_id],
+            "velocity": velocity,
+        }
+    routes_dict["total_time"] = max_route_time
+    return routes_dict
@@ -0,0 +1,381 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+This module contains a background job system to solve routing problems.
+
+OR-Tools keeps the Python interpreter locked while it solves, so the solves run in a
+pool of worker processes instead of the web server threads. Each worker reports the
+improving solutions it finds through a queue, which a thread of the web server reads to
+update the state of the job. A job can be cancelled at any time: the search stops and
+the best solution found so far is kept. The problems are solved with solve_problem,
+as by the web app, so a job can also run a portfolio or a decomposition.
+
+The routes of a job are kept in the job: the state of the application is not changed
+from the threads following the jobs.
+
+Functions:
+- run_solve_job(problem_data, routing_data, previous_routes, events, cancel):
+    Solve a problem in a worker process, reporting its progress.
+
+Classes:
+- SolveJob: State of a background solve.
+- SolveJobManager: Pool of worker processes running the solve jobs.
+"""
+
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from utils.auxiliary import adapt_solution
+from utils.solver import solve_problem
+
+
+def run_solve_job(problem_data, routing_data, previous_routes, events, cancel):
+    """
+    Solve a problem in a worker process.
+
+    A "started" event is put in the events queue when the worker starts the job, and
+    each improving solution is put as a "solution" event with its objective and routes
+    (only when a single configuration is solved, see solve_problem). When the search
+    ends, a "finished" event (or a "failed" event if no solution was found) is put
+    in the queue.
+
+    Args:
+        problem_data (dict): A dictionary containing the problem data.
+        routing_data (dict): A dictionary containing the solver configuration.
+        previous_routes (dict): The routes of a previous solution (warm start), or None.
+        events (multiprocessing.Queue): Queue where the progress is reported.
+        cancel (multiprocessing.Event): Event set to stop the search.
+
+    Returns:
+        None"""
+    best_objective = [None]
+
+    def solution_callback(manager, routing, solution):
+        objective = solution.ObjectiveValue()
+        if best_objective[0] is not None and objective >= best_objective[0]:
+            return
+        best_objective[0] = objective
+        routes = adapt_solution(
+            problem_data, manager, routing, solution, problem_data["addresses"]
+        )
+        events.put({"type": "solution", "objective": objective, "routes": routes})
+
+    events.put({"type": "started"})
+    try:
+        routes = solve_problem(
+            problem_data,
+            routing_data,
+            previous_routes,
+            solution_callback=solution_callback,
+            stop=cancel.is_set,
+        )
+        if routes is None:
+            events.put({"type": "failed", "message": "No solution found"})
+            return
+        events.put(
+            {
+                "type": "finished",
+                # The last improving solution (None if the progress is not reported)
+                "objective": best_objective[0],
+                "routes": routes,
+            }
+        )
+    except Exception as error:  # pylint: disable=broad-except
+        events.put({"type": "failed", "message": str(error)})
+
+
+class SolveJob:
+    """
+    State of a background solve.
+
+    Args:
+        problem_data (dict): A dictionary containing the problem data.
+        events (multiprocessing.Queue): Queue where the worker reports the progress.
+        cancel (multiprocessing.Event): Event set to stop the search.
+        on_finished (callable, optional): Function called with the job if it finishes.
+
+    Attributes:
+        id (str): Identifier of the job.
+        status (str): "queued", "running", "finished", "cancelled" or "failed".
+        message (str): Reason of the failure, if any.
+        problem_data (dict): The problem data being solved.
+        solutions (list): Objective and elapsed time of each improving solution.
+        objective (int): Objective of the best solution found, or None.
+        routes (dict): Routes of the best solution found, as returned by adapt_solution.
+        created (float): Time when the job was created.
+        future (concurrent.futures.Future): The future of the worker process.
+        from_cache (bool): Whether the routes were taken from the solution cache.
+
+    Methods:
+        update(**changes): Changes the state of the job.
+        wait(version, timeout): Waits for the job to change.
+        snapshot(routes=True): Returns the state of the job.
+    """
+
+    def __init__(self, problem_data, events, cancel, on_finished=None):
+        """
+        Initializes a queued job.
+
+        Args:
+            problem_data (dict): A dictionary containing the problem data.
+            events (multiprocessing.Queue): Queue where the worker reports the progress.
+            cancel (multiprocessing.Event): Event set to stop the search.
+            on_finished (callable, optional): Function called with the job if it finishes.
+
+        Returns:
+            None"""
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.message = None
+        self.problem_data = problem_data
+        self.solutions = []
+        self.objective = None
+        self.routes = None
+        self.created = time.time()
+        self.future = None
+        self.from_cache = False
+        self.events = events
+        self.cancel = cancel
+        self.on_finished = on_finished
+        self.version = 0
+        self._condition = threading.Condition()
+
+    @property
+    def done(self):
+        """
+        Whether the job has ended.
+
+        Returns:
+            bool: True if the job is finished, cancelled or failed."""
+        return self.status in ("finished", "cancelled", "failed")
+
+    def update(self, **changes):
+        """
+        Changes the state of the job and wakes up the threads waiting for it.
+
+        Args:
+            **changes: The attributes to change.
+
+        Returns:
+            None"""
+        with self._condition:
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._condition.notify_all()
+
+    def wait(self, version, timeout=None):
+        """
+        Waits until the job changes after a version of its state, or it ends.
+
+        Args:
+            version (int): The last version of the state seen by the caller.
+            timeout (float, optional): Maximum time to wait in seconds.
+
+        Returns:
+            int: The current version of the state."""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.version != version or self.done, timeout
+            )
+            return self.version
+
+    def snapshot(self, routes=True):
+        """
+        Returns the state of the job.
+
+        Args:
+            routes (bool, optional): Whether to include the routes of the best solution.
+
+        Returns:
+            dict: The id, status, message, objective and solutions of the job, whether
+                its routes come from the solution cache, and the routes of the best
+                solution if requested."""
+        with self._condition:
+            state = {
+                "job_id": self.id,
+                "status": self.status,
+                "message": self.message,
+                "objective": self.objective,
+                "solutions": list(self.solutions),
+                "from_cache": self.from_cache,
+            }
+            if routes:
+                state["routes"] = self.routes
+            return state
+
+
+class SolveJobManager:
+    """
+    Pool of worker processes running the solve jobs.
+
+    Args:
+        workers (int, optional): Number of worker processes (default is 2).
+        history (int, optional): Number of ended jobs kept (default is 50).
+
+    Methods:
+        submit(problem_data, routing_data, previous_routes=None, on_finished=None):
+            Starts a job.
+        complete(problem_data, routes): Adds a job finished with known routes.
+        get(job_id): Returns a job, or None.
+        cancel(job_id): Cancels a job.
+    """
+
+    def __init__(self, workers=2, history=50):
+        """
+        Initializes the manager. The worker processes are started with the first job.
+
+        Args:
+            workers (int, optional): Number of worker processes.
+            history (int, optional): Number of ended jobs kept.
+
+        Returns:
+            None"""
+        self.workers = workers
+        self.history = history
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._manager = None
+
+    def submit(
+        self, problem_data, routing_data, previous_routes=None, on_finished=None
+    ):
+        """
+        Starts a job solving a problem in a worker process.
+
+        Args:
+            problem_data (dict): A dictionary containing the problem data.
+            routing_data (dict): A dictionary containing the solver configuration.
+            previous_routes (dict, optional): The routes of a previous solution (warm start).
+            on_finished (callable, optional): Function called with the job if it finishes
+                (not if it is cancelled or fails), from the thread following the job.
+
+        Returns:
+            SolveJob: The new job."""
+        with self._lock:
+            if self._executor is None:
+                self._manager = multiprocessing.Manager()
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            job = SolveJob(
+                problem_data,
+                self._manager.Queue(),
+                self._manager.Event(),
+                on_finished,
+            )
+            self.jobs[job.id] = job
+            self.__forget_old_jobs()
+            job.future = self._executor.submit(
+                run_solve_job,
+                problem_data,
+                routing_data,
+                previous_routes,
+                job.events,
+                job.cancel,
+            )
+        threading.Thread(target=self.__follow, args=(job,), daemon=True).start()
+        return job
+
+    def complete(self, problem_data, routes):
+        """
+        Adds a job already finished with known routes (e.g., from the solution cache),
+        without running a worker.
+
+        Args:
+            problem_data (dict): A dictionary containing the problem data.
+            routes (dict): The routes, as returned by adapt_solution.
+
+        Returns:
+            SolveJob: The finished job."""
+        job = SolveJob(problem_data, None, None)
+        job.update(status="finished", routes=routes, from_cache=True)
+        with self._lock:
+            self.jobs[job.id] = job
+            self.__forget_old_jobs()
+        return job
+
+    def get(self, job_id):
+        """
+        Returns a job.
+
+        Args:
+            job_id (str): Identifier of the job.
+
+        Returns:
+            SolveJob: The job, or None if it does not exist."""
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancels a job. A queued job is removed from the queue, and a running job stops
+        its search and keeps the best solution found so far.
+
+        Args:
+            job_id (str): Identifier of the job.
+
+        Returns:
+            SolveJob: The job, or None if it does not exist."""
+        job = self.jobs.get(job_id)
+        if job is None or job.done:
+            return job
+        job.cancel.set()
+        if job.future.cancel():
+            job.update(status="cancelled")
+        return job
+
+    def __follow(self, job):
+        """
+        Reads the progress reported by the worker of a job until it ends.
+
+        Args:
+            job (SolveJob): The job to follow.
+
+        Returns:
+            None"""
+        while not job.done:
+            try:
+                event = job.events.get(timeout=1)
+            except Exception:  # pylint: disable=broad-except
+                # queue.Empty, or the worker never ran (cancelled while queued)
+                if job.future.done() and job.future.exception() is not None:
+                    job.update(status="failed", message=str(job.future.exception()))
+                continue
+            if event["type"] == "started":
+                job.update(status="running")
+            elif event["type"] == "solution":
+                job.update(
+                    status="running",
+                    objective=event["objective"],
+                    routes=event["routes"],
+                    solutions=job.solutions
+                    + [
+                        {
+                            "objective": event["objective"],
+                            "time": time.time() - job.created,
+                        }
+                    ],
+                )
+            elif event["type"] == "finished":
+                job.update(
+                    status="cancelled" if job.cancel.is_set() else "finished",
+                    objective=event["objective"],
+                    routes=event["routes"],
+                )
+            else:
+                job.update(status="failed", message=event["message"])
+        if job.status == "finished" and job.on_finished is not None:
+            job.on_finished(job)
+
+    def __forget_old_jobs(self):
+        """
+        Removes the oldest ended jobs when more than history are kept.
+
+        Returns:
+            None"""
+        ended = [job for job in self.jobs.values() if job.done]
+        for job in sorted(ended, key=lambda job: job.created)[: -self.history or None]:
+            del self.jobs[job.id]
@@ -8,7 +8,7 @@ This module contains loading functions to load .YAML parameters' files.
 
 import os
 from pathlib import Path
-from utils.auxiliary import load_yaml
+from utils.auxiliary import load_yaml_cached
 
 
 def load_problem_definiton(
@@ -25,8 +25,9 @@ def load_problem_definiton(
         problem definition (default is the default YAML file path).
 
     Returns:
-        dict: The loaded problem definition as a dictionary."""
-    return load_yaml(file)
+        dict: The loaded problem definition as a dictionary.
+            The file is only parsed again when it changes."""
+    return load_yaml_cached(file)
 
 
 def load_solver_configuration(
@@ -43,5 +44,6 @@ def load_solver_configuration(
         (default is the path to the solver_configuration.yaml file)
 
     Returns:
-        dict: The loaded configuration as a dictionary"""
-    return load_yaml(file)
+        dict: The loaded configuration as a dictionary.
+            The file is only parsed again when it changes."""
+    return load_yaml_cached(file)
@@ -0,0 +1,149 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+This module contains functions to store distance matrices in memory-mapped files.
+
+Matrices are stored as int32 .npy files named after a hash of the addresses and the
+travel mode, so any process (e.g., several Flask workers) can map the same matrix
+without copying it, and instances bigger than the available RAM can be solved.
+The folder is bounded in size: the least recently used matrix files are deleted
+when it is exceeded (as the entries of the SQLite caches are evicted).
+
+Functions:
+- memmap_matrix_file(folder, addresses, travel_mode): Path of the file of a matrix.
+- open_memmap_matrix(file): Maps an existing matrix file (copy-on-write).
+- create_memmap_matrix(file, size, fill): Creates a matrix file, filling it with a function.
+- store_memmap_matrix(file, distance_matrix): Writes an in-memory matrix to a file.
+- evict_memmap_matrices(folder, max_bytes, keep=None):
+    Deletes the least recently used matrix files.
+"""
+
+import os
+import numpy as np
+from utils.auxiliary import ensure_folder_exist
+from utils.cache import hash_content
+
+
+def memmap_matrix_file(folder, addresses, travel_mode):
+    """
+    Returns the path of the file of a distance matrix, named after the hash
+    of the ordered addresses and the travel mode.
+
+    Args:
+        folder (str): Folder where the matrices are stored.
+        addresses (list): Ordered list of addresses of the matrix.
+        travel_mode (str): Travel mode of the matrix.
+
+    Returns:
+        str: The path of the .npy file of the matrix."""
+    key = hash_content({"addresses": addresses, "travel_mode": travel_mode})
+    return os.path.join(folder, key + ".npy")
+
+
+def open_memmap_matrix(file):
+    """
+    Maps an existing distance matrix file. The mapping is copy-on-write:
+    the matrix can be modified in memory without changing the shared file.
+    The modification time of the file is updated, to mark it as recently used.
+
+    Args:
+        file (str): Path of the .npy file.
+
+    Returns:
+        np.memmap: The memory-mapped distance matrix, or None if the file does not exist."""
+    if not os.path.exists(file):
+        return None
+    try:
+        os.utime(file)
+    except OSError:  # Deleted by another process in the meantime
+        return None
+    return np.load(file, mmap_mode="c")
+
+
+def create_memmap_matrix(file, size, fill):
+    """
+    Creates a distance matrix file of int32 values and maps it.
+
+    The matrix is written to a temporary file by the fill function, which receives the
+    writable memory-mapped array, and then moved to its final path, so other processes
+    never map a partially written matrix.
+
+    Args:
+        file (str): Path of the .npy file.
+        size (int): Number of nodes of the matrix.
+        fill (callable): Function that writes the distances to the array it receives.
+
+    Returns:
+        np.memmap: The memory-mapped distance matrix."""
+    folder = os.path.dirname(file)
+    if folder:
+        ensure_folder_exist(folder)
+    temporary_file = f"{file}.{os.getpid()}.tmp"
+    matrix = np.lib.format.open_memmap(
+        temporary_file, mode="w+", dtype=np.int32, shape=(size, size)
+    )
+    fill(matrix)
+    matrix.flush()
+    del matrix
+    os.replace(temporary_file, file)
+    return open_memmap_matrix(file)
+
+
+def store_memmap_matrix(file, distance_matrix):
+    """
+    Writes an in-memory distance matrix to a file and maps it.
+
+    Args:
+        file (str): Path of the .npy file.
+        distance_matrix (list or np.ndarray): The distance matrix.
+
+    Returns:
+        np.memmap: The memory-mapped distance matrix."""
+    distance_matrix = np.asarray(distance_matrix)
+
+    def fill(matrix):
+        matrix[:] = distance_matrix
+
+    return create_memmap_matrix(file, distance_matrix.shape[0], fill)
+
+
+def evict_memmap_matrices(folder, max_bytes, keep=None):
+    """
+    Deletes the least recently used (oldest modified) matrix files of a folder while
+    their total size exceeds max_bytes. The processes that already mapped a deleted
+    file keep their mapping.
+
+    Args:
+        folder (str): Folder where the matrices are stored.
+        max_bytes (int): Maximum total size of the matrix files in bytes.
+        keep (str, optional): Path of a file that is never deleted, e.g. the matrix
+            in use (default is None).
+
+    Returns:
+        int: The number of deleted files."""
+    if not os.path.isdir(folder):
+        return 0
+    files = []
+    for entry in os.scandir(folder):
+        if entry.is_file() and entry.name.endswith(".npy"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    deleted = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(path)
+        except OSError:  # Already deleted, or still open on Windows
+            continue
+        total -= size
+        deleted += 1
+    return deleted
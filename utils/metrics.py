@@ -0,0 +1,404 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+This module contains a registry of metrics of the stages of the pipeline
+(geocoding, distance matrix tiles and assembly, model build, search, adapt_solution,
+simulation ticks and YAML I/O), rendered in the Prometheus text format.
+
+Each stage is measured with a counter of calls by outcome and a histogram of latencies.
+The metrics are kept in the memory of each process: solves run in worker processes
+(background jobs, portfolio and decomposition) are not recorded by the web server.
+
+Functions:
+- observe_stage(stage, seconds, outcome="ok", registry=None):
+    Record a measured execution of a stage.
+- stage_timer(stage, registry=None): Context manager measuring a stage.
+
+Classes:
+- Counter: Monotonic counter with labels.
+- Histogram: Histogram of observations with labels and cumulative buckets.
+- MetricsRegistry: Set of metrics rendered in the Prometheus text format.
+"""
+
+import time
+import bisect
+import threading
+import contextlib
+
+# Buckets of the latencies in seconds: from a cached geocode to a long search
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+)
+
+
+def format_labels(labelnames, labelvalues, extra=None):
+    """
+    Formats the labels of a sample, e.g. '{stage="search"}'.
+
+    Args:
+        labelnames (tuple): Names of the labels.
+        labelvalues (tuple): Values of the labels.
+        extra (tuple, optional): An additional (name, value) label.
+
+    Returns:
+        str: The formatted labels, or an empty string if there are none."""
+    pairs = list(zip(labelnames, labelvalues))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    labels = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        value = value.replace("\n", "\\n")
+        labels.append(f'{name}="{value}"')
+    return "{" + ",".join(labels) + "}"
+
+
+def format_value(value):
+    """
+    Formats the value of a sample.
+
+    Args:
+        value (float): The value.
+
+    Returns:
+        str: The formatted value."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """
+    Monotonic counter with labels.
+
+    Args:
+        name (str): Name of the metric.
+        documentation (str): Description of the metric.
+        labelnames (tuple, optional): Names of the labels.
+
+    Methods:
+        inc(amount=1, **labels): Increments the counter.
+        value(**labels): Returns the value of the counter.
+        render(): Returns the counter in the Prometheus text format.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Initializes the counter.
+
+        Args:
+            name (str): Name of the metric.
+            documentation (str): Description of the metric.
+            labelnames (tuple, optional): Names of the labels.
+
+        Returns:
+            None"""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """
+        Increments the counter.
+
+        Args:
+            amount (float, optional): Amount to add (default is 1).
+            **labels: Values of the labels.
+
+        Returns:
+            None"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """
+        Returns the value of the counter.
+
+        Args:
+            **labels: Values of the labels.
+
+        Returns:
+            float: The value, 0 if it was never incremented."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        """
+        Returns the counter in the Prometheus text format.
+
+        Returns:
+            list: The lines of the counter."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}{labels} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Histogram of observations with labels and cumulative buckets.
+
+    Args:
+        name (str): Name of the metric.
+        documentation (str): Description of the metric.
+        labelnames (tuple, optional): Names of the labels.
+        buckets (tuple, optional): Upper bounds of the buckets (default is DEFAULT_BUCKETS).
+
+    Methods:
+        observe(value, **labels): Records an observation.
+        count(**labels): Returns the number of observations.
+        render(): Returns the histogram in the Prometheus text format.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Initializes the histogram.
+
+        Args:
+            name (str): Name of the metric.
+            documentation (str): Description of the metric.
+            labelnames (tuple, optional): Names of the labels.
+            buckets (tuple, optional): Upper bounds of the buckets.
+
+        Returns:
+            None"""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per labels: [observations per bucket (the last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        Records an observation.
+
+        Args:
+            value (float): The observed value.
+            **labels: Values of the labels.
+
+        Returns:
+            None"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * (len(self.buckets) + 1), 0.0)
+            )
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        """
+        Returns the number of observations.
+
+        Args:
+            **labels: Values of the labels.
+
+        Returns:
+            int: The number of observations."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            value = self._values.get(key)
+            return sum(value[0]) if value is not None else 0
+
+    def render(self):
+        """
+        Returns the histogram in the Prometheus text format.
+
+        Returns:
+            list: The lines of the histogram."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            values = sorted(
+                (key, (list(counts), total))
+                for key, (counts, total) in self._values.items()
+            )
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = format_labels(
+                    self.labelnames, key, ("le", format_value(bound))
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Set of metrics rendered in the Prometheus text format.
+
+    Methods:
+        counter(name, documentation, labelnames=()): Returns a counter, creating it if needed.
+        histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+            Returns a histogram, creating it if needed.
+        render(): Returns all the metrics in the Prometheus text format.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty registry.
+
+        Returns:
+            None"""
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def __get_or_create(self, kind, name, *args, **kwargs):
+        """
+        Returns a metric, creating it if needed.
+
+        Args:
+            kind (type): Class of the metric.
+            name (str): Name of the metric.
+            *args: Arguments of the class.
+            **kwargs: Keyword arguments of the class.
+
+        Returns:
+            Counter or Histogram: The metric.
+
+        Raises:
+            ValueError: If a metric of another type has the same name."""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = kind(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, kind):
+                raise ValueError(f"Metric {name} is already a {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """
+        Returns a counter, creating it if needed.
+
+        Args:
+            name (str): Name of the metric.
+            documentation (str): Description of the metric.
+            labelnames (tuple, optional): Names of the labels.
+
+        Returns:
+            Counter: The counter."""
+        return self.__get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Returns a histogram, creating it if needed.
+
+        Args:
+            name (str): Name of the metric.
+            documentation (str): Description of the metric.
+            labelnames (tuple, optional): Names of the labels.
+            buckets (tuple, optional): Upper bounds of the buckets.
+
+        Returns:
+            Histogram: The histogram."""
+        return self.__get_or_create(
+            Histogram, name, documentation, labelnames, buckets
+        )
+
+    def render(self):
+        """
+        Returns all the metrics in the Prometheus text format.
+
+        Returns:
+            str: The metrics, one sample per line."""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Registry of the process, exposed by the /metrics endpoint
+default_registry = MetricsRegistry()
+
+
+def observe_stage(stage, seconds, outcome="ok", registry=None):
+    """
+    Record a measured execution of a stage of the pipeline.
+
+    Args:
+        stage (str): Name of the stage, e.g. "search".
+        seconds (float): Duration of the execution.
+        outcome (str, optional): Result of the execution, e.g. "ok", "error",
+            "no_solution", "cache_hit" or "not_found" (default is "ok").
+        registry (MetricsRegistry, optional): Registry where the execution is recorded
+            (default is default_registry).
+
+    Returns:
+        None"""
+    registry = registry or default_registry
+    registry.counter(
+        "vrp_stage_calls_total",
+        "Executions of each stage of the pipeline.",
+        ("stage", "outcome"),
+    ).inc(stage=stage, outcome=outcome)
+    registry.histogram(
+        "vrp_stage_duration_seconds",
+        "Duration of each stage of the pipeline in seconds.",
+        ("stage",),
+    ).observe(seconds, stage=stage)
+
+
+@contextlib.contextmanager
+def stage_timer(stage, registry=None):
+    """
+    Context manager measuring a stage of the pipeline. An execution that raises an
+    exception is recorded with the "error" outcome.
+
+    Args:
+        stage (str): Name of the stage, e.g. "geocode".
+        registry (MetricsRegistry, optional): Registry where the execution is recorded
+            (default is default_registry).
+
+    Returns:
+        None"""
+    start_time = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        observe_stage(stage, time.perf_counter() - start_time, outcome, registry)
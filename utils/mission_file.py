@@ -0,0 +1,179 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+This module contains a compact binary format of the problems and routes (missions),
+stored as columns in a NumPy .npz file.
+
+The addresses are stored once, in a coordinate table of shape (N, 3) (latitude,
+longitude and altitude, NaN when missing). The route of each vehicle is stored as the
+indexes of its nodes in that table: the nodes of all the routes are concatenated
+in "route_nodes", and the route of vehicle v is
+route_nodes[route_offsets[v]:route_offsets[v + 1]]. The time, velocity and color of
+each route are stored in one array each, and the distance matrix is stored once.
+Any other value is stored as JSON in "metadata". The file is read without pickle.
+
+Functions:
+- save_mission_npz(file, problem_data, routes=None, compress=False):
+    Save a problem and its routes to a .npz file.
+- load_mission_npz(file): Load a problem and its routes from a .npz file.
+"""
+
+import json
+import numpy as np
+from utils.auxiliary import NumpyJSONEncoder, measure_execution_time
+from utils.sparse_distances import SparseDistanceModel
+
+FORMAT_VERSION = 1
+
+# Lists of the problem stored as arrays
+PROBLEM_ARRAYS = ["start_nodes", "end_nodes", "max_flight_time", "velocity"]
+
+
+def coordinate_table(addresses):
+    """
+    Builds the coordinate table of the addresses.
+
+    Args:
+        addresses (list): List of addresses, as coordinates or names.
+
+    Returns:
+        tuple: The (N, 3) float array of coordinates (NaN when missing) and
+            the array of names of the addresses ("" for coordinates), or None
+            if all the addresses are coordinates."""
+    table = np.full((len(addresses), 3), np.nan)
+    names = np.full(len(addresses), "", dtype=object)
+    for index, address in enumerate(addresses):
+        if isinstance(address, str):
+            names[index] = address
+        else:
+            table[index, : len(address)] = address[:3]
+    if not names.astype(bool).any():
+        return table, None
+    return table, names.astype(str)
+
+
+def table_addresses(table, names=None):
+    """
+    Rebuilds the addresses from the coordinate table.
+
+    Args:
+        table (np.ndarray): The (N, 3) float array of coordinates.
+        names (np.ndarray, optional): The names of the addresses ("" for coordinates).
+
+    Returns:
+        list: The addresses, with two or three coordinates each, or their name."""
+    addresses = []
+    for index, row in enumerate(table.tolist()):
+        if names is not None and names[index]:
+            addresses.append(str(names[index]))
+        else:
+            addresses.append(row if not np.isnan(row[2]) else row[:2])
+    return addresses
+
+
+@measure_execution_time
+def save_mission_npz(file, problem_data, routes=None, compress=False):
+    """
+    Save a problem and its routes to a .npz file.
+
+    Args:
+        file (str): Path of the .npz file.
+        problem_data (dict): The problem data, with its addresses and optionally
+            its distance matrix (a dense matrix, or a SparseDistanceModel whose
+            number of neighbours is stored to rebuild it).
+        routes (dict, optional): The routes, as returned by adapt_solution.
+        compress (bool, optional): Whether to compress the arrays (default is False).
+
+    Returns:
+        None"""
+    table, names = coordinate_table(problem_data["addresses"])
+    arrays = {"format_version": np.array(FORMAT_VERSION), "coordinates": table}
+    if names is not None:
+        arrays["address_names"] = names
+    for name in PROBLEM_ARRAYS:
+        if name in problem_data:
+            arrays[name] = np.asarray(problem_data[name])
+    matrix = problem_data.get("distance_matrix")
+    if isinstance(matrix, SparseDistanceModel):
+        arrays["sparse_neighbours"] = np.array(matrix.k)
+    elif matrix is not None:
+        arrays["distance_matrix"] = np.asarray(matrix)
+    metadata = {
+        "problem": {
+            key: value
+            for key, value in problem_data.items()
+            if key not in PROBLEM_ARRAYS + ["addresses", "distance_matrix"]
+        }
+    }
+    if routes is not None:
+        vehicles = sorted(routes["routes"], key=int)
+        nodes = [routes["routes"][vehicle]["nodes"] for vehicle in vehicles]
+        arrays["route_vehicles"] = np.array(vehicles, dtype=np.int64)
+        arrays["route_offsets"] = np.concatenate(
+            [[0], np.cumsum([len(route) for route in nodes])]
+        ).astype(np.int64)
+        arrays["route_nodes"] = np.fromiter(
+            (node for route in nodes for node in route),
+            dtype=np.int32,
+            count=int(arrays["route_offsets"][-1]),
+        )
+        for column in ["time", "velocity", "color"]:
+            arrays["route_" + column] = np.array(
+                [routes["routes"][vehicle][column] for vehicle in vehicles]
+            )
+        metadata["routes"] = {
+            key: value for key, value in routes.items() if key != "routes"
+        }
+    arrays["metadata"] = np.array(json.dumps(metadata, cls=NumpyJSONEncoder))
+    (np.savez_compressed if compress else np.savez)(file, **arrays)
+
+
+@measure_execution_time
+def load_mission_npz(file):
+    """
+    Load a problem and its routes from a .npz file written by save_mission_npz.
+
+    Args:
+        file (str): Path of the .npz file.
+
+    Returns:
+        tuple: The problem data, and the routes in the format of adapt_solution
+            (None if the file has no routes).
+
+    Raises:
+        ValueError: If the file has an unknown format version."""
+    with np.load(file, allow_pickle=False) as arrays:
+        if int(arrays["format_version"]) != FORMAT_VERSION:
+            raise ValueError(f"Unknown mission format {int(arrays['format_version'])}")
+        metadata = json.loads(str(arrays["metadata"]))
+        addresses = table_addresses(
+            arrays["coordinates"],
+            arrays["address_names"] if "address_names" in arrays else None,
+        )
+        problem_data = {**metadata["problem"], "addresses": addresses}
+        for name in PROBLEM_ARRAYS:
+            if name in arrays:
+                problem_data[name] = arrays[name].tolist()
+        if "distance_matrix" in arrays:
+            problem_data["distance_matrix"] = arrays["distance_matrix"]
+        elif "sparse_neighbours" in arrays:
+            problem_data["distance_matrix"] = SparseDistanceModel(
+                addresses, int(arrays["sparse_neighbours"])
+            )
+        if "route_nodes" not in arrays:
+            return problem_data, None
+        offsets = arrays["route_offsets"].tolist()
+        route_nodes = arrays["route_nodes"].tolist()
+        routes = {**metadata["routes"], "routes": {}}
+        for index, vehicle in enumerate(arrays["route_vehicles"].tolist()):
+            nodes = route_nodes[offsets[index] : offsets[index + 1]]
+            routes["routes"][vehicle] = {
+                "coordinates": [addresses[node] for node in nodes],
+                "nodes": nodes,
+                "time": int(arrays["route_time"][index]),
+                "color": str(arrays["route_color"][index]),
+                "velocity": float(arrays["route_velocity"][index]),
+            }
+    return problem_data, routes
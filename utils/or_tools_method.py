@@ -4,40 +4,317 @@ AGPL-3.0 License
 Author: Francisco Javier Gañán
 
 This module contains a function for finding routes using the Google OR-Tools library.
+If no solution is found with the successors of each node restricted to its nearest
+neighbours, the problem is solved again without the restriction. Each attempt is
+measured as a solve_routing_model stage.
 
 The 'find_routes' function takes in problem data and routing data and utilizes the OR-Tools library
 to compute optimal routes for vehicles based on the provided problem data and routing constraints.
+
+Dense distance matrices are validated and converted once and registered with the native
+matrix-based transit API, so no Python code runs when the solver evaluates an arc.
+Memory-mapped matrices are read by a transit callback instead, as registering them would
+copy the whole matrix to memory.
+
+The search can be warm-started from the routes of a previous solution, so small changes
+of the problem (e.g., a new address or a different velocity) do not require a cold solve.
+The objective of the improving solutions is recorded over time, and the search can stop
+when it does not improve enough over a sliding window (plateau).
 """
 
+import time
+import bisect
+import logging
+import numpy as np
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 from utils.auxiliary import measure_execution_time
+from utils.metrics import observe_stage
 
+logger = logging.getLogger(__name__)
 
-@measure_execution_time
-def find_routes(problem_data, routing_data):
+
+def restrict_to_neighbours(neighbours, problem_data, manager, routing):
     """
-    Find routes using a given problem data and routing data.
+    Restrict the domain of the NextVar of each node to its nearest neighbours, the nodes
+    that have it as a neighbour, and the end depots of the vehicles (so any route can
+    finish after any node).
+
+    Args:
+        neighbours (np.ndarray): The (N, k) array of neighbour nodes of each node.
+        problem_data (dict): A dictionary containing the problem data.
+        manager (ortools.routing.RoutingIndexManager): A manager object to retrieve nodes.
+        routing (ortools.routing.RoutingModel): A routing model.
+
+    Returns:
+        None"""
+    depot_nodes = set(problem_data["start_nodes"]) | set(problem_data["end_nodes"])
+    end_indexes = [routing.End(v) for v in range(problem_data["n_vehicles"])]
+    adjacency = [set(row) for row in neighbours.tolist()]
+    for node, row in enumerate(neighbours.tolist()):
+        for neighbour in row:
+            adjacency[neighbour].add(node)
+    for index in range(routing.Size()):
+        successors = [
+            manager.NodeToIndex(neighbour)
+            for neighbour in adjacency[manager.IndexToNode(index)]
+            if neighbour not in depot_nodes
+        ]
+        routing.NextVar(index).SetValues(successors + end_indexes)
 
-    This function takes in problem data and routing data and
-    uses them to find routes using the Google OR-Tools library.
+
+class CurrentSolution:
+    """
+    Solution of a running search, with the methods of an Assignment used by adapt_solution,
+    so the solutions found during the search can be reported.
 
     Args:
-        problem_data (dict): A dictionary containing the problem data, including the distance
-            matrix, number of vehicles, start nodes, end nodes, max flight time, and velocity.
-        routing_data (dict): A dictionary containing the routing data, including the first
-            solution strategy, local search strategy, solution limit, time limit,
-            log search flag, and LNS time limit.
+        routing (ortools.routing.RoutingModel): The routing model being solved.
+    """
+
+    def __init__(self, routing):
+        self.routing = routing
+
+    def Value(self, variable):  # pylint: disable=invalid-name
+        """
+        Returns the value of a variable in the current solution.
+
+        Args:
+            variable (ortools.constraint_solver.IntVar): A variable of the model.
+
+        Returns:
+            int: The value of the variable."""
+        return variable.Value()
+
+    def ObjectiveValue(self):  # pylint: disable=invalid-name
+        """
+        Returns the objective of the current solution.
+
+        Returns:
+            int: The cost of the current solution."""
+        return self.routing.CostVar().Max()
+
+
+class ThrottledCheck:
+    """
+    Check evaluated at most once every interval seconds. OR-Tools calls the checks of a
+    CustomLimit on every step of the search, so between evaluations the last result
+    is returned. Once the check is True, it stays True.
+
+    Args:
+        check (callable): Function returning whether the search should stop.
+        interval (float, optional): Minimum seconds between evaluations (default is 0.1).
+    """
+
+    def __init__(self, check, interval=0.1):
+        self.check = check
+        self.interval = interval
+        self.result = False
+        self.next_time = 0.0
+
+    def __call__(self):
+        if self.result:
+            return True
+        now = time.monotonic()
+        if now >= self.next_time:
+            self.next_time = now + self.interval
+            self.result = bool(self.check())
+        return self.result
+
+
+class SearchTelemetry:
+    """
+    Records the objective of the improving solutions of a search over time, and detects
+    when the search reaches a plateau: when the relative improvement of the objective
+    over the last window seconds is not bigger than epsilon.
+
+    Args:
+        routing (ortools.routing.RoutingModel): The routing model being solved.
+        window (float, optional): Length in seconds of the sliding window (None to never stop).
+        epsilon (float, optional): Minimum relative improvement over the window (default is 0).
+        trace (list, optional): List where the (seconds, objective) of each improving
+            solution are appended (default is a new list).
+
+    Attributes:
+        trace (list): The (seconds since the start of the search, objective) of each
+            improving solution.
+
+    Methods:
+        on_solution(): Records the objective of the current solution.
+        plateau(): Returns whether the search reached a plateau.
+    """
+
+    def __init__(self, routing, window=None, epsilon=0.0, trace=None):
+        self.routing = routing
+        self.window = window
+        self.epsilon = epsilon
+        self.trace = trace if trace is not None else []
+        # Seconds of the trace, to find the objective window seconds ago by bisection
+        self._times = [seconds for seconds, _ in self.trace]
+        self.start_time = time.perf_counter()
+
+    def on_solution(self):
+        """
+        Records the objective of the current solution if it improves the last one.
+
+        Returns:
+            None"""
+        objective = self.routing.CostVar().Max()
+        if self.trace and objective >= self.trace[-1][1]:
+            return
+        seconds = round(time.perf_counter() - self.start_time, 3)
+        self.trace.append((seconds, objective))
+        self._times.append(seconds)
+
+    def plateau(self):
+        """
+        Returns whether the objective improved less than epsilon (relative to the objective
+        window seconds ago) during the last window seconds. The search checks it through
+        a ThrottledCheck, so it is evaluated at most every 100 ms.
+
+        Returns:
+            bool: True if the search should stop."""
+        if not self.window or not self.trace:
+            return False
+        elapsed = time.perf_counter() - self.start_time
+        if elapsed - self._times[0] < self.window:
+            return False
+        # Last improving solution found at least window seconds ago
+        index = bisect.bisect_right(self._times, elapsed - self.window) - 1
+        reference = self.trace[index][1]
+        return reference - self.trace[-1][1] <= self.epsilon * abs(reference)
+
+
+def coordinates_key(coordinates):
+    """
+    Returns a hashable key of the latitude and longitude of a coordinate.
+
+    Args:
+        coordinates (list): The coordinate (latitude, longitude[, altitude]).
+
+    Returns:
+        tuple: The rounded latitude and longitude."""
+    return (round(float(coordinates[0]), 7), round(float(coordinates[1]), 7))
+
+
+def warm_start_routes(previous_routes, problem_data):
+    """
+    Converts the routes of a previous solution into initial routes of the current problem.
+
+    The nodes of the previous routes are remapped through their coordinates, as the indexes
+    of the addresses shift when an address is deleted. Nodes that no longer exist or that
+    are now depots are dropped, and the nodes that are not in any route are inserted where
+    they increase the distance the least (cheapest insertion).
+
+    Args:
+        previous_routes (dict): The "routes" of the previous solution, as returned by
+            adapt_solution, with the "coordinates" and "nodes" of each vehicle.
+        problem_data (dict): A dictionary containing the current problem data.
+
+    Returns:
+        list: The list of nodes visited by each vehicle, without its start and end depots."""
+    distance_matrix = problem_data["distance_matrix"]
+    new_nodes = {}
+    for node, address in enumerate(problem_data["addresses"]):
+        new_nodes.setdefault(coordinates_key(address), node)
+    depot_nodes = set(problem_data["start_nodes"]) | set(problem_data["end_nodes"])
+    routes = [[] for _ in range(problem_data["n_vehicles"])]
+    visited = set()
+    for vehicle_id, route in previous_routes.items():
+        vehicle_id = int(vehicle_id)
+        if vehicle_id >= problem_data["n_vehicles"]:
+            continue
+        # The first and last coordinates are the depots of the vehicle
+        for coordinates in route["coordinates"][1:-1]:
+            node = new_nodes.get(coordinates_key(coordinates))
+            if node is None or node in depot_nodes or node in visited:
+                continue
+            routes[vehicle_id].append(node)
+            visited.add(node)
+
+    # Cheapest insertion of the nodes that are not in the previous routes
+    for node in range(len(problem_data["addresses"])):
+        if node in depot_nodes or node in visited:
+            continue
+        best = None
+        for vehicle_id, route in enumerate(routes):
+            path = (
+                [problem_data["start_nodes"][vehicle_id]]
+                + route
+                + [problem_data["end_nodes"][vehicle_id]]
+            )
+            for position in range(len(path) - 1):
+                cost = (
+                    distance_matrix[path[position]][node]
+                    + distance_matrix[node][path[position + 1]]
+                    - distance_matrix[path[position]][path[position + 1]]
+                )
+                if best is None or cost < best[0]:
+                    best = (cost, vehicle_id, position)
+        routes[best[1]].insert(best[2], node)
+        visited.add(node)
+    return routes
+
+
+def transit_matrix(distance_matrix):
+    """
+    Validates a dense distance matrix and converts it to integers once.
+
+    Args:
+        distance_matrix (list of lists or np.ndarray): The distance matrix.
+
+    Returns:
+        np.ndarray: The square matrix of int64 distances. Integer NumPy matrices
+            (e.g., memory-mapped, which stay a np.memmap) are returned without a copy.
+
+    Raises:
+        ValueError: If the matrix is not square, or has negative or non-finite values."""
+    matrix = np.asanyarray(distance_matrix)
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError(f"The distance matrix must be square, not {matrix.shape}")
+    if not np.issubdtype(matrix.dtype, np.integer):
+        if not np.isfinite(matrix).all():
+            raise ValueError("The distance matrix has non-finite values")
+        matrix = matrix.astype(np.int64)
+    if matrix.size and matrix.min() < 0:
+        raise ValueError("The distance matrix has negative values")
+    return matrix
+
+
+@measure_execution_time
+def solve_routing_model(
+    problem_data,
+    routing_data,
+    previous_routes=None,
+    solution_callback=None,
+    stop=None,
+    timings=None,
+    trace=None,
+):
+    """
+    Builds the routing model of a problem and solves it once, with the arguments
+    of find_routes.
+
+    Args:
+        problem_data (dict): A dictionary containing the problem data.
+        routing_data (dict): A dictionary containing the routing data.
+        previous_routes (dict, optional): The "routes" of a previous solution.
+        solution_callback (callable, optional): Function called at each solution.
+        stop (callable, optional): Function polled during the search.
+        timings (dict, optional): Dictionary where the seconds spent are stored.
+        trace (list, optional): List where the objective of the search is appended.
 
     Returns:
         tuple: A tuple containing the problem data, routing index manager,
             routing model, and the solution to the routing problem.
     """
-    for i in range(len(problem_data["distance_matrix"])):
-        for j in range(len(problem_data["distance_matrix"][i])):
-            problem_data["distance_matrix"][i][j] = int(
-                problem_data["distance_matrix"][i][j]
-            )
+    start_time = time.perf_counter()
+    sparse = hasattr(problem_data["distance_matrix"], "neighbours")
+    # A memory-mapped matrix is read by a callback, instead of copied to the solver
+    memmapped = isinstance(problem_data["distance_matrix"], np.memmap)
+    if not sparse:
+        # Validated and converted once, instead of casting each arc
+        problem_data["distance_matrix"] = transit_matrix(problem_data["distance_matrix"])
 
     # Create the routing index manager
     manager = pywrapcp.RoutingIndexManager(
@@ -49,17 +326,31 @@ def find_routes(problem_data, routing_data):
     # Create Routing Model
     routing = pywrapcp.RoutingModel(manager)
 
-    # Create and register a transit callback
-    def distance_callback(from_index, to_index):
-        """
-        Returns the distance between the two nodes
-        """
-        # Convert from routing variable Index to distance matrix NodeIndex
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return problem_data["distance_matrix"][from_node][to_node]
+    if (
+        not sparse
+        and not memmapped
+        and routing_data.get("native_transit_matrix", True)
+    ):
+        # Register the matrix in the solver (evaluated in C++)
+        transit_callback_index = routing.RegisterTransitMatrix(
+            problem_data["distance_matrix"].tolist()
+        )
+    else:
+        # Create and register a transit callback
+        distance_matrix = problem_data["distance_matrix"]
 
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
+        def distance_callback(from_index, to_index):
+            """
+            Returns the distance between the two nodes
+            """
+            # Convert from routing variable Index to distance matrix NodeIndex
+            from_node = manager.IndexToNode(from_index)
+            to_node = manager.IndexToNode(to_index)
+            if sparse:
+                return distance_matrix.distance(from_node, to_node)
+            return int(distance_matrix[from_node, to_node])
+
+        transit_callback_index = routing.RegisterTransitCallback(distance_callback)
 
     # Define cost of each arc
     routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
@@ -81,6 +372,12 @@ def find_routes(problem_data, routing_data):
         max(problem_data["max_flight_time"]) * 60
     )
 
+    # Restrict the successors of each node to its nearest neighbours
+    if routing_data.get("restrict_to_neighbours") and sparse:
+        restrict_to_neighbours(
+            problem_data["distance_matrix"].neighbours, problem_data, manager, routing
+        )
+
     # Setting first solution heuristic
     search_parameters = pywrapcp.DefaultRoutingSearchParameters()
     strategy_value = getattr(
@@ -99,16 +396,124 @@ def find_routes(problem_data, routing_data):
     if routing_data["solution_limit"] is not None:
         search_parameters.solution_limit = routing_data["solution_limit"]
     if routing_data["time_limit"] is not None:
-        search_parameters.time_limit.seconds = routing_data["time_limit"]
+        search_parameters.time_limit.FromMilliseconds(
+            int(routing_data["time_limit"] * 1000)
+        )
     if routing_data["log_search"] is not None:
         search_parameters.log_search = routing_data["log_search"]
     if routing_data["lns_time_limit"] is not None:
         search_parameters.lns_time_limit.seconds = routing_data["lns_time_limit"]
 
+    # Report the solutions found and stop the search on demand
+    if solution_callback is not None:
+        routing.AddAtSolutionCallback(
+            lambda: solution_callback(manager, routing, CurrentSolution(routing))
+        )
+    # Record the objective over time, and stop the search when it reaches a plateau
+    telemetry = SearchTelemetry(
+        routing,
+        routing_data.get("plateau_window"),
+        routing_data.get("plateau_epsilon") or 0.0,
+        trace,
+    )
+    if trace is not None or telemetry.window:
+        routing.AddAtSolutionCallback(telemetry.on_solution)
+    if stop is not None or telemetry.window:
+        routing.AddSearchMonitor(
+            routing.solver().CustomLimit(
+                # The stop check may be an IPC call (e.g., a Manager Event of a job)
+                ThrottledCheck(
+                    lambda: (stop is not None and stop()) or telemetry.plateau()
+                )
+            )
+        )
+
     # Solve the problem and return the solution
+    routing.CloseModelWithParameters(search_parameters)
+    solve_time = telemetry.start_time = time.perf_counter()
+    solution = None
+    if routing_data.get("warm_start") and previous_routes:
+        initial_routes = [
+            [manager.NodeToIndex(node) for node in route]
+            for route in warm_start_routes(previous_routes, problem_data)
+        ]
+        initial_solution = routing.ReadAssignmentFromRoutes(initial_routes, True)
+        if initial_solution is not None:
+            solution = routing.SolveFromAssignmentWithParameters(
+                initial_solution, search_parameters
+            )
+        if solution is None:
+            logger.warning(
+                "The previous routes are not a valid start, solving from scratch."
+            )
+    if solution is None:
+        solution = routing.SolveWithParameters(search_parameters)
+    end_time = time.perf_counter()
+    observe_stage("model_build", solve_time - start_time)
+    observe_stage(
+        "search",
+        end_time - solve_time,
+        "ok" if solution is not None else "no_solution",
+    )
+    if timings is not None:
+        timings["model"] = solve_time - start_time
+        timings["solve"] = end_time - solve_time
     return (
         problem_data,
         manager,
         routing,
-        routing.SolveWithParameters(search_parameters),
+        solution,
     )
+
+
+@measure_execution_time
+def find_routes(
+    problem_data,
+    routing_data,
+    previous_routes=None,
+    solution_callback=None,
+    stop=None,
+    timings=None,
+    trace=None,
+):
+    """
+    Find routes using a given problem data and routing data.
+
+    This function takes in problem data and routing data and
+    uses them to find routes using the Google OR-Tools library.
+
+    Args:
+        problem_data (dict): A dictionary containing the problem data, including the distance
+            matrix (a list of lists, a NumPy array, e.g. memory-mapped, or a SparseDistanceModel),
+            number of vehicles, start nodes, end nodes, max flight time, and velocity.
+        routing_data (dict): A dictionary containing the routing data, including the first
+            solution strategy, local search strategy, solution limit, time limit,
+            log search flag, LNS time limit, whether to restrict the successors
+            of each node to its nearest neighbours (only for a SparseDistanceModel),
+            whether to register dense matrices (not memory-mapped) with the native
+            transit API, and whether to warm-start the search from the previous routes.
+        previous_routes (dict, optional): The "routes" of a previous solution, as returned
+            by adapt_solution, used as initial solution if warm_start is enabled.
+        solution_callback (callable, optional): Function called with the manager, the routing
+            model and a CurrentSolution each time the search finds a solution.
+        stop (callable, optional): Function polled during the search. When it returns True,
+            the search stops and the best solution found so far is returned.
+        timings (dict, optional): Dictionary where the seconds spent building the model
+            ("model") and searching the solution ("solve") are stored.
+        trace (list, optional): List where the (seconds, objective) of each improving
+            solution of the search are appended.
+
+    Returns:
+        tuple: A tuple containing the problem data, routing index manager,
+            routing model, and the solution to the routing problem.
+    """
+    arguments = (previous_routes, solution_callback, stop, timings, trace)
+    result = solve_routing_model(problem_data, routing_data, *arguments)
+    if result[3] is None and routing_data.get("restrict_to_neighbours"):
+        logger.warning(
+            "No solution with the neighbours restriction, solving without it."
+        )
+        result = solve_routing_model(
+            problem_data, {**routing_data, "restrict_to_neighbours": False}, *arguments
+        )
+    return result
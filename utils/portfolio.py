@@ -0,0 +1,140 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+This module contains a portfolio solver that runs several solver configurations in parallel.
+
+Each configuration (a first solution strategy and a local search strategy) is solved with
+find_routes in its own process, all of them sharing the same wall-clock budget (the
+time_limit of the solver configuration). The best solution is returned together with
+the objective and the execution time of every configuration.
+
+Functions:
+- solve_configuration(problem_data, routing_data, deadline, previous_routes=None):
+    Solve the problem with one configuration (run in a worker process).
+- find_routes_portfolio(problem_data, routing_data, previous_routes=None):
+    Solve the problem with all the configurations of the portfolio and keep the best one.
+"""
+
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from utils.auxiliary import adapt_solution
+from utils.or_tools_method import find_routes
+
+logger = logging.getLogger(__name__)
+
+
+def solve_configuration(problem_data, routing_data, deadline, previous_routes=None):
+    """
+    Solve the problem with one configuration of the portfolio.
+
+    The routing model can not be sent back from a worker process, so the solution is
+    returned already converted by adapt_solution.
+
+    Args:
+        problem_data (dict): A dictionary containing the problem data.
+        routing_data (dict): The solver configuration, with the strategies to be used.
+        deadline (float): Time (as returned by time.time()) when the budget runs out.
+        previous_routes (dict, optional): The routes of a previous solution (warm start).
+
+    Returns:
+        dict: A dictionary with the strategies, the objective (None if no solution
+            was found), the execution time in seconds, the (seconds, objective) of the
+            improving solutions, and the adapted solution."""
+    result = {
+        "first_solution_strategy": routing_data["first_solution_strategy"],
+        "local_search_strategy": routing_data["local_search_strategy"],
+        "objective": None,
+        "time": 0.0,
+        "objective_trace": [],
+        "solution": None,
+    }
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        # Queued until the budget ran out
+        return result
+    start_time = time.perf_counter()
+    trace = []
+    data, manager, routing, solution = find_routes(
+        problem_data,
+        {**routing_data, "time_limit": remaining},
+        previous_routes,
+        trace=trace,
+    )
+    result["objective_trace"] = trace
+    if solution is not None:
+        result["objective"] = solution.ObjectiveValue()
+        result["solution"] = adapt_solution(
+            data, manager, routing, solution, problem_data["addresses"]
+        )
+    result["time"] = time.perf_counter() - start_time
+    return result
+
+
+def find_routes_portfolio(problem_data, routing_data, previous_routes=None):
+    """
+    Solve the problem with every configuration of the portfolio in a process pool.
+
+    The configurations share the time_limit of the solver configuration as wall-clock budget:
+    configurations that wait for a free process only get the time left.
+
+    Args:
+        problem_data (dict): A dictionary containing the problem data.
+        routing_data (dict): The solver configuration. Its "portfolio" is a list of
+            [first_solution_strategy, local_search_strategy] pairs, and "portfolio_workers"
+            the number of processes (None for the number of CPUs).
+        previous_routes (dict, optional): The routes of a previous solution (warm start).
+
+    Returns:
+        dict: The solution of the best configuration, as returned by adapt_solution, with
+            a "portfolio" list reporting the strategies, objective, time and objective
+            trace of each configuration. None if no configuration found a solution.
+
+    Raises:
+        ValueError: If the solver configuration has no time_limit."""
+    if routing_data["time_limit"] is None:
+        raise ValueError("A time_limit is required to solve a portfolio")
+    configurations = [
+        {
+            **routing_data,
+            "first_solution_strategy": first_solution_strategy,
+            "local_search_strategy": local_search_strategy,
+        }
+        for first_solution_strategy, local_search_strategy in routing_data["portfolio"]
+    ]
+    workers = min(
+        len(configurations), routing_data.get("portfolio_workers") or os.cpu_count()
+    )
+    deadline = time.time() + routing_data["time_limit"]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                solve_configuration, problem_data, configuration, deadline, previous_routes
+            )
+            for configuration in configurations
+        ]
+        results = [future.result() for future in futures]
+
+    report = []
+    best = None
+    for result in results:
+        logger.debug(
+            "%s + %s: objective %s in %.2fs",
+            result["first_solution_strategy"],
+            result["local_search_strategy"],
+            result["objective"],
+            result["time"],
+        )
+        if result["objective"] is not None and (
+            best is None or result["objective"] < best["objective"]
+        ):
+            best = result
+        report.append({k: v for k, v in result.items() if k != "solution"})
+    if best is None:
+        return None
+    solution = best["solution"]
+    solution["portfolio"] = report
+    return solution
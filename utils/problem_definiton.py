@@ -10,25 +10,310 @@ distance matrices using Google Maps APIs.
 Functions:
 - calculate_haversine_distance(c1, c2): 
     Calculate distance between two coordinates using the haversine formula.
+- haversine_distances(origins, destinations, dtype=np.int32, block_size=1024, out=None):
+    Compute the haversine distances from origins to destinations in row blocks with NumPy.
+- haversine_distance_matrix(coordinates, dtype=np.int32, block_size=1024, out=None):
+    Compute the full haversine distance matrix in row blocks with NumPy.
 - generate_flight_distance_matrix(coordinates): 
     Create a distance matrix using the haversine formula for flight distances.
+- plan_distance_matrix_tiles(num_origins, num_destinations, max_origins=25,
+    max_destinations=25, max_elements=100, square=False, symmetric=False):
+        Plan the requests needed to fill a distance matrix within the provider's limits.
+- generate_distance_submatrix(origins, destinations, api_key, geocode_api_url,
+    distance_matrix_api_url, mode="walking", ...):
+        Generate the distances from origins to destinations using the Distance Matrix API.
 - generate_distance_matrix(addresses, api_key, geocode_api_url,
-    distance_matrix_api_url, mode="walking", max_elements=10): 
+    distance_matrix_api_url, mode="walking", symmetric=False, ...): 
         Generate a distance matrix of specified addresses using the Distance Matrix API.
+- geocode_address(address, api_key, geocode_api_url, geocode_cache=None, http_client=None):
+    Geocode an address, reusing the cached location if available.
 - detect_address_format(address): Detect the format of an address based on its structure.
+- normalize_address(address): Normalize an address before its conversion to coordinates.
 
 Classes:
+- HTTPClient: Pooled keep-alive HTTP client shared by all the requests to the Google APIs.
+- TilePlan: Plan of the requests needed to fill a distance matrix.
+- OverQueryLimitError: Raised when the Distance Matrix API query quota is exceeded.
+- TokenBucket: Token bucket to limit the rate of an operation.
+- RateLimiter: Limits the requests and elements per second sent to the Distance Matrix API.
 - AddressFormatConversion: Converts addresses from one format to coordinates and vice versa.
 - DistanceMatrixRequest: 
     Represents a request to the Distance Matrix API for distance and duration between addresses.
+- IncrementalDistanceMatrix:
+    Keeps a distance matrix up to date when single addresses are added, changed or deleted.
 
 Note: API keys and API URLs are required for accessing geocoding and distance matrix services.
 """
 import json
+import gzip
 import math
-import urllib.request
+import time
+import random
+import logging
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
 from unidecode import unidecode
 import numpy as np
+from utils.metrics import observe_stage, stage_timer
+from utils.matrix_storage import create_memmap_matrix, memmap_matrix_file
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClient:
+    """
+    Small HTTP client shared by all the requests to the Google APIs. It keeps a pool of
+    keep-alive connections per host, so the TCP and TLS handshakes are not repeated on
+    every request. Requests have a timeout, gzip responses are decoded, and failed
+    requests (connection errors, 429 and 5xx responses) are retried with backoff.
+
+    Args:
+        timeout (float, optional): Timeout in seconds of each request (default is 10).
+        max_retries (int, optional): Retries of a failed request (default is 3).
+        max_idle_connections (int, optional): Maximum idle connections kept per host
+            (default is 16).
+
+    Methods:
+        get(url): Performs a GET request and returns the decoded body.
+        get_json(url): Performs a GET request and returns the parsed JSON body.
+        close(): Closes all the idle connections.
+    """
+
+    def __init__(self, timeout=10, max_retries=3, max_idle_connections=16):
+        """
+        Initializes the client with an empty connection pool.
+
+        Args:
+            timeout (float, optional): Timeout in seconds of each request (default is 10).
+            max_retries (int, optional): Retries of a failed request (default is 3).
+            max_idle_connections (int, optional): Maximum idle connections kept per host.
+
+        Returns:
+            None"""
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_idle_connections = max_idle_connections
+        self.pool = {}
+        self.lock = threading.Lock()
+
+    def __acquire(self, scheme, netloc):
+        """
+        Takes an idle connection to the host from the pool, or opens a new one.
+
+        Args:
+            scheme (str): The scheme of the URL ("http" or "https").
+            netloc (str): The host (and port) of the URL.
+
+        Returns:
+            http.client.HTTPConnection: The connection to the host."""
+        with self.lock:
+            idle = self.pool.get((scheme, netloc))
+            if idle:
+                connection = idle.pop()
+                if connection.sock is not None:
+                    connection.sock.settimeout(self.timeout)
+                return connection
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def __release(self, scheme, netloc, connection):
+        """
+        Returns a connection to the pool, or closes it if the pool is full.
+
+        Args:
+            scheme (str): The scheme of the URL.
+            netloc (str): The host (and port) of the URL.
+            connection (http.client.HTTPConnection): The connection to release.
+
+        Returns:
+            None"""
+        with self.lock:
+            idle = self.pool.setdefault((scheme, netloc), [])
+            if len(idle) < self.max_idle_connections:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def get(self, url):
+        """
+        Performs a GET request, retrying with exponential backoff if it fails.
+
+        Args:
+            url (str): The URL to request.
+
+        Returns:
+            bytes: The body of the response, decompressed if it was gzip encoded.
+
+        Raises:
+            ConnectionError: If the request fails after all the retries."""
+        parts = urlsplit(url)
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(0.25 * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            connection = self.__acquire(parts.scheme, parts.netloc)
+            try:
+                connection.request(
+                    "GET",
+                    path,
+                    headers={"Accept-Encoding": "gzip", "Connection": "keep-alive"},
+                )
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError) as exception:
+                # Broken or stale keep-alive connection
+                connection.close()
+                error = exception
+                continue
+            if response.will_close:
+                connection.close()
+            else:
+                self.__release(parts.scheme, parts.netloc, connection)
+            if response.status == 429 or response.status >= 500:
+                error = ConnectionError(f"HTTP {response.status} requesting {parts.netloc}")
+                continue
+            if response.getheader("Content-Encoding", "") == "gzip":
+                body = gzip.decompress(body)
+            return body
+        raise ConnectionError(f"Request to {parts.netloc} failed: {error}")
+
+    def get_json(self, url):
+        """
+        Performs a GET request and parses the JSON body of the response.
+
+        Args:
+            url (str): The URL to request.
+
+        Returns:
+            dict: The parsed response."""
+        return json.loads(self.get(url))
+
+    def close(self):
+        """
+        Closes all the idle connections of the pool.
+
+        Returns:
+            None"""
+        with self.lock:
+            connections = [c for idle in self.pool.values() for c in idle]
+            self.pool = {}
+        for connection in connections:
+            connection.close()
+
+
+# Client used when no other client is provided
+default_http_client = HTTPClient()
+
+
+class OverQueryLimitError(RuntimeError):
+    """
+    Raised when the Distance Matrix API rejects a request
+    because the query quota has been exceeded (OVER_QUERY_LIMIT).
+    """
+
+
+class TokenBucket:
+    """
+    Token bucket to limit the rate of an operation. Tokens are refilled
+    continuously at the given rate, up to the capacity of the bucket.
+
+    Args:
+        rate (float): Number of tokens refilled per second.
+        capacity (float, optional): Maximum number of tokens stored (default is rate).
+
+    Methods:
+        acquire(tokens=1): Blocks until the tokens are available and consumes them.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Initializes a full bucket.
+
+        Args:
+            rate (float): Number of tokens refilled per second.
+            capacity (float, optional): Maximum number of tokens stored (default is rate).
+
+        Returns:
+            None"""
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until the tokens are available and consumes them.
+        Requests bigger than the capacity wait for a full bucket.
+
+        Args:
+            tokens (float, optional): Number of tokens to consume (default is 1).
+
+        Returns:
+            None"""
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.last_refill) * self.rate
+                )
+                self.last_refill = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """
+    Limits the requests sent to the Distance Matrix API to the provider's quota,
+    both in requests per second and in elements (origins x destinations) per second.
+    A single instance should be shared by all the requests using the same API key.
+
+    Args:
+        requests_per_second (float, optional): Maximum requests per second (default is None).
+        elements_per_second (float, optional): Maximum elements per second (default is None).
+
+    Methods:
+        wait(elements): Blocks until a request with the given number of elements can be sent.
+    """
+
+    def __init__(self, requests_per_second=None, elements_per_second=None):
+        """
+        Initializes the token buckets of the enabled limits.
+
+        Args:
+            requests_per_second (float, optional): Maximum requests per second.
+            elements_per_second (float, optional): Maximum elements per second.
+
+        Returns:
+            None"""
+        self.requests = (
+            TokenBucket(requests_per_second) if requests_per_second else None
+        )
+        self.elements = (
+            TokenBucket(elements_per_second) if elements_per_second else None
+        )
+
+    def wait(self, elements):
+        """
+        Blocks until a request with the given number of elements can be sent.
+
+        Args:
+            elements (int): Number of elements of the request.
+
+        Returns:
+            None"""
+        if self.requests is not None:
+            self.requests.acquire(1)
+        if self.elements is not None:
+            self.elements.acquire(elements)
 
 
 def calculate_haversine_distance(c1, c2):
@@ -70,6 +355,115 @@ def calculate_haversine_distance(c1, c2):
     return radius * c
 
 
+def coordinates_to_array(coordinates):
+    """
+    Stack a list of coordinates into a (N, 3) float64 array.
+
+    Coordinates without altitude get a 0 altitude, which the haversine
+    functions treat as "no altitude", as calculate_haversine_distance does.
+
+    Args:
+        coordinates (list): List of coordinate tuples (latitude, longitude[, altitude]).
+
+    Returns:
+        np.ndarray: Array of shape (N, 3) with latitude, longitude and altitude."""
+    array = np.zeros((len(coordinates), 3), dtype=np.float64)
+    for i, coordinate in enumerate(coordinates):
+        values = [float(c) for c in coordinate[:3]]
+        array[i, : len(values)] = values
+    return array
+
+
+def haversine_distances(
+    origins, destinations, dtype=np.int32, block_size=1024, out=None
+):
+    """
+    Compute the haversine distances from a set of origins to a set of destinations with NumPy.
+
+    The distances are computed in blocks of origins, so the temporary arrays never
+    exceed block_size x len(destinations) elements. If both coordinates of a pair
+    have a non-zero altitude, the altitude difference is taken into account.
+
+    Args:
+        origins (list or np.ndarray): Origin coordinates (latitude, longitude[, altitude]).
+        destinations (list or np.ndarray): Destination coordinates.
+        dtype (np.dtype, optional): Type of the returned matrix. Integer types
+            truncate the distances to meters, as required by the solver (default is np.int32).
+        block_size (int, optional): Number of rows computed at once (default is 1024).
+        out (np.ndarray, optional): Array where the distances are written, such as a
+            memory-mapped file. Its dtype is used instead of dtype (default is None).
+
+    Returns:
+        np.ndarray: Distance matrix in meters of shape (len(origins), len(destinations))."""
+
+    def to_points(coordinates):
+        if isinstance(coordinates, np.ndarray) and coordinates.ndim == 2:
+            points = np.zeros((coordinates.shape[0], 3), dtype=np.float64)
+            points[:, : min(coordinates.shape[1], 3)] = coordinates[:, :3]
+            return points
+        return coordinates_to_array(coordinates)
+
+    org_points = to_points(origins)
+    dst_points = to_points(destinations)
+    if out is None:
+        distance_matrix = np.empty(
+            (org_points.shape[0], dst_points.shape[0]), dtype=dtype
+        )
+    else:
+        distance_matrix = out
+    if distance_matrix.size == 0:
+        return distance_matrix
+    org_lat = np.radians(org_points[:, 0])
+    org_lon = np.radians(org_points[:, 1])
+    org_alt = org_points[:, 2]
+    dst_lat = np.radians(dst_points[np.newaxis, :, 0])
+    dst_lon = np.radians(dst_points[np.newaxis, :, 1])
+    dst_alt = dst_points[np.newaxis, :, 2]
+    org_cos_lat = np.cos(org_lat)
+    dst_cos_lat = np.cos(dst_lat)
+    radius = 6371000
+    for start in range(0, org_points.shape[0], block_size):
+        end = min(start + block_size, org_points.shape[0])
+        delta_lat = dst_lat - org_lat[start:end, np.newaxis]
+        delta_lon = dst_lon - org_lon[start:end, np.newaxis]
+        # Haversine formula
+        a = (
+            np.sin(delta_lat / 2) ** 2
+            + org_cos_lat[start:end, np.newaxis]
+            * dst_cos_lat
+            * np.sin(delta_lon / 2) ** 2
+        )
+        np.clip(a, 0, 1, out=a)
+        block = radius * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        # Altitude difference only when both nodes have one
+        alt_block = org_alt[start:end, np.newaxis]
+        with_altitude = (alt_block != 0) & (dst_alt != 0)
+        if with_altitude.any():
+            delta_alt = np.where(with_altitude, dst_alt - alt_block, 0)
+            block = np.sqrt(block**2 + delta_alt**2)
+        distance_matrix[start:end] = block
+    return distance_matrix
+
+
+def haversine_distance_matrix(
+    coordinates, dtype=np.int32, block_size=1024, out=None
+):
+    """
+    Compute the haversine distance matrix of a set of coordinates with NumPy.
+
+    Args:
+        coordinates (list or np.ndarray): Coordinates (latitude, longitude[, altitude]).
+        dtype (np.dtype, optional): Type of the returned matrix (default is np.int32).
+        block_size (int, optional): Number of rows computed at once (default is 1024).
+        out (np.ndarray, optional): Array where the distances are written (default is None).
+
+    Returns:
+        np.ndarray: Distance matrix in meters of shape (N, N)."""
+    return haversine_distances(
+        coordinates, coordinates, dtype=dtype, block_size=block_size, out=out
+    )
+
+
 def generate_flight_distance_matrix(coordinates):
     """
     Create distance matrix using haversine formula
@@ -80,39 +474,169 @@ def generate_flight_distance_matrix(coordinates):
     Returns:
         list: Distance matrix where each element represents the distance between two coordinates.
     """
-    num_coordinates = len(coordinates)
-    distance_matrix = [[0] * num_coordinates for _ in range(num_coordinates)]
+    return haversine_distance_matrix(coordinates, dtype=np.float64).tolist()
 
-    for i in range(num_coordinates):
-        for j in range(i + 1, num_coordinates):
-            distance = calculate_haversine_distance(coordinates[i], coordinates[j])
-            distance_matrix[i][j] = distance
-            distance_matrix[j][i] = distance
 
-    return distance_matrix
+class TilePlan:
+    """
+    Plan of the requests (tiles) needed to fill a distance matrix
+    with the Distance Matrix API.
 
+    Args:
+        tiles (list): List of (origin_indexes, destination_indexes) tuples, one per request.
+        square (bool, optional): True if origins and destinations are the same addresses
+            (default is False).
 
-def generate_distance_matrix(
-    addresses,
+    Attributes:
+        tiles (list): List of (origin_indexes, destination_indexes) tuples, one per request.
+        n_requests (int): Number of requests of the plan.
+        n_elements (int): Number of elements (origins x destinations) of the plan.
+        n_diagonal (int): Number of elements of the plan in the diagonal of a square
+            matrix (always 0 if the matrix is not square).
+    """
+
+    def __init__(self, tiles, square=False):
+        """
+        Initializes the plan with its tiles.
+
+        Args:
+            tiles (list): List of (origin_indexes, destination_indexes) tuples.
+            square (bool, optional): True if origins and destinations are the same addresses.
+
+        Returns:
+            None"""
+        self.tiles = tiles
+        self.n_requests = len(tiles)
+        self.n_elements = sum(len(rows) * len(cols) for rows, cols in tiles)
+        self.n_diagonal = (
+            sum(len(set(rows).intersection(cols)) for rows, cols in tiles)
+            if square
+            else 0
+        )
+
+
+def plan_distance_matrix_tiles(
+    num_origins,
+    num_destinations,
+    max_origins=25,
+    max_destinations=25,
+    max_elements=100,
+    square=False,
+    symmetric=False,
+):
+    """
+    Plan the requests needed to fill a distance matrix within the limits of the provider.
+
+    Every rectangular tile shape that fits in the limits is tried, and the one needing
+    the fewest requests (and then the fewest elements) is chosen. When the origins and
+    the destinations are the same addresses (square) and the travel mode is symmetric,
+    only the tiles of the upper triangle are requested. The diagonal of a square matrix
+    is left out of the tiles of a single row, but the tiles of several rows include it
+    (and the corner of the lower triangle under it): a request is a rectangle of origins
+    by destinations, and splitting the cells out of the diagonal into rectangles needs
+    at least one request per address, many more than the elements of the diagonal cost.
+    The plan counts the diagonal elements requested.
+
+    Args:
+        num_origins (int): Number of origins of the matrix.
+        num_destinations (int): Number of destinations of the matrix.
+        max_origins (int, optional): Maximum origins per request (default is 25).
+        max_destinations (int, optional): Maximum destinations per request (default is 25).
+        max_elements (int, optional): Maximum origins x destinations per request
+            (default is 100).
+        square (bool, optional): True if origins and destinations are the same addresses
+            (default is False).
+        symmetric (bool, optional): True if the distance from i to j is the same as from
+            j to i. Only used for square matrices (default is False).
+
+    Returns:
+        TilePlan: The plan with the tiles to request."""
+
+    def needed_columns(rows, col_start, col_end):
+        if not square:
+            return list(range(col_start, col_end))
+        if symmetric:  # Upper triangle only
+            return list(range(max(col_start, rows[0] + 1), col_end))
+        if len(rows) == 1:  # Skip the diagonal
+            return [j for j in range(col_start, col_end) if j != rows[0]]
+        return list(range(col_start, col_end))
+
+    best_plan = None
+    for n_rows in range(1, min(max_origins, max_elements, num_origins) + 1):
+        n_cols = min(max_destinations, max_elements // n_rows, num_destinations)
+        tiles = []
+        for row_start in range(0, num_origins, n_rows):
+            rows = list(range(row_start, min(row_start + n_rows, num_origins)))
+            if square and symmetric:
+                # The last row of the block has no columns in the upper triangle
+                rows = [i for i in rows if i < num_destinations - 1]
+                if not rows:
+                    continue
+            for col_start in range(0, num_destinations, n_cols):
+                cols = needed_columns(
+                    rows, col_start, min(col_start + n_cols, num_destinations)
+                )
+                if cols:
+                    tiles.append((rows, cols))
+        plan = TilePlan(tiles, square)
+        if best_plan is None or (plan.n_requests, plan.n_elements) < (
+            best_plan.n_requests,
+            best_plan.n_elements,
+        ):
+            best_plan = plan
+    return best_plan if best_plan is not None else TilePlan([], square)
+
+
+def generate_distance_submatrix(
+    origins,
+    destinations,
     api_key,
     geocode_api_url,
     distance_matrix_api_url,
     mode="walking",
-    max_elements=10,
+    max_origins=25,
+    max_destinations=25,
+    max_elements=100,
+    square=False,
+    symmetric=False,
+    geocode_cache=None,
+    concurrency=1,
+    rate_limiter=None,
+    max_retries=5,
+    http_client=None,
 ):
     """
-    Generate a distance matrix of the specified addresses.
+    Generate the distance matrix from a list of origins to a list of destinations.
+    The requests are planned with plan_distance_matrix_tiles to fit in the limits of
+    the provider. With concurrency > 1, the tiles are requested in parallel by a pool
+    of threads. Tiles rejected with OVER_QUERY_LIMIT are retried after an exponential
+    backoff with random jitter.
 
     Args:
-        addresses (list): List of addresses to generate the distance matrix.
+        origins (list): List of origin addresses.
+        destinations (list): List of destination addresses.
         api_key (str): API key for accessing the Distance Matrix API.
         geocode_api_url (str): URL for the Geocode API.
         distance_matrix_api_url (str): URL for the Distance Matrix API.
         mode (str, optional): Mode of transport for the distance request (default is "walking").
-        max_elements (int, optional): Maximum number of elements in each request (default is 10).
+        max_origins (int, optional): Maximum origins per request (default is 25).
+        max_destinations (int, optional): Maximum destinations per request (default is 25).
+        max_elements (int, optional): Maximum origins x destinations per request
+            (default is 100).
+        square (bool, optional): True if origins and destinations are the same addresses.
+            The diagonal is set to 0, whether it was requested or not (default is False).
+        symmetric (bool, optional): True if the travel mode is symmetric. Only the upper
+            triangle of a square matrix is requested and mirrored (default is False).
+        geocode_cache (GeocodeCache, optional): Cache of geocoded addresses (default is None).
+        concurrency (int, optional): Maximum number of tiles requested at once (default is 1).
+        rate_limiter (RateLimiter, optional): Limits the rate of the requests (default is None).
+        max_retries (int, optional): Retries of a tile rejected with OVER_QUERY_LIMIT
+            (default is 5).
+        http_client (HTTPClient, optional): Client to perform the requests
+            (default is the shared default_http_client).
 
     Returns:
-        list: The distance matrix as a list of lists."""
+        np.ndarray: The distance matrix of shape (len(origins), len(destinations))."""
     available_modes = ["driving", "walking", "bicycling", "transit", "flight"]
     assert mode in available_modes, "Distance request mode not available!"
 
@@ -126,46 +650,159 @@ def generate_distance_matrix(
             distance_matrix.append(row_list)
         return np.array(distance_matrix)
 
-    def fill_matrix(i, j, fullmatrix, submatrix):
-        fullmatrix[
-            i : i + np.shape(submatrix)[0], j : j + np.shape(submatrix)[1]
-        ] = submatrix
-        return fullmatrix
+    def fetch_tile(tile):
+        rows, cols = tile
+        origin_addresses = [origins[i] for i in rows]
+        dest_addresses = [destinations[j] for j in cols]
+        with stage_timer("distance_matrix_tile"):
+            for attempt in range(max_retries + 1):
+                if rate_limiter is not None:
+                    rate_limiter.wait(len(origin_addresses) * len(dest_addresses))
+                try:
+                    response = send_request(origin_addresses, dest_addresses)
+                    break
+                except OverQueryLimitError:
+                    if attempt == max_retries:
+                        raise
+                    time.sleep(0.5 * 2**attempt * random.uniform(0.5, 1.5))
+            if response is None:
+                raise RuntimeError("The distance matrix could not be calculated!")
+            distance_matrix[np.ix_(rows, cols)] = build_distance_matrix(response)
 
     send_request = DistanceMatrixRequest(
         mode=mode,
         api_key=api_key,
         geocode_api_url=geocode_api_url,
         distance_matrix_api_url=distance_matrix_api_url,
+        geocode_cache=geocode_cache,
+        http_client=http_client,
     )  # To perform request to Distance Matrix API
-    num_addresses = len(addresses)
-    max_rows = min(num_addresses, max_elements)
-    if num_addresses < max_elements:
-        q = 1
-        r = 0
+    plan = plan_distance_matrix_tiles(
+        len(origins),
+        len(destinations),
+        max_origins=max_origins,
+        max_destinations=max_destinations,
+        max_elements=max_elements,
+        square=square,
+        symmetric=symmetric,
+    )
+    logger.info(
+        "Distance matrix %sx%s: %s requests (%s elements, %s in the diagonal) planned.",
+        len(origins),
+        len(destinations),
+        plan.n_requests,
+        plan.n_elements,
+        plan.n_diagonal,
+    )
+    distance_matrix = np.zeros((len(origins), len(destinations)), dtype=int)
+    if concurrency > 1 and plan.n_requests > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(fetch_tile, plan.tiles))
     else:
-        q, r = divmod(num_addresses, max_elements)
-    distance_matrix = np.zeros((num_addresses, num_addresses))
-    rest = 1 if r > 0 else 0
-    ind_row = 0
-    for i in range(q + rest):
-        origin_addresses = addresses[
-            i * max_rows : min((i + 1) * max_rows, num_addresses)
-        ]
-        ind_col = 0
-        for j in range(q + rest):
-            dest_addresses = addresses[
-                j * max_rows : min((j + 1) * max_rows, num_addresses)
-            ]
-            response = send_request(origin_addresses, dest_addresses)
-            if response is None:
-                raise RuntimeError("The distance matrix could not be calculated!")
-            submatrix = build_distance_matrix(response)
-            distance_matrix = fill_matrix(ind_row, ind_col, distance_matrix, submatrix)
-            ind_col += len(submatrix[0])
-        ind_row += len(submatrix)
-    distance_matrix = distance_matrix.astype(int)
-    return distance_matrix.tolist()
+        for tile in plan.tiles:
+            fetch_tile(tile)
+    if square and symmetric:
+        upper = np.triu(distance_matrix, k=1)
+        distance_matrix = upper + upper.T
+    elif square:
+        np.fill_diagonal(distance_matrix, 0)
+    return distance_matrix
+
+
+def generate_distance_matrix(
+    addresses,
+    api_key,
+    geocode_api_url,
+    distance_matrix_api_url,
+    mode="walking",
+    symmetric=False,
+    geocode_cache=None,
+    concurrency=1,
+    rate_limiter=None,
+    http_client=None,
+):
+    """
+    Generate a distance matrix of the specified addresses.
+
+    Args:
+        addresses (list): List of addresses to generate the distance matrix.
+        api_key (str): API key for accessing the Distance Matrix API.
+        geocode_api_url (str): URL for the Geocode API.
+        distance_matrix_api_url (str): URL for the Distance Matrix API.
+        mode (str, optional): Mode of transport for the distance request (default is "walking").
+        symmetric (bool, optional): True if the distances of the travel mode are symmetric,
+            so only the upper triangle is requested (default is False).
+        geocode_cache (GeocodeCache, optional): Cache of geocoded addresses (default is None).
+        concurrency (int, optional): Maximum number of tiles requested at once (default is 1).
+        rate_limiter (RateLimiter, optional): Limits the rate of the requests (default is None).
+        http_client (HTTPClient, optional): Client to perform the requests
+            (default is the shared default_http_client).
+
+    Returns:
+        list: The distance matrix as a list of lists."""
+    return generate_distance_submatrix(
+        addresses,
+        addresses,
+        api_key,
+        geocode_api_url,
+        distance_matrix_api_url,
+        mode=mode,
+        square=True,
+        symmetric=symmetric,
+        geocode_cache=geocode_cache,
+        concurrency=concurrency,
+        rate_limiter=rate_limiter,
+        http_client=http_client,
+    ).tolist()
+
+
+def geocode_address(
+    address, api_key, geocode_api_url, geocode_cache=None, http_client=None
+):
+    """
+    Geocode an address with the Geocode API. If a geocode cache is given,
+    the address is only requested to the API the first time it is geocoded.
+
+    Args:
+        address (str): The address to geocode.
+        api_key (str): API key for accessing the Geocode API.
+        geocode_api_url (str): URL for the Geocode API.
+        geocode_cache (GeocodeCache, optional): Cache of geocoded addresses (default is None).
+        http_client (HTTPClient, optional): Client to perform the request
+            (default is the shared default_http_client).
+
+    Returns:
+        dict: A dictionary with the "place_id", "lat" and "lng" of the address,
+            or None if it can not be geocoded."""
+    # Measured as a stage whose outcome tells cache hits and failures apart
+    start_time = time.perf_counter()
+    outcome = "error"
+    try:
+        if geocode_cache is not None:
+            location = geocode_cache.get_location(address)
+            if location is not None:
+                outcome = "cache_hit"
+                return location
+        address = unidecode(address)
+        http_client = http_client or default_http_client
+        response = http_client.get_json(
+            geocode_api_url + "address=" + address.replace(" ", "+") + "&key=" + api_key
+        )
+        if not response["results"]:
+            print(f"Address {address} can not be geocoded! Check it.")
+            outcome = "not_found"
+            return None
+        location = {
+            "place_id": response["results"][0]["place_id"],
+            "lat": float(response["results"][0]["geometry"]["location"]["lat"]),
+            "lng": float(response["results"][0]["geometry"]["location"]["lng"]),
+        }
+        if geocode_cache is not None:
+            geocode_cache.put_location(address, location)
+        outcome = "ok"
+        return location
+    finally:
+        observe_stage("geocode", time.perf_counter() - start_time, outcome)
 
 
 def detect_address_format(address: str):
@@ -198,6 +835,28 @@ def detect_address_format(address: str):
     return "name"
 
 
+def normalize_address(address):
+    """
+    Normalizes an address of a problem definition before its conversion to coordinates.
+
+    Args:
+        address (list or str): The address, as coordinates, as a "latitude, longitude"
+            string (optionally with altitude), or as a name.
+
+    Returns:
+        tuple: ("coordinates", list of floats) for coordinates, or ("name", str)
+            for a name, with its whitespace collapsed."""
+    if isinstance(address, (list, tuple)):
+        return "coordinates", [float(value) for value in address]
+    parts = address.split(",")
+    if 2 <= len(parts) <= 3:
+        try:
+            return "coordinates", [float(part) for part in parts]
+        except ValueError:
+            pass  # A name with commas
+    return "name", " ".join(address.split())
+
+
 class AddressFormatConversion:
     """
     Converts the given address from the input format to the corresponding coordinates.
@@ -206,19 +865,32 @@ class AddressFormatConversion:
         api_key (str): The API key required to access the geocoding and distance matrix services.
         geocode_api_url (str): The URL of the geocoding API.
         DISTANCE_MATRIX_API_URL (str): The URL of the distance matrix API.
+        geocode_cache (GeocodeCache, optional): Cache of geocoded addresses.
+        http_client (HTTPClient, optional): Client to perform the requests.
 
     Attributes:
         api_key (str): The API key required to access the geocoding and distance matrix services.
         geocode_api_url (str): The URL of the geocoding API.
         distance_matrix_api_url (str): The URL of the distance matrix API.
+        geocode_cache (GeocodeCache): Cache of geocoded addresses, or None.
+        http_client (HTTPClient): Client to perform the requests.
 
     Methods:
-        __init__(api_key, geocode_api_url, distance_matrix_api_url): Initializes the
-            AddressFormatConversion object with the provided API key and API URLs.
+        __init__(api_key, geocode_api_url, distance_matrix_api_url, geocode_cache, http_client):
+            Initializes the AddressFormatConversion object with the provided API key and API URLs.
         address2coords(address): Given an address in str format, return its coordinates.
+        addresses2coords(addresses, concurrency=1): Given a list of addresses in str format,
+            return their coordinates, geocoding them in parallel.
     """
 
-    def __init__(self, api_key, geocode_api_url, distance_matrix_api_url):
+    def __init__(
+        self,
+        api_key,
+        geocode_api_url,
+        distance_matrix_api_url,
+        geocode_cache=None,
+        http_client=None,
+    ):
         """
         Initializes the API key and API URLs for the class.
 
@@ -226,6 +898,9 @@ class AddressFormatConversion:
             api_key (str): The API key for accessing the APIs.
             geocode_api_url (str): The URL for the geocode API.
             distance_matrix_api_url (str): The URL for the distance matrix API.
+            geocode_cache (GeocodeCache, optional): Cache of geocoded addresses.
+            http_client (HTTPClient, optional): Client to perform the requests
+                (default is the shared default_http_client).
 
         Returns:
             None"""
@@ -234,6 +909,8 @@ class AddressFormatConversion:
             geocode_api_url,
             distance_matrix_api_url,
         )
+        self.geocode_cache = geocode_cache
+        self.http_client = http_client or default_http_client
 
     def address2coords(self, address):
         """
@@ -244,22 +921,36 @@ class AddressFormatConversion:
 
         Returns:
             list: The coordinates of the address in the format [latitude, longitude]."""
-        address = unidecode(address)
-        json_result = urllib.request.urlopen(
-            self.geocode_api_url
-            + "address="
-            + address.replace(" ", "+")
-            + "&key="
-            + self.api_key
-        ).read()
-        response = json.loads(json_result)
-        if not response["results"]:
-            print(f"Address {address} can not be geocoded! Check it.")
+        location = geocode_address(
+            address,
+            self.api_key,
+            self.geocode_api_url,
+            self.geocode_cache,
+            self.http_client,
+        )
+        if location is None:
             return None
-        return [
-            float(response["results"][0]["geometry"]["location"]["lat"]),
-            float(response["results"][0]["geometry"]["location"]["lng"]),
-        ]
+        return [location["lat"], location["lng"]]
+
+    def addresses2coords(self, addresses, concurrency=1):
+        """
+        Given a list of addresses in str format, return their coordinates.
+        With concurrency > 1, the addresses are geocoded in parallel by a pool of threads.
+
+        Args:
+            addresses (list): The addresses to geocode.
+            concurrency (int, optional): Maximum number of addresses geocoded at once
+                (default is 1).
+
+        Returns:
+            list: The coordinates of each address in the format [latitude, longitude],
+                or None for the addresses that can not be geocoded."""
+        if concurrency > 1 and len(addresses) > 1:
+            with ThreadPoolExecutor(
+                max_workers=min(concurrency, len(addresses))
+            ) as executor:
+                return list(executor.map(self.address2coords, addresses))
+        return [self.address2coords(address) for address in addresses]
 
 
 class DistanceMatrixRequest:
@@ -274,6 +965,8 @@ class DistanceMatrixRequest:
         distance_matrix_api_url (str): The URL for the distance matrix API.
         mode (str, optional): The transportation mode for distance requests.
             Must be one of "driving", "walking", "bicycling", or "transit". Defaults to "DRIVING".
+        geocode_cache (GeocodeCache, optional): Cache of geocoded addresses.
+        http_client (HTTPClient, optional): Client to perform the requests.
 
     Attributes:
         api_key (str): The API key for the distance calculator service.
@@ -281,9 +974,12 @@ class DistanceMatrixRequest:
         distance_matrix_api_url (str): The URL for the distance matrix API.
         mode (str): The transportation mode for distance requests.
         available_modes (list): The list of available transportation modes.
+        geocode_cache (GeocodeCache): Cache of geocoded addresses, or None.
+        http_client (HTTPClient): Client to perform the requests.
 
     Methods:
-        __init__(api_key, geocode_api_url, distance_matrix_api_url, mode):
+        __init__(api_key, geocode_api_url, distance_matrix_api_url, mode, geocode_cache,
+            http_client):
             Constructor for the DistanceMatrixRequest class.
         __call__(origin_dirs, dest_dirs): Performs the distance matrix request.
 
@@ -299,7 +995,13 @@ class DistanceMatrixRequest:
     """
 
     def __init__(
-        self, api_key, geocode_api_url, distance_matrix_api_url, mode="DRIVING"
+        self,
+        api_key,
+        geocode_api_url,
+        distance_matrix_api_url,
+        mode="DRIVING",
+        geocode_cache=None,
+        http_client=None,
     ):
         """
         This function initializes a DistanceCalculator object with the provided API key,
@@ -312,6 +1014,9 @@ class DistanceMatrixRequest:
             mode (str, optional): The transportation mode for distance requests.
                 Must be one of "driving", "walking", "bicycling", or "transit".
                 Defaults to "DRIVING".
+            geocode_cache (GeocodeCache, optional): Cache of geocoded addresses.
+            http_client (HTTPClient, optional): Client to perform the requests
+                (default is the shared default_http_client).
 
         Returns:
             None"""
@@ -321,6 +1026,8 @@ class DistanceMatrixRequest:
             distance_matrix_api_url,
         )
         self.mode = mode
+        self.geocode_cache = geocode_cache
+        self.http_client = http_client or default_http_client
         self.available_modes = ["driving", "walking", "bicycling", "transit"]
         assert mode in self.available_modes, "Distance request mode not available!"
 
@@ -337,18 +1044,16 @@ class DistanceMatrixRequest:
             str: A string containing the place_id of the first result from the
                 geocoding API response, or None if no results were found.
         """
-        json_result = urllib.request.urlopen(
-            self.geocode_api_url
-            + "address="
-            + address.replace(" ", "+")
-            + "&key="
-            + self.api_key
-        ).read()
-        response = json.loads(json_result)
-        if not response["results"]:
-            print(f"Address {address} can not be geocoded! Check it.")
+        location = geocode_address(
+            address,
+            self.api_key,
+            self.geocode_api_url,
+            self.geocode_cache,
+            self.http_client,
+        )
+        if location is None:
             return None
-        return "place_id:" + response["results"][0]["place_id"]
+        return "place_id:" + location["place_id"]
 
     def __build_coords_str(self, coords):
         """
@@ -459,6 +1164,9 @@ class DistanceMatrixRequest:
         Returns:
             dict: A dictionary containing the response from the API,
                 including distance and duration information.
+
+        Raises:
+            OverQueryLimitError: If the API rejects the request because of the query quota.
         """
         org_str = ""
         dst_str = ""
@@ -495,8 +1203,279 @@ class DistanceMatrixRequest:
             + "&mode="
             + self.mode
         )
-        json_result = urllib.request.urlopen(request).read()
-        response = json.loads(json_result)
+        response = self.http_client.get_json(request)
+        if response.get("status") == "OVER_QUERY_LIMIT":
+            raise OverQueryLimitError("Distance Matrix API query limit exceeded!")
         if self.__check_status(response, origin_dirs, dest_dirs):
             return response
         return None
+
+
+class IncrementalDistanceMatrix:
+    """
+    Keeps the distance matrix of a list of addresses up to date when single addresses
+    are added, changed or deleted, so the whole matrix does not need to be rebuilt.
+    Adding or changing a node only computes (or requests) its row and its column,
+    and deleting a node only drops them.
+
+    A memory-mapped matrix stays memory-mapped: changing a node only writes its row and
+    column to private (copy-on-write) pages, and adding or deleting a node writes the new
+    matrix to a new file of storage_folder (if it has at least memmap_min_nodes nodes),
+    so the full matrix is never copied to memory.
+
+    Args:
+        travel_mode (str): The travel mode of the distance matrix.
+        api_key (str, optional): API key for accessing the Distance Matrix API.
+        geocode_api_url (str, optional): URL for the Geocode API.
+        distance_matrix_api_url (str, optional): URL for the Distance Matrix API.
+        geocode_cache (GeocodeCache, optional): Cache of geocoded addresses.
+        concurrency (int, optional): Maximum number of tiles requested at once.
+        rate_limiter (RateLimiter, optional): Limits the rate of the requests.
+        symmetric (bool, optional): True if the distances of the travel mode are symmetric.
+        http_client (HTTPClient, optional): Client to perform the requests.
+        storage_folder (str, optional): Folder of the memory-mapped matrices.
+        memmap_min_nodes (int, optional): Minimum number of nodes for a matrix to be
+            memory-mapped.
+
+    Attributes:
+        travel_mode (str): The travel mode of the distance matrix.
+        addresses (list): Copy of the addresses the matrix corresponds to.
+        matrix (np.ndarray): The distance matrix in meters (a np.memmap if it is
+            memory-mapped).
+
+    Methods:
+        build(addresses, distance_matrix=None): Sets (or computes) the full matrix.
+        matches(addresses, travel_mode): Checks if the matrix is valid for the addresses.
+        add_node(address): Appends a node to the matrix.
+        update_node(index, address): Recomputes the row and column of a node.
+        remove_node(index): Drops the row and column of a node.
+    """
+
+    def __init__(
+        self,
+        travel_mode,
+        api_key=None,
+        geocode_api_url=None,
+        distance_matrix_api_url=None,
+        geocode_cache=None,
+        concurrency=1,
+        rate_limiter=None,
+        symmetric=False,
+        http_client=None,
+        storage_folder=None,
+        memmap_min_nodes=None,
+    ):
+        """
+        Initializes an empty distance matrix for the given travel mode.
+
+        Args:
+            travel_mode (str): The travel mode of the distance matrix.
+            api_key (str, optional): API key for accessing the Distance Matrix API.
+            geocode_api_url (str, optional): URL for the Geocode API.
+            distance_matrix_api_url (str, optional): URL for the Distance Matrix API.
+            geocode_cache (GeocodeCache, optional): Cache of geocoded addresses.
+            concurrency (int, optional): Maximum number of tiles requested at once.
+            rate_limiter (RateLimiter, optional): Limits the rate of the requests.
+            symmetric (bool, optional): True if the distances of the travel mode are symmetric.
+            http_client (HTTPClient, optional): Client to perform the requests.
+            storage_folder (str, optional): Folder of the memory-mapped matrices
+                (default is None, never memory-mapped).
+            memmap_min_nodes (int, optional): Minimum number of nodes for a matrix to be
+                memory-mapped (default is None, never memory-mapped).
+
+        Returns:
+            None"""
+        self.travel_mode = travel_mode
+        self.symmetric = symmetric or travel_mode == "flight"
+        self.api_key, self.geocode_api_url, self.distance_matrix_api_url = (
+            api_key,
+            geocode_api_url,
+            distance_matrix_api_url,
+        )
+        self.geocode_cache = geocode_cache
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.http_client = http_client
+        self.storage_folder = storage_folder
+        self.memmap_min_nodes = memmap_min_nodes
+        self.addresses = []
+        self.matrix = np.zeros((0, 0), dtype=np.int32)
+
+    def __allocate(self, size, fill):
+        """
+        Creates a new matrix for the current addresses, memory-mapped if the matrix
+        was already memory-mapped and it is still big enough.
+
+        Args:
+            size (int): Number of nodes of the new matrix.
+            fill (callable): Function that writes the distances to the array it receives.
+
+        Returns:
+            np.ndarray: The new matrix."""
+        if (
+            isinstance(self.matrix, np.memmap)
+            and self.storage_folder is not None
+            and self.memmap_min_nodes is not None
+            and size >= self.memmap_min_nodes
+        ):
+            file = memmap_matrix_file(
+                self.storage_folder, self.addresses, self.travel_mode
+            )
+            return create_memmap_matrix(file, size, fill)
+        matrix = np.zeros((size, size), dtype=np.int32)
+        fill(matrix)
+        return matrix
+
+    def __distances(self, origins, destinations, square=False):
+        """
+        Computes the distances from origins to destinations with the travel mode of the matrix.
+
+        Args:
+            origins (list): List of origin addresses.
+            destinations (list): List of destination addresses.
+            square (bool, optional): True if origins and destinations are the same addresses.
+
+        Returns:
+            np.ndarray: The distances of shape (len(origins), len(destinations))."""
+        if self.travel_mode == "flight":
+            return haversine_distances(origins, destinations)
+        return generate_distance_submatrix(
+            origins,
+            destinations,
+            self.api_key,
+            self.geocode_api_url,
+            self.distance_matrix_api_url,
+            mode=self.travel_mode,
+            square=square,
+            symmetric=self.symmetric,
+            geocode_cache=self.geocode_cache,
+            concurrency=self.concurrency,
+            rate_limiter=self.rate_limiter,
+            http_client=self.http_client,
+        )
+
+    def build(self, addresses, distance_matrix=None):
+        """
+        Sets the full distance matrix of the addresses, computing it if not given.
+
+        Args:
+            addresses (list): List of addresses of the matrix.
+            distance_matrix (list or np.ndarray, optional): An already computed matrix.
+
+        Returns:
+            IncrementalDistanceMatrix: The object itself."""
+        self.addresses = [list(a) if isinstance(a, list) else a for a in addresses]
+        if distance_matrix is None:
+            distance_matrix = self.__distances(
+                self.addresses, self.addresses, square=True
+            )
+        # A memory-mapped int32 matrix is kept as it is, without a copy
+        self.matrix = np.asanyarray(distance_matrix)
+        if self.matrix.dtype != np.int32:
+            self.matrix = self.matrix.astype(np.int32)
+        return self
+
+    def matches(self, addresses, travel_mode):
+        """
+        Checks if the matrix corresponds to the given addresses and travel mode.
+
+        Args:
+            addresses (list): List of addresses.
+            travel_mode (str): The travel mode.
+
+        Returns:
+            bool: True if the matrix is valid for the addresses and the travel mode."""
+        return travel_mode == self.travel_mode and addresses == self.addresses
+
+    def add_node(self, address):
+        """
+        Appends a node to the matrix, computing only its row and column.
+
+        Args:
+            address (list or str): The address of the new node.
+
+        Returns:
+            None"""
+        size = len(self.addresses)
+        self.addresses.append(list(address) if isinstance(address, list) else address)
+        row, column = self.__node_distances(size)
+
+        def fill(matrix):
+            matrix[:size, :size] = self.matrix
+            matrix[size, :] = row
+            matrix[:, size] = column
+
+        self.matrix = self.__allocate(size + 1, fill)
+
+    def update_node(self, index, address):
+        """
+        Replaces the address of a node, recomputing only its row and column.
+        For travel modes other than flight, the altitude does not change the distances.
+
+        Args:
+            index (int): The index of the node.
+            address (list or str): The new address of the node.
+
+        Returns:
+            None"""
+        previous = self.addresses[index]
+        self.addresses[index] = list(address) if isinstance(address, list) else address
+        if (
+            self.travel_mode != "flight"
+            and isinstance(address, list)
+            and isinstance(previous, list)
+            and address[:2] == previous[:2]
+        ):
+            return
+        self.__compute_node(index)
+
+    def remove_node(self, index):
+        """
+        Drops the row and column of a node.
+
+        Args:
+            index (int): The index of the node.
+
+        Returns:
+            None"""
+        self.addresses.pop(index)
+        keep = np.delete(np.arange(len(self.matrix)), index)
+
+        def fill(matrix):
+            # By blocks of rows, so a memory-mapped matrix is not copied at once
+            for start in range(0, len(keep), 1024):
+                rows = keep[start : start + 1024]
+                matrix[start : start + len(rows)] = self.matrix[rows][:, keep]
+
+        self.matrix = self.__allocate(len(keep), fill)
+
+    def __node_distances(self, index):
+        """
+        Computes the row and column of a node.
+
+        Args:
+            index (int): The index of the node.
+
+        Returns:
+            tuple: The distances from the node and to the node."""
+        node = [self.addresses[index]]
+        row = np.asarray(self.__distances(node, self.addresses)[0], dtype=np.int32)
+        if self.symmetric:
+            column = row.copy()
+        else:
+            column = np.asarray(
+                self.__distances(self.addresses, node)[:, 0], dtype=np.int32
+            )
+        row[index] = column[index] = 0
+        return row, column
+
+    def __compute_node(self, index):
+        """
+        Computes the row and column of a node.
+
+        Args:
+            index (int): The index of the node.
+
+        Returns:
+            None"""
+        self.matrix[index, :], self.matrix[:, index] = self.__node_distances(index)
@@ -0,0 +1,130 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+This module contains a profiler of the requests to the web app.
+
+A profiled request runs under cProfile and tracemalloc. When it ends, the profile is
+saved as a pstats file (which can be opened with pstats or snakeviz) and the lines
+that allocated the most memory are saved in a text summary.
+
+Classes:
+- RequestProfiler: cProfile and tracemalloc profile of a request.
+"""
+
+import os
+import re
+import time
+import uuid
+import cProfile
+import threading
+import tracemalloc
+from utils.auxiliary import ensure_folder_exist
+
+# tracemalloc traces the whole process, so only one request is profiled at a time
+profiling_lock = threading.Lock()
+
+
+class RequestProfiler:
+    """
+    cProfile and tracemalloc profile of a request.
+
+    Args:
+        folder (str): Folder where the profile is saved.
+        name (str): Name of the profiled request, e.g. its endpoint.
+        top (int, optional): Number of lines in the allocation summary (default is 25).
+
+    Attributes:
+        stats_file (str): Path of the pstats file.
+        allocations_file (str): Path of the allocation summary.
+        top (int): Number of lines in the allocation summary.
+        running (bool): Whether the profiler is enabled.
+
+    Methods:
+        start(): Starts profiling the current thread and tracing the allocations.
+        stop(): Stops profiling and saves the profile.
+        locations(): Returns the paths of the saved files.
+    """
+
+    def __init__(self, folder, name, top=25):
+        """
+        Initializes the profiler. The files are named after the time, the name
+        of the request and a random suffix, so their paths are known in advance.
+
+        Args:
+            folder (str): Folder where the profile is saved.
+            name (str): Name of the profiled request, e.g. its endpoint.
+            top (int, optional): Number of lines in the allocation summary.
+
+        Returns:
+            None"""
+        self.folder = folder
+        base_name = "-".join(
+            [
+                time.strftime("%Y%m%d-%H%M%S"),
+                re.sub(r"[^A-Za-z0-9_-]+", "_", name or "request"),
+                uuid.uuid4().hex[:8],
+            ]
+        )
+        self.stats_file = os.path.join(folder, base_name + ".pstats")
+        self.allocations_file = os.path.join(folder, base_name + ".allocations.txt")
+        self.top = top
+        self.running = False
+        self._profile = cProfile.Profile()
+        self._started_tracemalloc = False
+        self._start_time = None
+
+    def start(self):
+        """
+        Starts profiling the current thread and tracing the allocations.
+
+        Returns:
+            None"""
+        ensure_folder_exist(self.folder)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._start_time = time.perf_counter()
+        self.running = True
+        self._profile.enable()
+
+    def stop(self):
+        """
+        Stops profiling and saves the pstats file and the allocation summary.
+        It does nothing if the profiler is not running.
+
+        Returns:
+            None"""
+        if not self.running:
+            return
+        self._profile.disable()
+        self.running = False
+        elapsed = time.perf_counter() - self._start_time
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ]
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        self._profile.dump_stats(self.stats_file)
+        statistics = snapshot.statistics("lineno")
+        with open(self.allocations_file, "w", encoding="utf-8") as file:
+            file.write(f"Elapsed time: {elapsed:.3f}s\n")
+            file.write(f"Traced memory: {current / 1024:.1f} KiB")
+            file.write(f" (peak {peak / 1024:.1f} KiB)\n")
+            file.write(f"Top {self.top} allocations by line:\n")
+            for statistic in statistics[: self.top]:
+                file.write(f"{statistic}\n")
+
+    def locations(self):
+        """
+        Returns the paths of the files of the profile.
+
+        Returns:
+            dict: The "stats" (pstats file) and "allocations" (summary) paths."""
+        return {"stats": self.stats_file, "allocations": self.allocations_file}
@@ -8,6 +8,7 @@ This module contains the required code to perform a simulation of the routes.
 
 import math
 import time
+from utils.metrics import observe_stage
 
 
 def calculate_intermediate_coordinate(c1, c2, velocity, timestamp):
@@ -99,7 +100,8 @@ class SimulationPath:
     Args:
         routes (dict): A dictionary containing the routes for each vehicle,
             with their corresponding nodes and coordinates.
-        distance_matrix (list of lists): A matrix containing the distances between nodes.
+        distance_matrix (list of lists or np.ndarray): A matrix containing the distances
+            between nodes. It can be a memory-mapped NumPy array.
         timestep (int, optional): The initial timestep for the simulation. Default is 100.
         decrease_factor (float, optional): The factor by which the timestep
             decreases in each iteration. Default is 0.01.
@@ -200,6 +202,7 @@ class SimulationPath:
         time.sleep(self.decrease_factor * self.timestep)
         if all(self.finish_route):
             raise StopIteration
+        start_time = time.perf_counter()
         self.timestep = self.initial_timestep
         min_timestep = self.timestep
         for v_idx in self.routes.keys():
@@ -242,4 +245,5 @@ class SimulationPath:
             )
             self.current_coords[v_idx] = current_coordinate
         self.time += self.timestep
+        observe_stage("simulation_tick", time.perf_counter() - start_time)
         return self.current_coords
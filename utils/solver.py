@@ -0,0 +1,70 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+This module contains the entry point of the solvers, shared by the web app and
+the background jobs, so a problem is solved the same way whatever the endpoint.
+
+The solving method is selected by the solver configuration: by decomposition into
+clusters (if the problem is bigger than the cluster size), with a portfolio of
+configurations in parallel, or with a single configuration.
+
+Functions:
+- solve_problem(problem_data, solver_data, previous_routes=None,
+    solution_callback=None, stop=None):
+    Solve a problem with the method of the solver configuration.
+"""
+
+from utils.auxiliary import adapt_solution
+from utils.or_tools_method import find_routes
+from utils.portfolio import find_routes_portfolio
+from utils.decomposition import find_routes_decomposed
+
+
+def solve_problem(
+    problem_data, solver_data, previous_routes=None, solution_callback=None, stop=None
+):
+    """
+    Solves a problem with the method selected in the solver configuration: by decomposition
+    into clusters (if the problem is bigger than the cluster size), with a portfolio
+    of configurations, or with a single configuration.
+
+    The progress of the search is only reported, and the search can only be stopped,
+    when a single configuration is solved: the portfolio and the decomposition run their
+    searches in other processes until their time limit.
+
+    Args:
+        problem_data (dict): A dictionary containing the problem data.
+        solver_data (dict): A dictionary containing the solver configuration.
+        previous_routes (dict, optional): The routes of a previous solution (warm start).
+        solution_callback (callable, optional): Function called with the manager, the
+            routing model and a CurrentSolution each time the search finds a solution.
+        stop (callable, optional): Function polled during the search. When it returns
+            True, the search stops and the best solution found so far is returned.
+
+    Returns:
+        dict: The routes, as returned by adapt_solution (with the "objective_trace" of the
+            search when a single configuration is solved), or None if no solution was found.
+
+    Raises:
+        ValueError: If a portfolio is solved without time limit."""
+    cluster_size = solver_data.get("decomposition_cluster_size")
+    if cluster_size and len(problem_data["addresses"]) > cluster_size:
+        return find_routes_decomposed(problem_data, solver_data)
+    if solver_data.get("portfolio"):
+        return find_routes_portfolio(problem_data, solver_data, previous_routes)
+    trace = []
+    data, manager, routing, solution = find_routes(
+        problem_data,
+        solver_data,
+        previous_routes,
+        solution_callback=solution_callback,
+        stop=stop,
+        trace=trace,
+    )
+    if solution is None:
+        return None
+    routes = adapt_solution(data, manager, routing, solution, problem_data["addresses"])
+    routes["objective_trace"] = trace  # (seconds, objective) of the improving solutions
+    return routes
@@ -0,0 +1,220 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+This module contains a sparse distance model for very large flight instances.
+
+Instead of the full N x N distance matrix, only the distances from each node to its
+k nearest neighbours are stored, so the memory grows linearly with the number of nodes.
+Any other arc is evaluated on demand with the haversine formula. The neighbours can
+also be used to restrict the successors of each node in the routing model.
+
+Functions:
+- k_nearest_neighbours(coordinates, k): Find the k nearest neighbours of each point.
+
+Classes:
+- SparseDistanceModel: Distance model storing only the k nearest neighbours of each node.
+"""
+
+import math
+import numpy as np
+from utils.problem_definiton import (
+    calculate_haversine_distance,
+    coordinates_to_array,
+    haversine_distances,
+)
+from utils.spatial_index import METERS_PER_DEGREE, GridSpatialIndex
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # SciPy is optional, a grid spatial index is used instead
+    cKDTree = None
+
+
+def k_nearest_neighbours(coordinates, k):
+    """
+    Find the k nearest neighbours of each coordinate (the coordinate itself excluded).
+
+    If SciPy is available, the neighbours are found with a KD-tree over the coordinates
+    projected on the unit sphere (the chord length is monotonic with the great-circle
+    distance). Otherwise, the coordinates are hashed in a GridSpatialIndex whose cells
+    hold about k coordinates each, and the coordinates of each cell are only compared
+    with those of the cells around it.
+
+    Args:
+        coordinates (np.ndarray): Array of shape (N, 3) with latitude, longitude and altitude.
+        k (int): Number of neighbours of each coordinate.
+
+    Returns:
+        np.ndarray: The (N, k) array of neighbour indexes, sorted by distance."""
+    num_coordinates = coordinates.shape[0]
+    if cKDTree is not None:
+        lat = np.radians(coordinates[:, 0])
+        lon = np.radians(coordinates[:, 1])
+        points = np.stack(
+            [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1
+        )
+        _, neighbours = cKDTree(points).query(points, k=k + 1)
+        neighbours = np.asarray(neighbours).reshape(num_coordinates, k + 1)
+        # Drop the coordinate itself (it may not be the first one if duplicated)
+        result = np.empty((num_coordinates, k), dtype=np.int64)
+        for i in range(num_coordinates):
+            row = neighbours[i][neighbours[i] != i]
+            result[i] = row[:k]
+        return result
+    # Cells of the area of about k coordinates (at least 1 m)
+    height = np.ptp(coordinates[:, 0]) * METERS_PER_DEGREE
+    width = (
+        np.ptp(coordinates[:, 1])
+        * METERS_PER_DEGREE
+        * math.cos(math.radians(float(np.mean(coordinates[:, 0]))))
+    )
+    cell_size = max(1.0, math.sqrt(height * width * k / num_coordinates))
+    index = GridSpatialIndex(cell_size)
+    index.rebuild(coordinates[:, :2].tolist())
+    rows = [row for row, _ in index.cells]
+    cols = [col for _, col in index.cells]
+    neighbours = np.empty((num_coordinates, k), dtype=np.int64)
+    for (row, col), members in index.cells.items():
+        members = np.fromiter(members, dtype=np.int64, count=len(members))
+        # The coordinates of a cell are compared with the cells around it, which
+        # contain every coordinate within (reach - 1) cells (as in GridSpatialIndex)
+        reach = 2
+        while True:
+            complete = (
+                row - reach <= min(rows)
+                and row + reach >= max(rows)
+                and col - reach <= min(cols)
+                and col + reach >= max(cols)
+            )
+            candidates = [
+                index.cells.get((i, j), ())
+                for i in range(row - reach, row + reach + 1)
+                for j in range(col - reach, col + reach + 1)
+            ]
+            candidates = np.fromiter(
+                (candidate for cell in candidates for candidate in cell),
+                dtype=np.int64,
+            )
+            if len(candidates) > k:
+                block = haversine_distances(
+                    coordinates[members], coordinates[candidates], dtype=np.float64
+                )
+                block[members[:, None] == candidates[None]] = np.inf
+                nearest = np.argpartition(block, k - 1, axis=1)[:, :k]
+                distances = np.take_along_axis(block, nearest, axis=1)
+                if complete or distances.max() <= (reach - 1) * cell_size:
+                    order = np.argsort(distances, axis=1)
+                    neighbours[members] = candidates[
+                        np.take_along_axis(nearest, order, axis=1)
+                    ]
+                    break
+            reach *= 2
+    return neighbours
+
+
+class _SparseRow:
+    """
+    Row of a SparseDistanceModel, so the model can be indexed as model[i][j].
+    """
+
+    def __init__(self, model, from_node):
+        self.model = model
+        self.from_node = from_node
+
+    def __len__(self):
+        return len(self.model)
+
+    def __getitem__(self, to_node):
+        return self.model.distance(self.from_node, to_node)
+
+
+class SparseDistanceModel:
+    """
+    Distance model storing only the distances from each node to its k nearest neighbours.
+    It can be indexed as a distance matrix (model[i][j]); arcs between nodes that are not
+    neighbours are computed on demand with the haversine formula.
+
+    Args:
+        coordinates (list): List of coordinates (latitude, longitude[, altitude]).
+        k (int, optional): Number of neighbours stored for each node (default is 20).
+
+    Attributes:
+        coordinates (list): List of coordinates of the nodes.
+        k (int): Number of neighbours stored for each node.
+        neighbours (np.ndarray): The (N, k) array of neighbour indexes of each node.
+        distances (np.ndarray): The (N, k) array of distances in meters to the neighbours.
+
+    Methods:
+        distance(from_node, to_node): Returns the distance between two nodes in meters.
+        to_dict(): Returns a JSON serializable representation of the model.
+    """
+
+    def __init__(self, coordinates, k=20):
+        """
+        Finds the k nearest neighbours of each node and stores their distances.
+
+        Args:
+            coordinates (list): List of coordinates (latitude, longitude[, altitude]).
+            k (int, optional): Number of neighbours stored for each node (default is 20).
+
+        Returns:
+            None"""
+        self.coordinates = coordinates
+        points = coordinates_to_array(coordinates)
+        self.k = max(0, min(k, len(coordinates) - 1))
+        if self.k == 0:
+            self.neighbours = np.zeros((len(coordinates), 0), dtype=np.int64)
+        else:
+            self.neighbours = k_nearest_neighbours(points, self.k)
+        self.distances = np.array(
+            [
+                haversine_distances(points[i : i + 1], points[self.neighbours[i]])[0]
+                for i in range(len(coordinates))
+            ],
+            dtype=np.int32,
+        ).reshape(len(coordinates), self.k)
+        self.__rows = [
+            dict(zip(self.neighbours[i].tolist(), self.distances[i].tolist()))
+            for i in range(len(coordinates))
+        ]
+
+    def distance(self, from_node, to_node):
+        """
+        Returns the distance between two nodes, computing it if they are not neighbours.
+
+        Args:
+            from_node (int): The origin node.
+            to_node (int): The destination node.
+
+        Returns:
+            int: The distance in meters."""
+        if from_node == to_node:
+            return 0
+        value = self.__rows[from_node].get(to_node)
+        if value is None:
+            value = int(
+                calculate_haversine_distance(
+                    self.coordinates[from_node], self.coordinates[to_node]
+                )
+            )
+        return value
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def __getitem__(self, from_node):
+        return _SparseRow(self, from_node)
+
+    def to_dict(self):
+        """
+        Returns a JSON serializable representation of the model.
+
+        Returns:
+            dict: A dictionary with the k, the neighbours and the distances of the model."""
+        return {
+            "k": self.k,
+            "neighbours": self.neighbours.tolist(),
+            "distances": self.distances.tolist(),
+        }
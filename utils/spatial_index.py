@@ -0,0 +1,247 @@
+"""
+AGPL-3.0 License
+
+Author: Francisco Javier Gañán
+
+This module contains a spatial index over geographical coordinates.
+
+The index hashes each coordinate to a cell of a regular grid (in meters), so finding
+duplicated coordinates, the nearest node or the nodes within a radius only checks
+the cells around the query instead of the whole list of addresses.
+
+Classes:
+- GridSpatialIndex: Grid hash of coordinates indexed by their position in a list.
+"""
+
+import math
+from utils.problem_definiton import calculate_haversine_distance
+
+# Meters per degree of latitude
+METERS_PER_DEGREE = 111320.0
+
+
+class GridSpatialIndex:
+    """
+    Grid hash of geographical coordinates, kept in sync with a list of addresses.
+    Each coordinate is identified by its index in the list. Only latitude and
+    longitude are indexed; the altitude is ignored.
+
+    Args:
+        cell_size (float, optional): Size of the cells of the grid in meters (default is 100).
+
+    Attributes:
+        cell_size (float): Size of the cells of the grid in meters.
+        points (dict): Coordinates (latitude, longitude) of each index.
+        cells (dict): Set of indexes in each cell.
+
+    Methods:
+        rebuild(addresses): Indexes all the coordinates of a list of addresses.
+        insert(index, coordinates): Indexes a coordinate.
+        update(index, coordinates): Moves an indexed coordinate.
+        remove(index): Removes a coordinate and shifts the indexes after it.
+        find(coordinates, tolerance=0): Finds a coordinate within a tolerance.
+        nearest(coordinates): Finds the nearest indexed coordinate.
+        within_radius(coordinates, radius): Finds the coordinates within a radius.
+    """
+
+    def __init__(self, cell_size=100):
+        """
+        Initializes an empty index.
+
+        Args:
+            cell_size (float, optional): Size of the cells of the grid in meters.
+
+        Returns:
+            None"""
+        self.cell_size = float(cell_size)
+        self.points = {}
+        self.cells = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    def __cell(self, lat, lon):
+        """
+        Returns the cell of a coordinate, using an equirectangular projection.
+
+        Args:
+            lat (float): Latitude of the coordinate.
+            lon (float): Longitude of the coordinate.
+
+        Returns:
+            tuple: The (row, column) of the cell."""
+        y = lat * METERS_PER_DEGREE
+        x = lon * METERS_PER_DEGREE * math.cos(math.radians(lat))
+        return (math.floor(y / self.cell_size), math.floor(x / self.cell_size))
+
+    def __candidates(self, lat, lon, radius):
+        """
+        Returns the indexes in the cells that can contain coordinates within a radius.
+
+        Args:
+            lat (float): Latitude of the query.
+            lon (float): Longitude of the query.
+            radius (float): Radius in meters.
+
+        Returns:
+            list: The candidate indexes."""
+        row, col = self.__cell(lat, lon)
+        # One more cell, as the projection of longitudes depends on the latitude
+        reach = int(math.ceil(radius / self.cell_size)) + 1
+        candidates = []
+        for i in range(row - reach, row + reach + 1):
+            for j in range(col - reach, col + reach + 1):
+                candidates.extend(self.cells.get((i, j), ()))
+        return candidates
+
+    def rebuild(self, addresses):
+        """
+        Indexes all the coordinates of a list of addresses.
+        Addresses that are not coordinates (e.g., names) are skipped.
+
+        Args:
+            addresses (list): The list of addresses.
+
+        Returns:
+            None"""
+        self.points = {}
+        self.cells = {}
+        for index, address in enumerate(addresses):
+            if isinstance(address, (list, tuple)):
+                self.insert(index, address)
+
+    def insert(self, index, coordinates):
+        """
+        Indexes a coordinate.
+
+        Args:
+            index (int): Index of the coordinate in the list of addresses.
+            coordinates (list): The coordinate (latitude, longitude[, altitude]).
+
+        Returns:
+            None"""
+        lat, lon = float(coordinates[0]), float(coordinates[1])
+        self.points[index] = (lat, lon)
+        self.cells.setdefault(self.__cell(lat, lon), set()).add(index)
+
+    def __discard(self, index):
+        """
+        Removes an index from its cell.
+
+        Args:
+            index (int): Index of the coordinate.
+
+        Returns:
+            tuple: The removed (latitude, longitude), or None if not indexed."""
+        point = self.points.pop(index, None)
+        if point is None:
+            return None
+        cell = self.__cell(*point)
+        self.cells[cell].discard(index)
+        if not self.cells[cell]:
+            del self.cells[cell]
+        return point
+
+    def update(self, index, coordinates):
+        """
+        Moves an indexed coordinate.
+
+        Args:
+            index (int): Index of the coordinate.
+            coordinates (list): The new coordinate.
+
+        Returns:
+            None"""
+        self.__discard(index)
+        self.insert(index, coordinates)
+
+    def remove(self, index):
+        """
+        Removes a coordinate, shifting the indexes after it as list.pop does.
+
+        Args:
+            index (int): Index of the coordinate.
+
+        Returns:
+            None"""
+        self.__discard(index)
+        shifted = [i for i in self.points if i > index]
+        for i in sorted(shifted):
+            point = self.__discard(i)
+            self.insert(i - 1, point)
+
+    def find(self, coordinates, tolerance=0):
+        """
+        Finds an indexed coordinate within a tolerance of the given one.
+
+        Args:
+            coordinates (list): The coordinate to look for.
+            tolerance (float, optional): Maximum distance in meters to be considered
+                the same coordinate (default is 0, exact match).
+
+        Returns:
+            int: The index of the closest coordinate within the tolerance, or None."""
+        lat, lon = float(coordinates[0]), float(coordinates[1])
+        best_index, best_distance = None, None
+        for index in self.__candidates(lat, lon, tolerance):
+            point = self.points[index]
+            if point == (lat, lon):
+                return index
+            distance = calculate_haversine_distance((lat, lon), point)
+            if distance <= tolerance and (
+                best_distance is None or distance < best_distance
+            ):
+                best_index, best_distance = index, distance
+        return best_index
+
+    def nearest(self, coordinates):
+        """
+        Finds the nearest indexed coordinate. The search grows ring by ring around
+        the cell of the query until no closer coordinate can be found.
+
+        Args:
+            coordinates (list): The coordinate of the query.
+
+        Returns:
+            tuple: The index and the distance in meters of the nearest coordinate,
+                or (None, None) if the index is empty."""
+        if not self.points:
+            return None, None
+        lat, lon = float(coordinates[0]), float(coordinates[1])
+        radius = self.cell_size
+        while True:
+            best_index, best_distance = None, None
+            for index in self.__candidates(lat, lon, radius):
+                distance = calculate_haversine_distance((lat, lon), self.points[index])
+                if best_distance is None or distance < best_distance:
+                    best_index, best_distance = index, distance
+            if best_distance is not None and best_distance <= radius:
+                return best_index, best_distance
+            if len(self.cells) <= (2 * int(math.ceil(radius / self.cell_size)) + 3) ** 2:
+                # Every cell may already have been checked: brute force the rest
+                return min(
+                    (
+                        (index, calculate_haversine_distance((lat, lon), point))
+                        for index, point in self.points.items()
+                    ),
+                    key=lambda item: item[1],
+                )
+            radius *= 2
+
+    def within_radius(self, coordinates, radius):
+        """
+        Finds the indexed coordinates within a radius of the given one.
+
+        Args:
+            coordinates (list): The coordinate of the query.
+            radius (float): The radius in meters.
+
+        Returns:
+            list: The indexes within the radius, sorted by distance."""
+        lat, lon = float(coordinates[0]), float(coordinates[1])
+        found = []
+        for index in self.__candidates(lat, lon, radius):
+            distance = calculate_haversine_distance((lat, lon), self.points[index])
+            if distance <= radius:
+                found.append((distance, index))
+        return [index for _, index in sorted(found)]